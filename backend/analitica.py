@@ -0,0 +1,199 @@
+# backend/analitica.py
+"""
+Motor analítico opcional con DuckDB sobre snapshots Parquet.
+
+Los tableros hacen en pandas, por sesión, agregaciones sobre las filas
+crudas. Este módulo guarda una copia columnar (Parquet) de cada tabla de
+hechos y resuelve esas agregaciones con SQL de DuckDB, vectorizado y en
+varios hilos. Hoy lo usa la página de depósitos (medias móviles de 7/30 días
+por sucursal, /analitica/depositos_diarios).
+
+Cada snapshot guarda solo los últimos ANALITICA_ANIOS años, se exporta de a
+LOTE_FILAS filas y lleva en el nombre la versión de DATA_VERSION con que se
+exportó y su primer año ('DETALLE_DEPOSITOS_DIA/v12_2024.parquet'): después
+de una carga (pages/cargas.py registra la versión de ambas tablas) la primera
+consulta exporta la tabla de nuevo. POST /analitica/refrescar lo fuerza.
+
+DuckDB es opcional (pip install duckdb). Sin él, o con ANALITICA_ACTIVA=0,
+los endpoints /analitica/* responden 503 y el resto del backend no cambia.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+from database import get_connection, close_connection, create_cursor
+from versiones_datos import registro_versiones
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+ANALITICA_DIR = Path(os.getenv('ANALITICA_DIR', Path(__file__).resolve().parent / ".cache" / "analitica"))
+ANALITICA_ACTIVA = os.getenv('ANALITICA_ACTIVA', '1') == '1'
+# Hilos de DuckDB por consulta (0 = los que DuckDB elija según los núcleos)
+ANALITICA_HILOS = int(os.getenv('ANALITICA_HILOS', '0'))
+# Tablas sin versión en DATA_VERSION: el snapshot se renueva pasado este tiempo
+TTL_SIN_VERSION_SEG = int(os.getenv('ANALITICA_TTL_SIN_VERSION_SEG', '3600'))
+# Años que guarda cada snapshot: el actual y los ANALITICA_ANIOS - 1 anteriores
+ANALITICA_ANIOS = int(os.getenv('ANALITICA_ANIOS', '3'))
+# Filas que se leen de MySQL y se escriben al Parquet por vez
+LOTE_FILAS = int(os.getenv('ANALITICA_LOTE_FILAS', '50000'))
+
+# Tablas con snapshot: consulta de exportación (desde una fecha) y columnas (nombre, tipo Parquet)
+TABLAS = {
+    "DETALLE_DEPOSITOS_DIA": {
+        "consulta": "SELECT date, branch_office_id, deposito FROM DETALLE_DEPOSITOS_DIA WHERE date >= %s",
+        "columnas": [("date", "date32"), ("branch_office_id", "int64"), ("deposito", "float64")],
+    },
+    "DETALLE_RECAUDACION_DIA": {
+        "consulta": "SELECT date, branch_office_id, recaudacion FROM DETALLE_RECAUDACION_DIA WHERE date >= %s",
+        "columnas": [("date", "date32"), ("branch_office_id", "int64"), ("recaudacion", "float64")],
+    },
+}
+
+
+class MotorNoDisponible(Exception):
+    pass
+
+
+def primer_anio():
+    """Primer año que contienen los snapshots."""
+    return date.today().year - ANALITICA_ANIOS + 1
+
+
+def disponible():
+    return duckdb is not None and ANALITICA_ACTIVA
+
+
+class SnapshotsParquet:
+    """Copias Parquet de las tablas de TABLAS, una por versión de datos."""
+
+    def __init__(self, directorio=ANALITICA_DIR):
+        self.directorio = Path(directorio)
+        self._locks = {tabla: threading.Lock() for tabla in TABLAS}
+
+    def _version(self, tabla):
+        version = registro_versiones.versiones().get(tabla)
+        # Sin versión: una ventana de tiempo hace las veces de versión
+        version = f"v{version}" if version is not None else f"t{int(time.time() // TTL_SIN_VERSION_SEG)}"
+        return f"{version}_{primer_anio()}"
+
+    def _exportar(self, tabla, destino):
+        """
+        Escribe el snapshot de 'tabla' desde el 1 de enero de primer_anio(),
+        de a LOTE_FILAS filas: nunca se tiene la tabla completa en memoria.
+        """
+        columnas = TABLAS[tabla]["columnas"]
+        esquema = pa.schema([(nombre, getattr(pa, tipo)()) for nombre, tipo in columnas])
+        nombres = [nombre for nombre, _ in columnas]
+        # Los SUM de MySQL llegan como Decimal: en Parquet van como double
+        decimales = [nombre for nombre, tipo in columnas if tipo == "float64"]
+        temporal = destino.with_suffix(".tmp")
+        filas = 0
+        cnx = get_connection('default')
+        if not cnx:
+            raise RuntimeError("Error de conexión a la base de datos")
+        try:
+            cursor = create_cursor(cnx)
+            cursor.execute(TABLAS[tabla]["consulta"], (date(primer_anio(), 1, 1),))
+            with pq.ParquetWriter(temporal, esquema) as escritor:
+                while True:
+                    lote = cursor.fetchmany(LOTE_FILAS)
+                    if not lote:
+                        break
+                    df = pd.DataFrame(lote, columns=nombres)
+                    df[decimales] = df[decimales].astype(float)
+                    escritor.write_table(pa.Table.from_pandas(df, schema=esquema, preserve_index=False))
+                    filas += len(df)
+        except Exception:
+            temporal.unlink(missing_ok=True)
+            raise
+        finally:
+            close_connection(cnx)
+        os.replace(temporal, destino)
+        logger.info(f"Snapshot {tabla} exportado: {filas} filas desde {primer_anio()} -> {destino.name}")
+
+    def ruta(self, tabla, forzar=False):
+        """Ruta del snapshot vigente de 'tabla', exportándolo si no existe."""
+        carpeta = self.directorio / tabla
+        destino = carpeta / f"{self._version(tabla)}.parquet"
+        with self._locks[tabla]:
+            if forzar or not destino.exists():
+                carpeta.mkdir(parents=True, exist_ok=True)
+                self._exportar(tabla, destino)
+                for viejo in carpeta.glob("*.parquet"):
+                    if viejo != destino:
+                        viejo.unlink(missing_ok=True)
+        return destino
+
+    def refrescar(self):
+        return {tabla: self.ruta(tabla, forzar=True).name for tabla in TABLAS}
+
+
+snapshots = SnapshotsParquet()
+
+
+def _sql_parquet(ruta):
+    return "read_parquet('" + str(ruta).replace("'", "''") + "')"
+
+
+def consultar(sql, tablas, params=None):
+    """
+    Ejecuta 'sql' en DuckDB reemplazando {TABLA} por el snapshot de cada
+    tabla. Retorna {"columns", "data"} como los endpoints de main.py.
+    """
+    if not disponible():
+        raise MotorNoDisponible("Motor analítico no disponible (instale duckdb o revise ANALITICA_ACTIVA)")
+    fuentes = {tabla: _sql_parquet(snapshots.ruta(tabla)) for tabla in tablas}
+    con = duckdb.connect()
+    try:
+        if ANALITICA_HILOS:
+            con.execute(f"SET threads TO {ANALITICA_HILOS}")
+        resultado = con.execute(sql.format(**fuentes), params or [])
+        columnas = [d[0] for d in resultado.description]
+        return {"columns": columnas, "data": resultado.fetchall()}
+    finally:
+        con.close()
+
+
+# --- Consultas ---
+
+DEPOSITOS_DIARIOS_SQL = """
+    WITH diario AS (
+        SELECT r.date, r.branch_office_id,
+               r.recaudacion AS recaudado,
+               COALESCE(d.deposito, 0) AS depositado,
+               r.recaudacion - COALESCE(d.deposito, 0) AS diferencia
+        FROM {DETALLE_RECAUDACION_DIA} r
+        LEFT JOIN {DETALLE_DEPOSITOS_DIA} d USING (date, branch_office_id)
+        WHERE year(r.date) = ? AND list_contains(?, r.branch_office_id)
+    )
+    SELECT *,
+        CASE WHEN recaudado > 0 THEN depositado / recaudado ELSE 0 END AS ratio_deposito,
+        avg(recaudado) OVER w7 AS recaudado_ma7,
+        avg(recaudado) OVER w30 AS recaudado_ma30,
+        avg(depositado) OVER w7 AS depositado_ma7,
+        avg(depositado) OVER w30 AS depositado_ma30,
+        avg(diferencia) OVER w7 AS diferencia_ma7,
+        avg(diferencia) OVER w30 AS diferencia_ma30
+    FROM diario
+    WINDOW
+        w7 AS (PARTITION BY branch_office_id ORDER BY date ROWS BETWEEN 6 PRECEDING AND CURRENT ROW),
+        w30 AS (PARTITION BY branch_office_id ORDER BY date ROWS BETWEEN 29 PRECEDING AND CURRENT ROW)
+    ORDER BY branch_office_id, date
+"""
+
+
+def depositos_diarios(year, sucursales):
+    return consultar(DEPOSITOS_DIARIOS_SQL, ["DETALLE_RECAUDACION_DIA", "DETALLE_DEPOSITOS_DIA"], [year, sucursales])
+
@@ -0,0 +1,105 @@
+# backend/cache_usuarios.py
+"""
+Caché por usuario de los endpoints de usuarios y sucursales.
+
+/api/usuarios/{usuario}, /api/usuarios/{usuario}/sucursales y
+/users/profile/{rut} consultaban la base de datos en cada llamada. Aquí la
+respuesta de cada (endpoint, rut) se guarda en memoria hasta que:
+
+- vence su TTL (USUARIOS_CACHE_TTL_SEG, 300 s por defecto), o
+- se invalida explícitamente con invalidar() (POST /api/usuarios/cache/invalidar).
+
+Hoy ningún proceso registra versiones de TABLAS_USUARIOS en DATA_VERSION
+(users y branch_offices se editan fuera de esta aplicación), así que un cambio
+puede tardar hasta el TTL en verse si no se invalida. La versión se compara
+igual: si una carga llega a registrarla con registrar_version_datos, las
+respuestas se invalidan de inmediato sin cambiar este módulo.
+
+Las consultas que no encuentran al usuario (404) no se guardan.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from versiones_datos import registro_versiones
+
+# Segundos que se reutiliza la respuesta de un usuario
+TTL_SEGUNDOS = float(os.getenv('USUARIOS_CACHE_TTL_SEG', '300'))
+
+# Respuestas que se guardan en memoria como máximo (entre todos los usuarios)
+MAX_ENTRADAS = int(os.getenv('USUARIOS_CACHE_MAX', '1024'))
+
+# Tablas cuyo cambio invalida todas las respuestas
+TABLAS_USUARIOS = ("users", "rols", "branch_offices", "QRY_BRANCH_OFFICES")
+
+
+def version_usuarios(versiones):
+    """Versiones de TABLAS_USUARIOS (None en las que no están registradas)."""
+    return tuple(versiones.get(tabla) for tabla in TABLAS_USUARIOS)
+
+
+class CacheUsuarios:
+    """LRU de respuestas por (endpoint, rut) con vencimiento y versión de las tablas."""
+
+    def __init__(self, ttl=TTL_SEGUNDOS, max_entradas=MAX_ENTRADAS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._respuestas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, version):
+        with self._lock:
+            entrada = self._respuestas.get(clave)
+            if entrada is None:
+                return None
+            guardado, version_guardada, respuesta = entrada
+            if version_guardada != version or time.monotonic() - guardado > self.ttl:
+                del self._respuestas[clave]
+                return None
+            self._respuestas.move_to_end(clave)
+            return respuesta
+
+    def guardar(self, clave, version, respuesta):
+        with self._lock:
+            self._respuestas[clave] = (time.monotonic(), version, respuesta)
+            self._respuestas.move_to_end(clave)
+            while len(self._respuestas) > self.max_entradas:
+                self._respuestas.popitem(last=False)
+
+    def invalidar(self, rut=None):
+        """Elimina las respuestas de 'rut' (todas si es None); devuelve cuántas eliminó."""
+        with self._lock:
+            claves = [c for c in self._respuestas if rut is None or c[1] == rut]
+            for clave in claves:
+                del self._respuestas[clave]
+            return len(claves)
+
+
+cache_usuarios = CacheUsuarios()
+
+
+def cache_por_usuario(path):
+    """
+    Guarda la respuesta del endpoint 'path' por rut (primer argumento de la
+    función) con las reglas de CacheUsuarios.
+    """
+    def decorador(funcion):
+        firma = inspect.signature(funcion)
+        parametro_rut = next(iter(firma.parameters))
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            # FastAPI pasa los parámetros por nombre ('usuario' o 'rut' según la ruta)
+            rut = firma.bind(*args, **kwargs).arguments[parametro_rut]
+            clave = (path, rut)
+            version = version_usuarios(registro_versiones.versiones())
+            respuesta = cache_usuarios.obtener(clave, version)
+            if respuesta is None:
+                respuesta = funcion(*args, **kwargs)
+                cache_usuarios.guardar(clave, version, respuesta)
+            return respuesta
+        return envoltura
+    return decorador
@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector import Error
+from metricas import CursorMedido
 
 # Cargar las variables de entorno desde el archivo .env en la misma ruta
 load_dotenv()
@@ -37,10 +38,10 @@ def close_connection(cnx):
         print(f"Error al cerrar la conexión: {err}")
 
 def create_cursor(cnx):
-    """Crea un cursor para una conexión a la base de datos."""
+    """Crea un cursor para una conexión a la base de datos (medido, ver metricas.py)."""
     try:
         cursor = cnx.cursor(dictionary=True)
-        return cursor
+        return CursorMedido(cursor)
     except Error as err:
         print(f"Error al crear el cursor: {err}")
         return None
@@ -1,14 +1,36 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException, Depends, status, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from database import get_connection, close_connection, create_cursor
+from proyeccion import MODELOS
+from proyeccion_worker import ModelosNoDisponibles, servicio_proyeccion
+from sesion import crear_token, usuario_actual, es_administrador, verificar_token
+import analitica
+from metricas import MetricasMiddleware, exponer as exponer_metricas
+from versiones_datos import TABLAS_POR_ENDPOINT, cache_por_version, etag_endpoint, registro_versiones, version_endpoint
+from cache_usuarios import cache_por_usuario, cache_usuarios
+from resumen_indicadores import (
+    INDICADORES, SERIES_POR_DEFECTO, VENTANAS_ACUMULADO, serie_acumulada, serie_mensual, series as resumen_series,
+    ultimos_valores
+)
 import bcrypt
 from datetime import datetime, date, timedelta
 from typing import List, Optional
 import sys
 import logging
 from pathlib import Path
+from urllib.parse import urlencode
+import os
+
+try:
+    # Opcional: pip install brotli-asgi
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # Añadir el directorio raíz del proyecto al PYTHONPATH
 sys.path.append(str(Path(__file__).parent))
@@ -19,23 +41,209 @@ security = HTTPBasic()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Respuestas sobre este tamaño (bytes) se comprimen con brotli o gzip
+COMPRESION_MINIMA = int(os.getenv('COMPRESION_MINIMA_BYTES', '1024'))
+
+
+def _token_valido(authorization):
+    """True si el encabezado Authorization trae un token Bearer firmado y vigente."""
+    esquema, _, token = authorization.partition(" ")
+    return esquema.lower() == "bearer" and verificar_token(token.strip()) is not None
+
+
+@app.middleware("http")
+async def etag_por_version(request: Request, call_next):
+    """
+    ETag de los endpoints de datos a partir de las versiones de DATA_VERSION.
+    Si el cliente ya tiene la versión vigente (If-None-Match) y su token es
+    válido, responde 304 sin ejecutar la consulta; sin token válido la request
+    pasa por el endpoint (y su autenticación) antes de responder 304.
+    """
+    if request.method != "GET" or request.url.path not in TABLAS_POR_ENDPOINT:
+        return await call_next(request)
+
+    versiones = await run_in_threadpool(registro_versiones.versiones)
+    etag = etag_endpoint(
+        request.url.path,
+        urlencode(sorted(request.query_params.multi_items())),
+        request.headers.get("authorization", ""),
+        versiones
+    )
+    if etag is None:
+        return await call_next(request)
+
+    vigente = etag in [e.strip() for e in request.headers.get("if-none-match", "").split(",")]
+    # Sin sesión válida no se responde 304 sin pasar por el endpoint: él decide si exige token (401)
+    if vigente and _token_valido(request.headers.get("authorization", "")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        if vigente:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+    return response
+
+
+# La compresión se registra después del ETag para envolverlo
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESION_MINIMA, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESION_MINIMA)
+
+# Último en registrarse = el más externo: mide la request completa y los bytes ya comprimidos
+app.add_middleware(MetricasMiddleware)
+
 class UserLogin(BaseModel):
     rut: str
     password: str
 
+
+# Respuestas de los endpoints de usuarios: solo los campos que usa el frontend (nunca hashed_password)
+class UsuarioResumen(BaseModel):
+    rut: str
+    full_name: Optional[str] = None
+
+
+class UsuarioPerfil(UsuarioResumen):
+    role: Optional[str] = None
+
+
+class SucursalAcceso(BaseModel):
+    branch_office_id: int
+    branch_office: Optional[str] = None
+
+
+class SucursalUsuario(SucursalAcceso):
+    rut: str
+    full_name: Optional[str] = None
+
+
+class PerfilUsuario(BaseModel):
+    user_info: UsuarioPerfil
+    accessible_branches: List[SucursalAcceso]
+
+
+def _sucursales_accesibles(cursor, rut, role):
+    """
+    Sucursales a las que tiene acceso el usuario: todas las activas si es
+    administrador, o las que supervisa en otro caso.
+    """
+    # Normalizamos el rol a minúsculas y sin espacios para una comparación segura.
+    # Esto evita errores si en la DB está guardado como " Administrador "
+    user_role_cleaned = (role or '').strip().lower()
+
+    if user_role_cleaned == 'administrador':
+        # Si el rol es administrador, obtenemos TODAS las sucursales activas.
+        sucursales_query = """
+            SELECT id as branch_office_id, branch_office 
+            FROM QRY_BRANCH_OFFICES 
+            WHERE status_id = 7
+        """
+        cursor.execute(sucursales_query)
+    else:
+        # Para cualquier otro rol (Supervisor, Usuario de Oficina), obtenemos solo las sucursales asignadas.
+        sucursales_query = """
+            SELECT id as branch_office_id, branch_office 
+            FROM branch_offices 
+            WHERE principal_supervisor = %s AND status_id = 7
+        """
+        cursor.execute(sucursales_query, (rut,))
+    return cursor.fetchall()
+
+
+def _filtro_sucursales(sesion, columna='branch_office_id'):
+    """
+    Condición SQL (y sus parámetros) que limita 'columna' a las sucursales del
+    usuario de la sesión, con la misma regla de _sucursales_accesibles. Se
+    aplica en la consulta para que cada usuario reciba solo sus filas.
+    """
+    if es_administrador(sesion):
+        return f"{columna} IN (SELECT id FROM QRY_BRANCH_OFFICES WHERE status_id = 7)", ()
+    return (
+        f"{columna} IN (SELECT id FROM branch_offices WHERE principal_supervisor = %s AND status_id = 7)",
+        (sesion['rut'],)
+    )
+
+
+def _filtro_sucursales_nombre(sesion, columna='Sucursal'):
+    """
+    Como _filtro_sucursales, para tablas que guardan el nombre de la sucursal
+    (asistencia e inasistencias, cargadas desde Excel). El administrador ve
+    todas las filas, también las de áreas que no son sucursales.
+    """
+    if es_administrador(sesion):
+        return "TRUE", ()
+    return (
+        f"{columna} IN (SELECT branch_office FROM branch_offices WHERE principal_supervisor = %s AND status_id = 7)",
+        (sesion['rut'],)
+    )
+
+
+def _nombres_sucursales(sesion):
+    """Nombres de las sucursales del usuario de la sesión (la proyección indexa por nombre)."""
+    cnx = get_connection('default')
+    if not cnx:
+        raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        cursor = create_cursor(cnx)
+        return {s['branch_office'] for s in _sucursales_accesibles(cursor, sesion['rut'], sesion.get('role'))}
+    finally:
+        close_connection(cnx)
+
+
+def _verificar_sucursal(sesion, sucursal):
+    """403 si 'sucursal' (por nombre) no es una de las del usuario de la sesión; el administrador ve todas."""
+    if not es_administrador(sesion) and sucursal not in _nombres_sucursales(sesion):
+        raise HTTPException(status_code=403, detail="Sin acceso a la sucursal pedida")
+
+
+def _filtro_periodo(year=None, month=None, columna='date'):
+    """
+    Condición SQL (y sus parámetros) del año pedido, o del año en curso, y
+    opcionalmente de un mes: el caché de particiones del frontend descarga un
+    mes a la vez (ver GET /particiones).
+    """
+    condicion, params = f"YEAR({columna}) = COALESCE(%s, YEAR(CURDATE()))", [year]
+    if month:
+        condicion += f" AND MONTH({columna}) = %s"
+        params.append(month)
+    return condicion, tuple(params)
+
+
 @app.post("/login")
 def login(user: UserLogin):
+    """
+    Verifica la clave y entrega un token de sesión firmado con el nombre, rol
+    y sucursales del usuario. Las páginas usan el token en vez de volver a
+    consultar al usuario en cada ejecución.
+    """
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
-            query = "SELECT rut, full_name, hashed_password FROM users WHERE rut = %s"
+            query = """
+            SELECT a.rut, a.full_name, a.hashed_password, b.rol AS role
+            FROM users a
+            LEFT JOIN rols b ON a.rol_id = b.id
+            WHERE a.rut = %s
+            """
             cursor.execute(query, (user.rut,))
             result = cursor.fetchone()
             if result:
                 hashed_password = result['hashed_password']
                 if bcrypt.checkpw(user.password.encode('utf-8'), hashed_password.encode('utf-8')):
-                    return {"message": "Login successful", "user": result}
+                    sucursales = _sucursales_accesibles(cursor, result['rut'], result['role'])
+                    branch_ids = [int(s['branch_office_id']) for s in sucursales]
+                    token, exp = crear_token(result['rut'], result['full_name'], result['role'], branch_ids)
+                    user_info = {
+                        "rut": result['rut'],
+                        "full_name": result['full_name'],
+                        "role": result['role'],
+                        "branch_ids": branch_ids,
+                        "sucursales": [s['branch_office'] for s in sucursales]
+                    }
+                    return {"message": "Login successful", "user": user_info, "token": token, "expires_at": exp}
                 else:
                     raise HTTPException(status_code=401, detail="Invalid credentials")
             else:
@@ -44,10 +252,41 @@ def login(user: UserLogin):
             close_connection(cnx)
     else:
         raise HTTPException(status_code=500, detail="Database connection error")
+
+
+@app.get("/sesion")
+def get_sesion(sesion: dict = Depends(usuario_actual)):
+    """Datos de la sesión del token, sin consultar la base de datos."""
+    return sesion
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Métricas de requests y consultas en formato de Prometheus."""
+    return PlainTextResponse(exponer_metricas(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/versions")
+def get_versions():
+    """
+    Versión de cada tabla cargada por el ETL y, por endpoint, la versión de
+    sus datos (None si alguna de sus tablas aún no tiene versión). El frontend
+    la usa como clave de sus cachés.
+    """
+    filas = registro_versiones.filas()
+    versiones = {tabla: fila['version'] for tabla, fila in filas.items()}
+    return {
+        "tablas": {
+            tabla: {"version": fila['version'], "loaded_at": fila['loaded_at']}
+            for tabla, fila in filas.items()
+        },
+        "endpoints": {path: version_endpoint(path, versiones) for path in TABLAS_POR_ENDPOINT}
+    }
     
 # En backend/main.py, añade este nuevo endpoint
 
-@app.get("/users/profile/{rut}")
+@app.get("/users/profile/{rut}", response_model=PerfilUsuario)
+@cache_por_usuario("/users/profile")
 def get_user_profile(rut: str):
     """
     Obtiene el perfil completo de un usuario, incluyendo su rol
@@ -76,59 +315,35 @@ def get_user_profile(rut: str):
         if not user_data:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-        # --- INICIO DE LA CORRECCIÓN CLAVE ---
-        
         # 2. Obtener las sucursales asociadas
-        # Normalizamos el rol a minúsculas y sin espacios para una comparación segura.
-        # Esto evita errores si en la DB está guardado como " Administrador "
-        user_role_cleaned = user_data.get('role', '').strip().lower()
-
-        if user_role_cleaned == 'administrador':
-            # Si el rol es administrador, obtenemos TODAS las sucursales activas.
-            sucursales_query = """
-                SELECT id as branch_office_id, branch_office 
-                FROM QRY_BRANCH_OFFICES 
-                WHERE status_id = 7
-            """
-            cursor.execute(sucursales_query)
-        else:
-            # Para cualquier otro rol (Supervisor, Usuario de Oficina), obtenemos solo las sucursales asignadas.
-            sucursales_query = """
-                SELECT id as branch_office_id, branch_office 
-                FROM branch_offices 
-                WHERE principal_supervisor = %s AND status_id = 7
-            """
-            cursor.execute(sucursales_query, (rut,))
-            
-        # --- FIN DE LA CORRECCIÓN CLAVE ---
-
-        sucursales_data = cursor.fetchall()
+        sucursales_data = _sucursales_accesibles(cursor, rut, user_data.get('role'))
         
         # Construimos el objeto de perfil completo
-        profile = {
-            "user_info": user_data,
-            "accessible_branches": sucursales_data
-        }
-        
-        return profile
+        return PerfilUsuario(
+            user_info=UsuarioPerfil(**user_data),
+            accessible_branches=[SucursalAcceso(**s) for s in sucursales_data]
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor en get_user_profile: {e}")
     finally:
         if cnx:
             close_connection(cnx)
     
-@app.get("/api/usuarios/{usuario}")
+@app.get("/api/usuarios/{usuario}", response_model=UsuarioResumen)
+@cache_por_usuario("/api/usuarios")
 def get_usuario(usuario: str):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
-            query = "SELECT rut, full_name, hashed_password FROM users WHERE rut = %s"
+            query = "SELECT rut, full_name FROM users WHERE rut = %s"
             cursor.execute(query, (usuario,))
             result = cursor.fetchone()
             if result:
-                return result
+                return UsuarioResumen(**result)
             else:
                 raise HTTPException(status_code=404, detail="Usuario no encontrado")
         finally:
@@ -137,7 +352,8 @@ def get_usuario(usuario: str):
         raise HTTPException(status_code=500, detail="Database connection error")
 
 
-@app.get("/api/usuarios/{usuario}/sucursales")
+@app.get("/api/usuarios/{usuario}/sucursales", response_model=List[SucursalUsuario])
+@cache_por_usuario("/api/usuarios/sucursales")
 def get_usuario_sucursales(usuario: str, credentials: HTTPBasicCredentials = Depends(security)):
     cnx = get_connection('default')
     if not cnx:
@@ -149,7 +365,6 @@ def get_usuario_sucursales(usuario: str, credentials: HTTPBasicCredentials = Dep
             SELECT 
             users.rut,
             users.full_name,
-            users.hashed_password,
             branch_offices.branch_office,
             branch_offices.id as branch_office_id
             FROM users
@@ -163,16 +378,29 @@ def get_usuario_sucursales(usuario: str, credentials: HTTPBasicCredentials = Dep
         if not result:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-        return result
+        return [SucursalUsuario(**row) for row in result]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
     finally:
         close_connection(cnx)
 
+
+@app.post("/api/usuarios/cache/invalidar")
+def invalidar_cache_usuarios(rut: Optional[str] = None, sesion: dict = Depends(usuario_actual)):
+    """
+    Descarta las respuestas guardadas de un usuario (o de todos, sin 'rut')
+    después de editar users o branch_offices fuera del ETL. Solo administradores.
+    """
+    if not es_administrador(sesion):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede invalidar la caché")
+    return {"invalidadas": cache_usuarios.invalidar(rut)}
+
 @app.get("/sucursales")
-def get_datos():
+def get_datos(sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -192,9 +420,10 @@ def get_datos():
                 FROM
                     QRY_BRANCH_OFFICES
                 WHERE
-                    status_id = 7
+                    status_id = 7 AND {filtro}
             """
-            cursor.execute(query)
+            filtro, params = _filtro_sucursales(sesion, 'id')
+            cursor.execute(query.format(filtro=filtro), params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -205,7 +434,12 @@ def get_datos():
 
 
 @app.get("/sucursales_rut")
-def get_sucursales_by_rut(rut: str = Query(..., description="RUT del usuario para filtrar sucursales")):
+def get_sucursales_by_rut(
+    rut: str = Query(..., description="RUT del usuario para filtrar sucursales"),
+    sesion: dict = Depends(usuario_actual)
+):
+    if not es_administrador(sesion) and rut != sesion['rut']:
+        raise HTTPException(status_code=403, detail="Sin acceso a las sucursales de otro usuario")
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -281,177 +515,107 @@ def get_periodos():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 
-@app.get("/uf")
-def get_uf():
+def _serie_indicador(indicador, year=None):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
-            query = """
-            SELECT
-            CONCAT(YEAR(uf.fecha),"-",IF(MONTH(uf.fecha) < 10, CONCAT('0', MONTH(uf.fecha)), MONTH(uf.fecha))) as periodo,
-            ROUND(uf.valor) as valor
-            FROM DM_uf AS uf
-            INNER JOIN
-                (SELECT
-                    MAX(fecha) AS fecha
-                    FROM DM_uf
-                    GROUP BY
-                        YEAR(fecha), 
-                        MONTH(fecha)
-                ) AS max_dates
-                ON uf.fecha = max_dates.fecha
-            WHERE YEAR(uf.fecha) = 2025
-            ORDER BY
-                CONCAT(YEAR(uf.fecha),"-",MONTH(uf.fecha)) ASC;
-            """
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
+            return serie_mensual(cursor, indicador, year)
         finally:
             close_connection(cnx)
     else:
         raise HTTPException(status_code=500, detail="Database connection error")
 
-    
-    
+
+@app.get("/uf")
+@cache_por_version("/uf")
+def get_uf(year: Optional[int] = None):
+    """UF del último día de cada mes del año pedido (el actual por defecto)."""
+    return _serie_indicador("uf", year)
+
+
 @app.get("/dolar")
-def get_dolar():
-    cnx = get_connection('default')  # Usa la configuración 'default'
-    if cnx:
-        try:
-            cursor = create_cursor(cnx)
-            query = """ 
-            SELECT
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0')) AS periodo,
-                ROUND(AVG(valor)) AS valor
-            FROM (
-                SELECT
-                    fecha,
-                    valor
-                FROM
-                    DM_dolar
-                WHERE
-                    YEAR(fecha) = 2025
-            ) AS subquery
-            GROUP BY
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0'))
-            ORDER BY
-                periodo ASC;"""
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
-        finally:
-            close_connection(cnx)
-    else:
-        raise HTTPException(status_code=500, detail="Database connection error")
-    
+@cache_por_version("/dolar")
+def get_dolar(year: Optional[int] = None):
+    """Dólar observado promedio de cada mes del año pedido (el actual por defecto)."""
+    return _serie_indicador("dolar", year)
+
+
 @app.get("/euro")
-def get_euro():
-    cnx = get_connection('default')  # Usa la configuración 'default'
-    if cnx:
-        try:
-            cursor = create_cursor(cnx)
-            query = """
-            SELECT
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0')) AS periodo,
-                ROUND(AVG(valor)) AS valor
-            FROM (
-                SELECT
-                    fecha,
-                    valor
-                FROM
-                    DM_euro
-                WHERE
-                    YEAR(fecha) = 2025
-            ) AS subquery
-            GROUP BY
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0'))
-            ORDER BY
-                periodo ASC;
-            """
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
-        finally:
-            close_connection(cnx)
-    else:
-        raise HTTPException(status_code=500, detail="Database connection error")
+@cache_por_version("/euro")
+def get_euro(year: Optional[int] = None):
+    """Euro promedio de cada mes del año pedido (el actual por defecto)."""
+    return _serie_indicador("euro", year)
     
 
 @app.get("/ipc")
-def get_ipc():
+@cache_por_version("/ipc")
+def get_ipc(year: Optional[int] = None, ventana: str = "anual"):
+    """
+    IPC de cada mes del año pedido (el actual por defecto) y su acumulado:
+    del año ('anual') o de los últimos 12 meses ('12m').
+    """
+    if ventana not in VENTANAS_ACUMULADO:
+        raise HTTPException(status_code=400, detail=f"Ventana desconocida: {ventana} (use {', '.join(VENTANAS_ACUMULADO)})")
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
-            query = """
-            SELECT
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0')) AS periodo,
-                ROUND(valor, 2) AS valor,
-                ROUND(@running_total := @running_total + valor, 2) AS acumulado
-            FROM
-                (SELECT
-                    fecha,
-                    valor
-                FROM DM_ipc
-                WHERE YEAR(fecha) = 2025
-                ORDER BY fecha ASC
-                ) AS subquery,
-                (SELECT @running_total := 0) AS r
-            ORDER BY fecha ASC;
-            """
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
+            return serie_acumulada(cursor, "ipc", year, ventana)
         finally:
             close_connection(cnx)
     else:
         raise HTTPException(status_code=500, detail="Database connection error")
     
+
 @app.get("/tasa_desempleo")
-def get_tasa_desempleo():
-    cnx = get_connection('default')  # Usa la configuración 'default'
-    if cnx:
-        try:
-            cursor = create_cursor(cnx)
-            query = """
-            SELECT
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0')) AS periodo, 
-                ROUND(valor, 2) AS valor
-            FROM DM_tasa_desempleo
-            WHERE YEAR(fecha) = 2025;
-            """
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
-        finally:
-            close_connection(cnx)
-    else:
-        raise HTTPException(status_code=500, detail="Database connection error")
-    
+@cache_por_version("/tasa_desempleo")
+def get_tasa_desempleo(year: Optional[int] = None):
+    """Tasa de desempleo de cada mes del año pedido (el actual por defecto)."""
+    return _serie_indicador("tasa_desempleo", year)
+
+
 @app.get("/imacec")
-def get_imacec():
+@cache_por_version("/imacec")
+def get_imacec(year: Optional[int] = None):
+    """IMACEC de cada mes del año pedido (el actual por defecto)."""
+    return _serie_indicador("imacec", year)
+
+
+def _mes_parametro(valor, nombre):
+    try:
+        year, month = (int(parte) for parte in valor.split("-"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{nombre}' debe tener la forma AAAA-MM: {valor}")
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail=f"Mes fuera de rango en '{nombre}': {valor}")
+    return year, month
+
+
+@app.get("/indicadores")
+@cache_por_version("/indicadores")
+def get_indicadores(series: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None):
+    """
+    Series mensuales de varios indicadores en una respuesta, para la página de
+    indicadores. 'series' es una lista separada por comas (por defecto
+    SERIES_POR_DEFECTO) y 'desde'/'hasta' meses AAAA-MM (por defecto el año
+    en curso). Incluye en 'ultimos' el último valor diario de cada indicador.
+    """
+    indicadores = [i.strip() for i in series.split(",") if i.strip()] if series else list(SERIES_POR_DEFECTO)
+    desconocidos = [i for i in indicadores if i not in INDICADORES]
+    if desconocidos or not indicadores:
+        raise HTTPException(status_code=400, detail=f"Indicadores desconocidos: {desconocidos}")
+    year = date.today().year
+    inicio = _mes_parametro(desde, "desde") if desde else (year, 1)
+    fin = _mes_parametro(hasta, "hasta") if hasta else (year, 12)
+
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
-            query = """
-            SELECT
-                CONCAT(YEAR(fecha), "-", LPAD(MONTH(fecha), 2, '0')) AS periodo, 
-                ROUND(valor, 2) AS valor
-            FROM DM_imacec
-            WHERE YEAR(fecha) = 2025;
-            """
-            cursor.execute(query)
-            resultados = cursor.fetchall()
-            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
-            return {"columns": columnas, "data": resultados}
+            respuesta = resumen_series(cursor, indicadores, inicio, fin)
+            respuesta["ultimos"] = ultimos_valores(cursor)
+            return respuesta
         finally:
             close_connection(cnx)
     else:
@@ -489,7 +653,8 @@ def get_anac():
         raise HTTPException(status_code=500, detail="Database connection error")
     
 @app.get("/abonados")
-def get_abonados():
+@cache_por_version("/abonados")
+def get_abonados(year: Optional[int] = None, month: Optional[int] = None, sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -497,9 +662,11 @@ def get_abonados():
             query = """
             SELECT *
             FROM CABECERA_ABONADOS
-            WHERE YEAR(date) = YEAR(CURDATE())
+            WHERE {periodo} AND {filtro}
             """
-            cursor.execute(query)
+            periodo, params_periodo = _filtro_periodo(year, month)
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(periodo=periodo, filtro=filtro), params_periodo + params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -509,7 +676,8 @@ def get_abonados():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 @app.get("/depositos")
-def get_depositos():
+@cache_por_version("/depositos")
+def get_depositos(year: Optional[int] = None, month: Optional[int] = None, sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -517,9 +685,11 @@ def get_depositos():
             query = """
             SELECT *
             FROM DETALLE_DEPOSITOS_DIA
-            WHERE YEAR(date) = YEAR(CURDATE())
+            WHERE {periodo} AND {filtro}
             """
-            cursor.execute(query)
+            periodo, params_periodo = _filtro_periodo(year, month)
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(periodo=periodo, filtro=filtro), params_periodo + params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -529,7 +699,8 @@ def get_depositos():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 @app.get("/recaudacion")
-def get_recaudacion():
+@cache_por_version("/recaudacion")
+def get_recaudacion(year: Optional[int] = None, month: Optional[int] = None, sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -537,9 +708,11 @@ def get_recaudacion():
             query = """
             SELECT *
             FROM DETALLE_RECAUDACION_DIA
-            WHERE YEAR(date) = YEAR(CURDATE())
+            WHERE {periodo} AND {filtro}
             """
-            cursor.execute(query)
+            periodo, params_periodo = _filtro_periodo(year, month)
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(periodo=periodo, filtro=filtro), params_periodo + params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -549,16 +722,18 @@ def get_recaudacion():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 @app.get("/venta_hora")
-def get_recaudacion():
+@cache_por_version("/venta_hora")
+def get_recaudacion(sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
             query = """
             SELECT * FROM DETALLE_VENTA_HORA
-            WHERE YEAR(date) = YEAR(CURDATE()) and MONTH(date) = MONTH(CURDATE())
+            WHERE YEAR(date) = YEAR(CURDATE()) and MONTH(date) = MONTH(CURDATE()) AND {filtro}
             """
-            cursor.execute(query)
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(filtro=filtro), params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -568,7 +743,8 @@ def get_recaudacion():
         raise HTTPException(status_code=500, detail="Database connection error")
     
 @app.get("/ingresos_acum_dia")
-def get_ingresos_acum_dia():
+@cache_por_version("/ingresos_acum_dia")
+def get_ingresos_acum_dia(year: Optional[int] = None, month: Optional[int] = None, sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
@@ -598,9 +774,14 @@ def get_ingresos_acum_dia():
                 KPI_INGRESOS_IMG_MES
             WHERE
                 periodo = 'Acumulado' AND
-                metrica = 'ingresos';
+                metrica = 'ingresos' AND
+                {periodo} AND
+                {filtro};
             """
-            cursor.execute(query)
+            # Sin año se entregan todos los años (las páginas comparan contra el anterior)
+            periodo, params_periodo = _filtro_periodo(year, month, 'KPI_INGRESOS_IMG_MES.date') if year else ("TRUE", ())
+            filtro, params = _filtro_sucursales(sesion, 'KPI_INGRESOS_IMG_MES.branch_office_id')
+            cursor.execute(query.format(periodo=periodo, filtro=filtro), params_periodo + params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -610,17 +791,84 @@ def get_ingresos_acum_dia():
         raise HTTPException(status_code=500, detail="Database connection error")
     
     
+# Endpoints que el frontend guarda por mes en su caché de particiones Parquet:
+# tabla, medida que se suma para la firma de cada mes y condición fija
+PARTICIONES = {
+    "depositos": ("DETALLE_DEPOSITOS_DIA", "deposito", "YEAR(date) = YEAR(CURDATE())"),
+    "recaudacion": ("DETALLE_RECAUDACION_DIA", "recaudacion", "YEAR(date) = YEAR(CURDATE())"),
+    "abonados": ("CABECERA_ABONADOS", "total", "YEAR(date) = YEAR(CURDATE())"),
+    "ingresos_acum_dia": ("KPI_INGRESOS_IMG_MES", "cash_amount + card_amount + subscribers",
+                          "periodo = 'Acumulado' AND metrica = 'ingresos'"),
+}
+
+# Columnas de cada tabla de PARTICIONES (no cambian mientras corre el backend)
+_columnas_particion = {}
+
+
+def _checksum_filas(cursor, tabla):
+    """
+    Expresión SQL con la suma de CRC32 de todas las columnas de cada fila:
+    cambia si cambia cualquier valor (un status, la sucursal o la fecha dentro
+    del mes), aunque se mantengan la cantidad de filas y la suma de la medida.
+    """
+    if tabla not in _columnas_particion:
+        cursor.execute("""
+            SELECT COLUMN_NAME AS columna FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (tabla,))
+        _columnas_particion[tabla] = [fila['columna'] for fila in cursor.fetchall()]
+    # QUOTE distingue NULL de '' y evita que un valor se corra de columna
+    valores = ", ".join(f"QUOTE(`{columna}`)" for columna in _columnas_particion[tabla])
+    return f"SUM(CRC32(CONCAT_WS('|', {valores})))"
+
+
+@app.get("/particiones")
+@cache_por_version("/particiones")
+def get_particiones(endpoint: str, sesion: dict = Depends(usuario_actual)):
+    """
+    Meses de 'endpoint' con su firma (filas, suma de la medida y checksum de
+    las filas) para las sucursales del usuario. El frontend compara las firmas
+    con las de sus archivos Parquet y descarga solo los meses que cambiaron.
+    """
+    if endpoint not in PARTICIONES:
+        raise HTTPException(status_code=404, detail=f"Endpoint sin particiones: {endpoint}")
+    tabla, medida, condicion = PARTICIONES[endpoint]
+    cnx = get_connection('default')  # Usa la configuración 'default'
+    if cnx:
+        try:
+            cursor = create_cursor(cnx)
+            query = f"""
+            SELECT YEAR(date) AS year, MONTH(date) AS month, COUNT(*) AS filas, SUM({medida}) AS total,
+                   {_checksum_filas(cursor, tabla)} AS checksum
+            FROM {tabla}
+            WHERE {condicion} AND {{filtro}}
+            GROUP BY YEAR(date), MONTH(date)
+            ORDER BY year, month
+            """
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(filtro=filtro), params)
+            resultados = cursor.fetchall()
+            columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
+            return {"columns": columnas, "data": resultados}
+        finally:
+            close_connection(cnx)
+    else:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
 @app.get("/ingresos_acum_dia_ppto")
-def get_ingresos_acum_ppto():
+@cache_por_version("/ingresos_acum_dia_ppto")
+def get_ingresos_acum_ppto(sesion: dict = Depends(usuario_actual)):
     cnx = get_connection('default')  # Usa la configuración 'default'
     if cnx:
         try:
             cursor = create_cursor(cnx)
             query = """
             SELECT * FROM KPI_INGRESOS_IMG_MES
-            WHERE año = YEAR(CURDATE()) and periodo = 'Acumulado' and metrica = 'ppto'
+            WHERE año = YEAR(CURDATE()) and periodo = 'Acumulado' and metrica = 'ppto' AND {filtro}
             """
-            cursor.execute(query)
+            filtro, params = _filtro_sucursales(sesion)
+            cursor.execute(query.format(filtro=filtro), params)
             resultados = cursor.fetchall()
             columnas = [desc[0] for desc in cursor.description]  # obtener los nombres de las columnas
             return {"columns": columnas, "data": resultados}
@@ -632,10 +880,12 @@ def get_ingresos_acum_ppto():
     
 # --- INICIO DEL NUEVO ENDPOINT PARA ASISTENCIA ---
 @app.get("/asistencia_diaria")
+@cache_por_version("/asistencia_diaria")
 def get_asistencia_diaria(
     year: int = Query(default=datetime.now().year, description="Año para filtrar los datos de asistencia"),
     month: int = Query(default=datetime.now().month, description="Mes para filtrar los datos de asistencia (1-12)"),
-    debug: bool = Query(default=False, description="Habilita información de debug")
+    debug: bool = Query(default=False, description="Habilita información de debug"),
+    sesion: dict = Depends(usuario_actual)
 ):
     """
     Obtiene los registros de asistencia diaria para un mes y año específicos.
@@ -658,18 +908,22 @@ def get_asistencia_diaria(
                 MONTH(EntradaFecha) as month_entrada,
                 DAY(EntradaFecha) as day_entrada
             FROM ASISTENCIA_DIARIA
-            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s
+            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s AND {filtro}
             ORDER BY EntradaFecha DESC
             """
         else:
             query = """
             SELECT * FROM ASISTENCIA_DIARIA
-            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s
+            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s AND {filtro}
             ORDER BY EntradaFecha DESC
             """
 
+        # Solo las sucursales del usuario de la sesión
+        filtro, params_filtro = _filtro_sucursales_nombre(sesion)
+        query = query.format(filtro=filtro)
+
         # Ejecutar la consulta con los parámetros
-        cursor.execute(query, (year, month))
+        cursor.execute(query, (year, month) + params_filtro)
         resultados = cursor.fetchall()
 
         # Obtener información adicional para debug
@@ -681,9 +935,9 @@ def get_asistencia_diaria(
                 COUNT(*) as total_registros,
                 COUNT(DISTINCT DATE(EntradaFecha)) as dias_unicos
             FROM ASISTENCIA_DIARIA
-            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s
+            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s AND {filtro}
             """
-            cursor.execute(range_query, (year, month))
+            cursor.execute(range_query.format(filtro=filtro), (year, month) + params_filtro)
             range_info = cursor.fetchone()
 
             daily_count_query = """
@@ -691,11 +945,11 @@ def get_asistencia_diaria(
                 DATE(EntradaFecha) as fecha,
                 COUNT(*) as registros_por_dia
             FROM ASISTENCIA_DIARIA
-            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s
+            WHERE YEAR(EntradaFecha) = %s AND MONTH(EntradaFecha) = %s AND {filtro}
             GROUP BY DATE(EntradaFecha)
             ORDER BY fecha DESC
             """
-            cursor.execute(daily_count_query, (year, month))
+            cursor.execute(daily_count_query.format(filtro=filtro), (year, month) + params_filtro)
             daily_counts = cursor.fetchall()
 
         columnas = [desc[0] for desc in cursor.description]
@@ -733,10 +987,11 @@ def get_asistencia_diaria(
 
 # Endpoint adicional para verificar los datos más recientes
 @app.get("/asistencia_diaria/verificar")
-def verificar_datos_asistencia():
+def verificar_datos_asistencia(sesion: dict = Depends(usuario_actual)):
     """
     Endpoint de verificación para revisar los datos más recientes de asistencia.
-    Útil para debugging y verificación de datos.
+    Útil para debugging y verificación de datos. Solo cuenta las filas de las
+    sucursales del usuario de la sesión.
     """
     cnx = get_connection('default')
     if not cnx:
@@ -744,9 +999,10 @@ def verificar_datos_asistencia():
 
     try:
         cursor = create_cursor(cnx)
+        filtro, params_filtro = _filtro_sucursales_nombre(sesion)
 
         # Obtener información general de la tabla
-        info_query = """
+        info_query = f"""
         SELECT 
             COUNT(*) as total_registros,
             MIN(EntradaFecha) as fecha_minima,
@@ -755,31 +1011,33 @@ def verificar_datos_asistencia():
             COUNT(DISTINCT YEAR(EntradaFecha)) as años_unicos,
             COUNT(DISTINCT MONTH(EntradaFecha)) as meses_unicos
         FROM ASISTENCIA_DIARIA
+        WHERE {filtro}
         """
-        cursor.execute(info_query)
+        cursor.execute(info_query, params_filtro)
         info_general = cursor.fetchone()
 
         # Obtener los últimos 10 registros
-        ultimos_query = """
+        ultimos_query = f"""
         SELECT * FROM ASISTENCIA_DIARIA
+        WHERE {filtro}
         ORDER BY EntradaFecha DESC
         LIMIT 10
         """
-        cursor.execute(ultimos_query)
+        cursor.execute(ultimos_query, params_filtro)
         ultimos_registros = cursor.fetchall()
         columnas_ultimos = [desc[0] for desc in cursor.description]
 
         # Obtener conteo por día de los últimos 7 días
-        ultimos_dias_query = """
+        ultimos_dias_query = f"""
         SELECT 
             DATE(EntradaFecha) as fecha,
             COUNT(*) as registros
         FROM ASISTENCIA_DIARIA
-        WHERE EntradaFecha >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+        WHERE EntradaFecha >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) AND {filtro}
         GROUP BY DATE(EntradaFecha)
         ORDER BY fecha DESC
         """
-        cursor.execute(ultimos_dias_query)
+        cursor.execute(ultimos_dias_query, params_filtro)
         ultimos_dias = cursor.fetchall()
 
         return {
@@ -802,9 +1060,11 @@ def verificar_datos_asistencia():
 # --- FIN DEL NUEVO ENDPOINT ---
 
 @app.get("/inasistencias")
+@cache_por_version("/inasistencias")
 def get_inasistencias(
     year: int = Query(default=datetime.now().year, description="Año para filtrar las inasistencias"),
-    month: int = Query(default=datetime.now().month, description="Mes para filtrar las inasistencias (1-12)")
+    month: int = Query(default=datetime.now().month, description="Mes para filtrar las inasistencias (1-12)"),
+    sesion: dict = Depends(usuario_actual)
 ):
     """
     Obtiene los registros de inasistencias para un mes y año específicos.
@@ -818,10 +1078,11 @@ def get_inasistencias(
         
         query = """
         SELECT * FROM INASISTENCIAS
-        WHERE YEAR(FechaInasistencia) = %s AND MONTH(FechaInasistencia) = %s
+        WHERE YEAR(FechaInasistencia) = %s AND MONTH(FechaInasistencia) = %s AND {filtro}
         """
         
-        cursor.execute(query, (year, month))
+        filtro, params_filtro = _filtro_sucursales_nombre(sesion)
+        cursor.execute(query.format(filtro=filtro), (year, month) + params_filtro)
         
         resultados = cursor.fetchall()
         columnas = [desc[0] for desc in cursor.description]
@@ -871,9 +1132,10 @@ def get_asistencia_turnos():
             
             
 @app.get("/trabajadores")
-def get_trabajadores():
+def get_trabajadores(sesion: dict = Depends(usuario_actual)):
     """
-    Obtiene los registros de trabajadores con información adicional de branch_offices y users.
+    Obtiene los registros de trabajadores con información adicional de branch_offices y users,
+    solo de las sucursales del usuario de la sesión.
     """
     cnx = get_connection('default')
     if not cnx:
@@ -881,8 +1143,9 @@ def get_trabajadores():
 
     try:
         cursor = create_cursor(cnx)
+        filtro, params_filtro = _filtro_sucursales_nombre(sesion, 'branch_offices.branch_office')
 
-        query = """
+        query = f"""
         SELECT
             ASISTENCIA_TRABAJADOR.rut, 
             ASISTENCIA_TRABAJADOR.trabajador as Trabajador, 
@@ -902,9 +1165,10 @@ def get_trabajadores():
             users
             ON 
             branch_offices.principal_supervisor = users.rut
+        WHERE {filtro}
         """
 
-        cursor.execute(query)
+        cursor.execute(query, params_filtro)
 
         resultados = cursor.fetchall()
 
@@ -942,6 +1206,19 @@ class MallaPayload(BaseModel):
 
 
 
+class MallaCambio(BaseModel):
+    rut: str
+    fecha: date
+    codigo: Optional[str] = None  # None o "" borra la celda
+
+class MallaDiffPayload(BaseModel):
+    sucursal: str
+    year: int
+    month: int
+    version: int
+    cambios: List[MallaCambio]
+
+
 class PlanificacionContext(BaseModel):
     supervisor: str
     sucursal: str
@@ -949,8 +1226,60 @@ class PlanificacionContext(BaseModel):
     month: int
     
 
+def _rango_mes(year, month):
+    """Primer y último día del mes."""
+    primer_dia = date(year, month, 1)
+    ultimo_dia = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return primer_dia, ultimo_dia
+
+
+def _bloquear_version_malla(cursor, sucursal, year, month):
+    """
+    Bloquea la fila de ASISTENCIA_MALLA_INDICE de la planificación (la crea con
+    versión 0 si no existe) y retorna su versión actual. El bloqueo se mantiene
+    hasta el commit, de modo que dos guardados del mismo mes se serializan.
+    """
+    cursor.execute("""
+        INSERT IGNORE INTO ASISTENCIA_MALLA_INDICE (sucursal, year, month, version, updated_at)
+        VALUES (%s, %s, %s, 0, NOW())
+    """, (sucursal, year, month))
+    cursor.execute("""
+        SELECT version FROM ASISTENCIA_MALLA_INDICE
+        WHERE sucursal = %s AND year = %s AND month = %s
+        FOR UPDATE
+    """, (sucursal, year, month))
+    return cursor.fetchone()['version']
+
+
+def _incrementar_version_malla(cursor, sucursal, year, month):
+    """Nueva versión de la planificación, con su cantidad de filas actualizada."""
+    primer_dia, ultimo_dia = _rango_mes(year, month)
+    cursor.execute("""
+        UPDATE ASISTENCIA_MALLA_INDICE
+        SET version = version + 1,
+            updated_at = NOW(),
+            filas = (
+                SELECT COUNT(*) FROM ASISTENCIA_MALLA
+                WHERE sucursal = %s AND fecha BETWEEN %s AND %s
+            )
+        WHERE sucursal = %s AND year = %s AND month = %s
+    """, (sucursal, primer_dia, ultimo_dia, sucursal, year, month))
+
+
 @app.post("/guardar_malla", status_code=status.HTTP_201_CREATED)
-def guardar_malla(payload: MallaPayload):
+def guardar_malla(payload: MallaPayload, sesion: dict = Depends(usuario_actual)):
+    # Validar antes de abrir la transacción (sin datos no hay sucursal a la cual asociar el índice)
+    ruts_list = payload.ruts
+    if not ruts_list:
+        raise HTTPException(status_code=400, detail="Lista de RUTs vacía")
+    if not payload.data:
+        raise HTTPException(status_code=400, detail="Planificación sin datos")
+    # Todos los items deben ser de la misma sucursal, y de una sucursal del usuario
+    sucursal = payload.data[0].sucursal
+    if any(item.sucursal != sucursal for item in payload.data):
+        raise HTTPException(status_code=400, detail="La planificación mezcla sucursales")
+    _verificar_sucursal(sesion, sucursal)
+
     cnx = None
     try:
         cnx = get_connection('default')
@@ -959,20 +1288,14 @@ def guardar_malla(payload: MallaPayload):
 
         cursor = create_cursor(cnx)
 
-        # Convertir la lista de RUTs a una tupla adecuada
-        ruts_list = payload.ruts
-        if not ruts_list:
-            raise HTTPException(status_code=400, detail="Lista de RUTs vacía")
-            
         # Crear marcadores de posición para la consulta SQL
         placeholders = ','.join(['%s'] * len(ruts_list))
         
-        # Obtener sucursal (todos los items deben ser de la misma sucursal)
-        sucursal = payload.data[0].sucursal if payload.data else ""
-        
         # Calcular rango de fechas
-        primer_dia = date(payload.year, payload.month, 1)
-        ultimo_dia = date(payload.year, payload.month + 1, 1) - timedelta(days=1) if payload.month < 12 else date(payload.year, 12, 31)
+        primer_dia, ultimo_dia = _rango_mes(payload.year, payload.month)
+
+        # 0. Bloquear el índice antes que las filas, en el mismo orden que PATCH /guardar_malla
+        _bloquear_version_malla(cursor, sucursal, payload.year, payload.month)
 
         # 1. Borrar registros existentes (usando IN con parámetros)
         delete_query = f"""
@@ -983,18 +1306,20 @@ def guardar_malla(payload: MallaPayload):
         registros_borrados = cursor.rowcount
 
         # 2. Insertar nuevos registros
-        if payload.data:
-            insert_query = """
-            INSERT INTO ASISTENCIA_MALLA (rut, sucursal, fecha, codigo)
-            VALUES (%s, %s, %s, %s)
-            """
-            # Preparar datos para inserción masiva
-            datos_para_insertar = [
-                (item.rut, item.sucursal, item.fecha, item.codigo)
-                for item in payload.data
-            ]
-            cursor.executemany(insert_query, datos_para_insertar)
-            registros_insertados = cursor.rowcount
+        insert_query = """
+        INSERT INTO ASISTENCIA_MALLA (rut, sucursal, fecha, codigo)
+        VALUES (%s, %s, %s, %s)
+        """
+        # Preparar datos para inserción masiva
+        datos_para_insertar = [
+            (item.rut, item.sucursal, item.fecha, item.codigo)
+            for item in payload.data
+        ]
+        cursor.executemany(insert_query, datos_para_insertar)
+        registros_insertados = cursor.rowcount
+
+        # 3. Invalidar la versión de la planificación para los guardados diferenciales
+        _incrementar_version_malla(cursor, sucursal, payload.year, payload.month)
 
         cnx.commit()
 
@@ -1019,15 +1344,186 @@ def guardar_malla(payload: MallaPayload):
             close_connection(cnx)
 
 
+@app.patch("/guardar_malla")
+def guardar_malla_cambios(payload: MallaDiffPayload, sesion: dict = Depends(usuario_actual)):
+    """
+    Guarda solo las celdas modificadas de la planificación en una transacción.
+    'version' es la versión que el cliente cargó: si otro usuario guardó antes,
+    responde 409 y no escribe nada. Retorna la nueva versión.
+    """
+    _verificar_sucursal(sesion, payload.sucursal)
+    cnx = None
+    try:
+        cnx = get_connection('default')
+        if not cnx:
+            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
+
+        primer_dia, ultimo_dia = _rango_mes(payload.year, payload.month)
+        fuera_de_rango = [c.fecha for c in payload.cambios if not primer_dia <= c.fecha <= ultimo_dia]
+        if fuera_de_rango:
+            raise HTTPException(status_code=400, detail=f"Fechas fuera del periodo {payload.month:02d}-{payload.year}: {fuera_de_rango[:5]}")
+
+        cursor = create_cursor(cnx)
+        version_actual = _bloquear_version_malla(cursor, payload.sucursal, payload.year, payload.month)
+        if version_actual != payload.version:
+            cnx.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail=f"La planificación fue modificada por otro usuario (versión {version_actual}, se esperaba {payload.version}). Recargue antes de guardar."
+            )
+
+        borrar = [(c.rut, payload.sucursal, c.fecha) for c in payload.cambios if not c.codigo]
+        upsert = [(c.rut, payload.sucursal, c.fecha, c.codigo) for c in payload.cambios if c.codigo]
+
+        if borrar:
+            cursor.executemany("""
+                DELETE FROM ASISTENCIA_MALLA
+                WHERE rut = %s AND sucursal = %s AND fecha = %s
+            """, borrar)
+        if upsert:
+            cursor.executemany("""
+                INSERT INTO ASISTENCIA_MALLA (rut, sucursal, fecha, codigo)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE codigo = VALUES(codigo)
+            """, upsert)
+
+        nueva_version = version_actual
+        if payload.cambios:
+            _incrementar_version_malla(cursor, payload.sucursal, payload.year, payload.month)
+            nueva_version += 1
+
+        cnx.commit()
+
+        return {
+            "success": True,
+            "message": f"Planificación guardada. Celdas actualizadas: {len(upsert)}, borradas: {len(borrar)}.",
+            "sucursal": payload.sucursal,
+            "year": payload.year,
+            "month": payload.month,
+            "version": nueva_version
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        if cnx:
+            cnx.rollback()
+        logger.error(f"Error al guardar cambios de la malla: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error en la operación de base de datos: {str(e)}"
+        )
+    finally:
+        if cnx:
+            close_connection(cnx)
+
+
+MALLA_INDICE_QUERY = """
+    SELECT version, filas, updated_at
+    FROM ASISTENCIA_MALLA_INDICE
+    WHERE sucursal = %s AND year = %s AND month = %s
+"""
+
+MALLA_MES_QUERY = """
+    SELECT m.rut, t.trabajador, m.fecha, m.codigo
+    FROM ASISTENCIA_MALLA m
+    LEFT JOIN ASISTENCIA_TRABAJADOR t ON m.rut = t.rut
+    WHERE m.sucursal = %s AND m.fecha BETWEEN %s AND %s
+    ORDER BY t.trabajador, m.rut, m.fecha
+"""
+
+
+def _etag_malla(indice):
+    if not indice:
+        return '"malla-0"'
+    return f'"malla-{indice["version"]}-{indice["filas"]}-{indice["updated_at"]:%Y%m%d%H%M%S}"'
+
+
+@app.get("/planificacion")
+def planificacion(
+    request: Request,
+    response: Response,
+    sucursal: str = Query(...),
+    year: int = Query(...),
+    month: int = Query(...),
+    sesion: dict = Depends(usuario_actual)
+):
+    """
+    Existencia, versión y grilla de la planificación de un mes en una sola
+    llamada. La existencia y la versión salen de ASISTENCIA_MALLA_INDICE; si
+    el cliente envía If-None-Match con la versión que ya tiene, responde 304
+    sin leer la malla.
+
+    La grilla va codificada como matriz (trabajadores x días del mes) de
+    índices en 'codigos', donde 0 es la celda vacía.
+    """
+    _verificar_sucursal(sesion, sucursal)
+    cnx = None
+    try:
+        cnx = get_connection('default')
+        if not cnx:
+            raise HTTPException(status_code=500, detail="Database connection error")
+
+        cursor = create_cursor(cnx)
+        cursor.execute(MALLA_INDICE_QUERY, (sucursal, year, month))
+        indice = cursor.fetchone()
+
+        etag = _etag_malla(indice)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
+        primer_dia, ultimo_dia = _rango_mes(year, month)
+        resultado = {
+            "exists": bool(indice and indice['filas'] > 0),
+            "version": indice['version'] if indice else 0,
+            "filas": indice['filas'] if indice else 0,
+            "updated_at": indice['updated_at'] if indice else None,
+            "dias": ultimo_dia.day,
+            "ruts": [],
+            "trabajadores": [],
+            "codigos": [""],
+            "grid": []
+        }
+        if not resultado["exists"]:
+            return resultado
+
+        cursor.execute(MALLA_MES_QUERY, (sucursal, primer_dia, ultimo_dia))
+        fila_por_rut, indice_codigo = {}, {"": 0}
+        for row in cursor.fetchall():
+            fila = fila_por_rut.get(row['rut'])
+            if fila is None:
+                fila = fila_por_rut[row['rut']] = len(resultado["ruts"])
+                resultado["ruts"].append(row['rut'])
+                resultado["trabajadores"].append(row['trabajador'])
+                resultado["grid"].append([0] * ultimo_dia.day)
+            codigo = indice_codigo.setdefault(row['codigo'] or "", len(indice_codigo))
+            resultado["grid"][fila][row['fecha'].day - 1] = codigo
+        resultado["codigos"] = list(indice_codigo)
+        return resultado
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al cargar la planificación: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    finally:
+        if cnx:
+            close_connection(cnx)
+
+
 @app.get("/check_planificacion")
 def check_planificacion(
     sucursal: str = Query(...),
     year: int = Query(...),
-    month: int = Query(...)
+    month: int = Query(...),
+    sesion: dict = Depends(usuario_actual)
 ):
     """
     Verifica si existe una planificación para la sucursal, año y mes dados.
     """
+    _verificar_sucursal(sesion, sucursal)
+    cnx = None
     try:
         cnx = get_connection('default')
         if not cnx:
@@ -1035,52 +1531,51 @@ def check_planificacion(
             raise HTTPException(status_code=500, detail="Database connection error")
 
         cursor = create_cursor(cnx)
-        query = """
-        SELECT COUNT(*) as count
-        FROM ASISTENCIA_MALLA
-        WHERE sucursal = %s AND YEAR(fecha) = %s AND MONTH(fecha) = %s
-        """
-        cursor.execute(query, (sucursal, year, month))
-        result = cursor.fetchone()
-        close_connection(cnx)
+        cursor.execute(MALLA_INDICE_QUERY, (sucursal, year, month))
+        indice = cursor.fetchone()
 
-        exists = result['count'] > 0
+        exists = bool(indice and indice['filas'] > 0)
         return {"exists": exists}
 
     except Exception as e:
         logger.error(f"Error al verificar la planificación: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    finally:
+        if cnx:
+            close_connection(cnx)
 
 @app.get("/load_planificacion")
 def load_planificacion(
     sucursal: str = Query(...),
     year: int = Query(...),
-    month: int = Query(...)
+    month: int = Query(...),
+    sesion: dict = Depends(usuario_actual)
 ):
     """
     Carga una planificación existente para la sucursal, año y mes dados.
     """
+    _verificar_sucursal(sesion, sucursal)
+    cnx = None
     try:
         cnx = get_connection('default')
         if not cnx:
             raise HTTPException(status_code=500, detail="Database connection error")
 
         cursor = create_cursor(cnx)
-        # Asegúrate de que la consulta SQL incluya el nombre del trabajador
-        query = """
-        SELECT m.rut, t.trabajador, m.fecha, m.codigo
-        FROM ASISTENCIA_MALLA m
-        JOIN ASISTENCIA_TRABAJADOR t ON m.rut = t.rut
-        WHERE m.sucursal = %s AND YEAR(m.fecha) = %s AND MONTH(m.fecha) = %s
-        """
-        cursor.execute(query, (sucursal, year, month))
+        primer_dia, ultimo_dia = _rango_mes(year, month)
+        cursor.execute(MALLA_MES_QUERY, (sucursal, primer_dia, ultimo_dia))
         resultados = cursor.fetchall()
 
+        # Versión para el guardado diferencial (PATCH /guardar_malla)
+        cursor.execute(MALLA_INDICE_QUERY, (sucursal, year, month))
+        indice = cursor.fetchone()
+        version = indice['version'] if indice else 0
+
         if not resultados:
-            return {"data": []}
+            return {"data": [], "version": version}
 
         columnas = ['rut', 'trabajador', 'fecha', 'codigo']
-        return {"columns": columnas, "data": resultados}
+        return {"columns": columnas, "data": resultados, "version": version}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -1091,9 +1586,10 @@ def load_planificacion(
 
 
 @app.get("/nombre_trabajador")
-def obtener_nombre_trabajador(rut: str = Query(...)):
+def obtener_nombre_trabajador(rut: str = Query(...), sesion: dict = Depends(usuario_actual)):
     """
-    Obtiene el nombre de un trabajador basado en su RUT.
+    Obtiene el nombre de un trabajador basado en su RUT (solo trabajadores de
+    las sucursales del usuario de la sesión).
     """
     try:
         cnx = get_connection('default')
@@ -1102,12 +1598,14 @@ def obtener_nombre_trabajador(rut: str = Query(...)):
             raise HTTPException(status_code=500, detail="Database connection error")
 
         cursor = create_cursor(cnx)
-        query = """
-        SELECT trabajador
+        filtro, params_filtro = _filtro_sucursales_nombre(sesion, 'branch_offices.branch_office')
+        query = f"""
+        SELECT ASISTENCIA_TRABAJADOR.trabajador
         FROM ASISTENCIA_TRABAJADOR
-        WHERE rut = %s
+        LEFT JOIN branch_offices ON ASISTENCIA_TRABAJADOR.branch_office_id = branch_offices.id
+        WHERE ASISTENCIA_TRABAJADOR.rut = %s AND {filtro}
         """
-        cursor.execute(query, (rut,))
+        cursor.execute(query, (rut,) + params_filtro)
         result = cursor.fetchone()
         close_connection(cnx)
 
@@ -1116,12 +1614,15 @@ def obtener_nombre_trabajador(rut: str = Query(...)):
         else:
             raise HTTPException(status_code=404, detail="Trabajador no encontrado")
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener el nombre del trabajador: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @app.get("/ventas_historicas_diarias")
-def get_ventas_historicas_diarias():
+@cache_por_version("/ventas_historicas_diarias")
+def get_ventas_historicas_diarias(sesion: dict = Depends(usuario_actual)):
     """
     Obtiene el historial completo de ventas DIARIAS por sucursal,
     calculado directamente desde la tabla de transacciones.
@@ -1147,6 +1648,7 @@ def get_ventas_historicas_diarias():
                     QRY_BRANCH_OFFICES s ON ct.branch_office_id = s.id -- Unimos con la vista QRY_BRANCH_OFFICES
                 WHERE
                     s.status_id = 7 -- Aseguramos que solo sean sucursales activas
+                    AND {filtro}
                 GROUP BY
                     ct.date,
                     ct.branch_office_id,
@@ -1156,7 +1658,8 @@ def get_ventas_historicas_diarias():
                     s.branch_office;
             """
             
-            cursor.execute(query)
+            filtro, params = _filtro_sucursales(sesion, 'ct.branch_office_id')
+            cursor.execute(query.format(filtro=filtro), params)
             
             # Obtenemos los resultados y los nombres de las columnas, tal como lo haces en tus otros endpoints.
             resultados = cursor.fetchall()
@@ -1173,4 +1676,143 @@ def get_ventas_historicas_diarias():
             # Cerramos la conexión, como es tu práctica habitual.
             close_connection(cnx)
     else:
-        raise HTTPException(status_code=500, detail="Database connection error")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+# --- PROYECCIÓN DE VENTAS (SERVIDOR) ---
+
+def _frame_payload(df):
+    """Convierte un DataFrame a {"columns", "data"} con fechas ISO y NaN como null."""
+    df = df.copy()
+    for col in df.select_dtypes(include=['datetime64[ns]']).columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d')
+    df = df.astype(object).where(df.notna(), None)
+    return {"columns": list(df.columns), "data": df.values.tolist()}
+
+
+@app.on_event("startup")
+def iniciar_worker_proyeccion():
+    servicio_proyeccion.start()
+
+
+@app.on_event("shutdown")
+def detener_worker_proyeccion():
+    servicio_proyeccion.stop()
+
+
+@app.get("/proyeccion/sucursales")
+def get_proyeccion_sucursales(sesion: dict = Depends(usuario_actual)):
+    """
+    Sucursales del usuario con modelo de proyección disponible y el modelo
+    elegido para cada una.
+    """
+    accesibles = _nombres_sucursales(sesion)
+    try:
+        registry = servicio_proyeccion.ensure_ready()
+        sucursales = [b for b in registry.branches if b in accesibles]
+        return {
+            "etag": registry.etag,
+            "last_date": registry.last_date.strftime('%Y-%m-%d'),
+            "modelos": {name: model.label for name, model in MODELOS.items()},
+            "sucursales": sucursales,
+            "omitidas": [b for b in registry.skipped if b in accesibles],
+            "modelo_elegido": [registry.chosen_model(b) for b in sucursales],
+        }
+    except ModelosNoDisponibles as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error al obtener sucursales de proyección: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@app.get("/proyeccion")
+def get_proyeccion(
+    sucursales: List[str] = Query(..., description="Sucursales a proyectar"),
+    dias: int = Query(default=30, ge=1, le=365, description="Días a proyectar"),
+    modelo: Optional[str] = Query(default=None, description="Modelo a usar; por defecto el mejor por sucursal"),
+    historia_dias: int = Query(default=180, ge=0, le=1095, description="Días de histórico a incluir en la respuesta"),
+    sesion: dict = Depends(usuario_actual)
+):
+    """
+    Proyecta las ventas de las sucursales indicadas con los modelos entrenados en el
+    servidor. Devuelve solo la cola del histórico, la proyección y el backtest, de modo
+    que el frontend no necesita descargar el historial completo.
+    """
+    if modelo is not None and modelo not in MODELOS:
+        raise HTTPException(status_code=400, detail=f"Modelo desconocido: {modelo}")
+    # Solo las sucursales del usuario de la sesión
+    accesibles = _nombres_sucursales(sesion)
+    sucursales = [s for s in sucursales if s in accesibles]
+    if not sucursales:
+        raise HTTPException(status_code=403, detail="Sin acceso a las sucursales pedidas")
+    try:
+        registry = servicio_proyeccion.ensure_ready()
+        df_backtest = registry.backtest_summary()
+        return {
+            "etag": registry.etag,
+            "last_date": registry.last_date.strftime('%Y-%m-%d'),
+            "historia": _frame_payload(servicio_proyeccion.history_tail(sucursales, historia_dias)),
+            "proyeccion": _frame_payload(registry.predict(sucursales, dias, modelo=modelo)),
+            "backtest": _frame_payload(df_backtest[df_backtest['branch_office'].isin(sucursales)]),
+        }
+    except ModelosNoDisponibles as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error al generar la proyección: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@app.post("/proyeccion/refrescar")
+def refrescar_proyeccion(
+    force: bool = Query(default=False, description="Reentrena aunque los datos no hayan cambiado"),
+    sesion: dict = Depends(usuario_actual)
+):
+    """
+    Fuerza la revisión de datos nuevos (por ejemplo, al terminar la carga nocturna).
+    Solo administradores.
+    """
+    if not es_administrador(sesion):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede refrescar la proyección")
+    try:
+        actualizado = servicio_proyeccion.refresh(force=force)
+        return {"actualizado": actualizado, "etag": servicio_proyeccion.registry.etag}
+    except Exception as e:
+        logger.error(f"Error al refrescar la proyección: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+# --- MOTOR ANALÍTICO (DuckDB sobre snapshots Parquet, opcional) ---
+
+def _consulta_analitica(funcion, *args):
+    try:
+        return funcion(*args)
+    except analitica.MotorNoDisponible as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error en el motor analítico: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@app.get("/analitica/depositos_diarios")
+@cache_por_version("/analitica/depositos_diarios")
+def get_analitica_depositos_diarios(
+    year: Optional[int] = Query(default=None, description="Año (por defecto, el actual)"),
+    sesion: dict = Depends(usuario_actual)
+):
+    """
+    Recaudación contra depósitos por sucursal y día, con diferencia, ratio y
+    medias móviles de 7 y 30 días, calculados en DuckDB.
+    """
+    year = year or date.today().year
+    if year < analitica.primer_anio():
+        raise HTTPException(status_code=400, detail=f"El motor analítico guarda datos desde {analitica.primer_anio()}")
+    return _consulta_analitica(analitica.depositos_diarios, year, sesion['branches'])
+
+
+@app.post("/analitica/refrescar")
+def refrescar_analitica(sesion: dict = Depends(usuario_actual)):
+    """Vuelve a exportar los snapshots Parquet (normalmente se renuevan solos con DATA_VERSION)."""
+    if not es_administrador(sesion):
+        raise HTTPException(status_code=403, detail="Solo un administrador puede refrescar la analítica")
+    if not analitica.disponible():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Motor analítico no disponible")
+    return _consulta_analitica(analitica.snapshots.refrescar)
@@ -0,0 +1,316 @@
+# backend/metricas.py
+"""
+Instrumentación de rendimiento del backend.
+
+- MetricasMiddleware (ASGI): asigna un id a cada request (X-Request-ID), mide
+  la latencia y los bytes enviados (ya comprimidos) y escribe una línea de log
+  JSON por request con el resumen de sus consultas.
+- CursorMedido: envuelve el cursor de database.create_cursor y mide por
+  consulta el tiempo de ejecución, el de lectura (fetch) y las filas. Las
+  consultas sobre SLOW_QUERY_MS se registran en el log de consultas lentas.
+- exponer(): las métricas acumuladas en formato de texto de Prometheus, para
+  GET /metrics.
+
+No depende de prometheus_client: son pocos contadores e histogramas y el
+formato de exposición es texto plano.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+logger = logging.getLogger("metricas")
+
+# Umbral (ms) de ejecución + lectura sobre el que una consulta se registra como lenta
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '500'))
+
+# Límites (segundos) de los histogramas
+BUCKETS_REQUEST = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_CONSULTA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Resumen de la request en curso; los endpoints síncronos corren en otro hilo
+# con una copia del contexto, pero comparten este mismo objeto
+_request_actual = contextvars.ContextVar("request_actual", default=None)
+
+
+class ResumenRequest:
+    __slots__ = ("request_id", "scope", "consultas", "seg_execute", "seg_fetch", "filas")
+
+    def __init__(self, request_id, scope):
+        self.request_id = request_id
+        self.scope = scope
+        self.consultas = 0
+        self.seg_execute = 0.0
+        self.seg_fetch = 0.0
+        self.filas = 0
+
+    @property
+    def ruta(self):
+        # Plantilla de la ruta ('/users/profile/{rut}'), no la URL, para acotar las etiquetas.
+        # El router de Starlette la agrega al scope al resolver la request.
+        return getattr(self.scope.get("route"), "path", None) or "sin_ruta"
+
+
+def request_id_actual():
+    resumen = _request_actual.get()
+    return resumen.request_id if resumen else None
+
+
+# --- Registro de métricas ---
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class RegistroMetricas:
+    """Contadores e histogramas por conjunto de etiquetas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(float)   # (nombre, etiquetas) -> valor
+        self._histogramas = {}                  # (nombre, etiquetas) -> Histograma
+        self._ayuda = {}                        # nombre -> (tipo, descripción)
+
+    def describir(self, nombre, tipo, ayuda):
+        self._ayuda[nombre] = (tipo, ayuda)
+
+    def sumar(self, nombre, valor=1, **etiquetas):
+        with self._lock:
+            self._contadores[(nombre, tuple(sorted(etiquetas.items())))] += valor
+
+    def observar(self, nombre, valor, buckets, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            if clave not in self._histogramas:
+                self._histogramas[clave] = Histograma(buckets)
+            self._histogramas[clave].observar(valor)
+
+    def exponer(self):
+        """Texto en formato de exposición de Prometheus (versión 0.0.4)."""
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(self._histogramas.items(), key=lambda item: item[0])
+            lineas, descritos = [], set()
+
+            def encabezado(nombre):
+                if nombre not in descritos and nombre in self._ayuda:
+                    tipo, ayuda = self._ayuda[nombre]
+                    lineas.append(f"# HELP {nombre} {ayuda}")
+                    lineas.append(f"# TYPE {nombre} {tipo}")
+                    descritos.add(nombre)
+
+            for (nombre, etiquetas), valor in contadores:
+                encabezado(nombre)
+                lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor:g}")
+            for (nombre, etiquetas), hist in histogramas:
+                encabezado(nombre)
+                for limite, conteo in zip(hist.buckets, hist.conteos):
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', f'{limite:g}'),))} {conteo}")
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {hist.total}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {hist.suma:.6f}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {hist.total}")
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    pares = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in etiquetas)
+    return "{" + pares + "}"
+
+
+registro = RegistroMetricas()
+registro.describir("http_requests_total", "counter", "Requests atendidas por ruta, método y estado.")
+registro.describir("http_request_duration_seconds", "histogram", "Latencia de las requests.")
+registro.describir("http_response_bytes_total", "counter", "Bytes de cuerpo enviados (después de la compresión).")
+registro.describir("db_queries_total", "counter", "Consultas ejecutadas por ruta.")
+registro.describir("db_query_duration_seconds", "histogram", "Tiempo de las consultas por fase (execute o fetch).")
+registro.describir("db_rows_total", "counter", "Filas leídas por ruta.")
+registro.describir("db_slow_queries_total", "counter", "Consultas sobre el umbral SLOW_QUERY_MS.")
+
+
+def exponer():
+    return registro.exponer()
+
+
+# --- Cursor medido ---
+
+def _sql_resumido(sql, largo=300):
+    texto = re.sub(r"\s+", " ", str(sql)).strip()
+    return texto if len(texto) <= largo else texto[:largo] + "..."
+
+
+class CursorMedido:
+    """
+    Cursor de mysql.connector que mide cada consulta. El tiempo de una
+    consulta se cierra en la primera lectura (o en la consulta siguiente), así
+    se separa cuánto espera el servidor (execute) de cuánto toma traer y
+    convertir las filas (fetch).
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+        self._seg_execute = 0.0
+        self._seg_fetch = 0.0
+        self._filas = 0
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _ejecutar(self, sql, ejecutar):
+        self._cerrar_consulta()
+        inicio = time.perf_counter()
+        try:
+            return ejecutar()
+        finally:
+            self._sql = sql
+            self._seg_execute = time.perf_counter() - inicio
+            self._seg_fetch = 0.0
+            self._filas = 0
+
+    def execute(self, sql, params=None, *args, **kwargs):
+        return self._ejecutar(sql, lambda: self._cursor.execute(sql, params, *args, **kwargs))
+
+    def executemany(self, sql, seq_params):
+        resultado = self._ejecutar(sql, lambda: self._cursor.executemany(sql, seq_params))
+        self._filas = self._cursor.rowcount if self._cursor.rowcount and self._cursor.rowcount > 0 else 0
+        return resultado
+
+    def _leer(self, metodo, *args):
+        inicio = time.perf_counter()
+        filas = metodo(*args)
+        self._seg_fetch += time.perf_counter() - inicio
+        if isinstance(filas, list):
+            self._filas += len(filas)
+        elif filas is not None:
+            self._filas += 1
+        return filas
+
+    def fetchall(self):
+        filas = self._leer(self._cursor.fetchall)
+        self._cerrar_consulta()
+        return filas
+
+    def fetchone(self):
+        return self._leer(self._cursor.fetchone)
+
+    def fetchmany(self, size=1):
+        return self._leer(self._cursor.fetchmany, size)
+
+    def close(self):
+        self._cerrar_consulta()
+        return self._cursor.close()
+
+    def _cerrar_consulta(self):
+        if self._sql is None:
+            return
+        registrar_consulta(self._sql, self._seg_execute, self._seg_fetch, self._filas)
+        self._sql = None
+
+    def __del__(self):
+        try:
+            self._cerrar_consulta()
+        except Exception:
+            pass
+
+
+def registrar_consulta(sql, seg_execute, seg_fetch, filas):
+    resumen = _request_actual.get()
+    ruta = resumen.ruta if resumen is not None else "-"
+    if resumen is not None:
+        resumen.consultas += 1
+        resumen.seg_execute += seg_execute
+        resumen.seg_fetch += seg_fetch
+        resumen.filas += filas
+
+    registro.sumar("db_queries_total", ruta=ruta)
+    registro.sumar("db_rows_total", filas, ruta=ruta)
+    registro.observar("db_query_duration_seconds", seg_execute, BUCKETS_CONSULTA, fase="execute")
+    registro.observar("db_query_duration_seconds", seg_fetch, BUCKETS_CONSULTA, fase="fetch")
+
+    ms_total = (seg_execute + seg_fetch) * 1000
+    if ms_total >= SLOW_QUERY_MS:
+        registro.sumar("db_slow_queries_total", ruta=ruta)
+        logger.warning(json.dumps({
+            "evento": "consulta_lenta",
+            "request_id": resumen.request_id if resumen else None,
+            "ruta": ruta,
+            "ms_execute": round(seg_execute * 1000, 1),
+            "ms_fetch": round(seg_fetch * 1000, 1),
+            "filas": filas,
+            "sql": _sql_resumido(sql),
+        }, ensure_ascii=False))
+
+
+# --- Middleware ---
+
+class MetricasMiddleware:
+    """Middleware ASGI: id de request, latencia, bytes enviados y log estructurado."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        cabeceras = dict(scope.get("headers") or [])
+        request_id = (cabeceras.get(b"x-request-id") or b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        resumen = ResumenRequest(request_id, scope)
+        token = _request_actual.set(resumen)
+        estado = {"status": 500, "bytes": 0}
+        inicio = time.perf_counter()
+
+        async def send_medido(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["status"] = mensaje["status"]
+                mensaje.setdefault("headers", [])
+                mensaje["headers"] = list(mensaje["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            elif mensaje["type"] == "http.response.body":
+                estado["bytes"] += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            _request_actual.reset(token)
+            segundos = time.perf_counter() - inicio
+            ruta = resumen.ruta
+            etiquetas = {"ruta": ruta, "metodo": scope["method"], "status": str(estado["status"])}
+            registro.sumar("http_requests_total", **etiquetas)
+            registro.observar("http_request_duration_seconds", segundos, BUCKETS_REQUEST, ruta=ruta, metodo=scope["method"])
+            registro.sumar("http_response_bytes_total", estado["bytes"], ruta=ruta)
+            logger.info(json.dumps({
+                "evento": "request",
+                "request_id": request_id,
+                "metodo": scope["method"],
+                "ruta": ruta,
+                "path": scope["path"],
+                "status": estado["status"],
+                "ms": round(segundos * 1000, 1),
+                "bytes": estado["bytes"],
+                "consultas": resumen.consultas,
+                "ms_execute": round(resumen.seg_execute * 1000, 1),
+                "ms_fetch": round(resumen.seg_fetch * 1000, 1),
+                "filas": resumen.filas,
+            }, ensure_ascii=False))
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+# backend/proyeccion.py
+"""
+Registro de modelos de proyección de ventas.
+
+Los modelos de todas las sucursales se entrenan una sola vez por versión de
+los datos históricos (identificada por su ETag) y sus parámetros se guardan
+en disco. Las proyecciones se sirven luego por simple búsqueda en el registro,
+sin volver a entrenar cuando cambia la selección de sucursales.
+
+Todas las sucursales comparten la misma matriz (fechas x sucursales) de
+ventas, por lo que cada modelo se ajusta para todas las sucursales a la vez:
+las regresiones resuelven un sistema de mínimos cuadrados apilado y
+Holt-Winters recorre las fechas actualizando el estado de todas las
+sucursales en paralelo.
+
+Al entrenar se ejecuta un backtest de origen móvil (rolling origin) sobre el
+histórico en caché; cada sucursal usa el modelo con menor WAPE.
+
+Backtest offline sobre el último histórico en caché:
+    python backend/proyeccion.py --backtest --folds 3 --horizonte 28
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Carpeta local donde se guardan los parámetros entrenados y el histórico
+REGISTRY_DIR = Path(__file__).parent / ".cache" / "proyeccion"
+
+# Características de la regresión lineal original (en este orden)
+FEATURES = ['tiempo', 'mes', 'dia_de_la_semana', 'dia_del_año', 'semana_del_año']
+
+# Mínimo de días con datos para entrenar una sucursal
+MIN_DIAS_ENTRENAMIENTO = 30
+
+# Parámetros por defecto del backtest de origen móvil
+BACKTEST_FOLDS = 3
+BACKTEST_HORIZONTE = 28
+
+
+def compute_etag(content: bytes) -> str:
+    """Calcula un ETag fuerte a partir de la huella de los datos de origen."""
+    return hashlib.sha1(content).hexdigest()
+
+
+def design_matrix(fechas, origen):
+    """
+    Matriz (fechas x [intercepto] + FEATURES) para un índice de fechas único.
+    Se calcula una sola vez y la comparten todas las sucursales.
+    """
+    fechas = pd.DatetimeIndex(fechas)
+    return np.column_stack([
+        np.ones(len(fechas)),
+        (fechas - pd.Timestamp(origen)).days,
+        fechas.month,
+        fechas.dayofweek,
+        fechas.dayofyear,
+        fechas.isocalendar().week.to_numpy(dtype=int),
+    ]).astype(float)
+
+
+def seasonal_design_matrix(fechas, origen, armonicos=3):
+    """
+    Matriz de regresión estacional: intercepto, tendencia, día de la semana en
+    one-hot (lunes como base) y términos de Fourier para la estacionalidad anual.
+    """
+    fechas = pd.DatetimeIndex(fechas)
+    tiempo = (fechas - pd.Timestamp(origen)).days.to_numpy(dtype=float)
+    dia_semana = np.eye(7)[fechas.dayofweek][:, 1:]
+    angulo = 2 * np.pi * fechas.dayofyear.to_numpy(dtype=float) / 365.25
+    fourier = [f(k * angulo) for k in range(1, armonicos + 1) for f in (np.sin, np.cos)]
+    return np.column_stack([np.ones(len(fechas)), tiempo, dia_semana, *fourier])
+
+
+def solve_masked(X, Y, mask):
+    """
+    Resuelve la regresión de todas las sucursales en un solo paso.
+
+    Para cada sucursal b se arma X'M_bX y X'M_by con einsum (M_b es la máscara
+    de días observados) y se resuelve el lote completo con una pseudo-inversa
+    apilada, equivalente a un lstsq por sucursal. Las columnas (salvo el
+    intercepto, la primera) se estandarizan para mantener el sistema bien
+    condicionado. Retorna beta (sucursales x columnas) en la escala original.
+    """
+    mask = mask.astype(float)
+    mu = X[:, 1:].mean(axis=0)
+    sigma = X[:, 1:].std(axis=0)
+    sigma[sigma == 0] = 1.0
+    Z = X.copy()
+    Z[:, 1:] = (X[:, 1:] - mu) / sigma
+
+    ZtZ = np.einsum('db,di,dj->bij', mask, Z, Z, optimize=True)
+    ZtY = np.einsum('db,di->bi', mask * Y, Z, optimize=True)
+    beta = np.einsum('bij,bj->bi', np.linalg.pinv(ZtZ), ZtY)
+
+    coef = beta[:, 1:] / sigma
+    intercept = beta[:, 0] - coef @ mu
+    return np.column_stack([intercept, coef])
+
+
+# --- MODELOS ---
+
+class ForecastModel:
+    """
+    Interfaz de los modelos de proyección. Un modelo se ajusta para todas las
+    sucursales a la vez sobre la matriz Y (fechas x sucursales) y su máscara de
+    días observados, y proyecta una matriz (sucursales x fechas futuras).
+    """
+    name = ''
+    label = ''
+
+    def fit(self, fechas, Y, mask):
+        raise NotImplementedError
+
+    def predict(self, future_dates):
+        raise NotImplementedError
+
+    def get_params(self):
+        """Parámetros ajustados como arreglos de NumPy (para guardarlos en disco)."""
+        raise NotImplementedError
+
+    @classmethod
+    def from_params(cls, params):
+        raise NotImplementedError
+
+
+class LinearTrendModel(ForecastModel):
+    """Regresión lineal sobre las características de calendario originales."""
+    name = 'lineal'
+    label = 'Regresión lineal'
+
+    def _design(self, fechas):
+        return design_matrix(fechas, self.origen)
+
+    def fit(self, fechas, Y, mask):
+        self.origen = pd.Timestamp(fechas[0])
+        self.beta = solve_masked(self._design(fechas), Y, mask)
+        return self
+
+    def predict(self, future_dates):
+        return self.beta @ self._design(future_dates).T
+
+    def get_params(self):
+        return {'origen': np.datetime64(self.origen, 'D'), 'beta': self.beta}
+
+    @classmethod
+    def from_params(cls, params):
+        model = cls()
+        model.origen = pd.Timestamp(params['origen'][()])
+        model.beta = params['beta']
+        return model
+
+
+class SeasonalRegressionModel(LinearTrendModel):
+    """Regresión con tendencia, día de la semana one-hot y Fourier anual."""
+    name = 'estacional'
+    label = 'Regresión estacional'
+
+    def _design(self, fechas):
+        return seasonal_design_matrix(fechas, self.origen)
+
+
+class HoltWintersModel(ForecastModel):
+    """
+    Holt-Winters aditivo con tendencia amortiguada y estacionalidad semanal.
+    La recursión avanza fecha a fecha con el estado de todas las sucursales
+    vectorizado; los días sin datos solo propagan el nivel y la tendencia.
+    """
+    name = 'holt_winters'
+    label = 'Holt-Winters'
+
+    def __init__(self, alpha=0.2, beta=0.02, gamma=0.15, phi=0.98, dias_inicio=28):
+        self.alpha, self.beta, self.gamma, self.phi = alpha, beta, gamma, phi
+        self.dias_inicio = dias_inicio
+
+    def fit(self, fechas, Y, mask):
+        fechas = pd.DatetimeIndex(fechas)
+        dow = fechas.dayofweek.to_numpy()
+        mask = mask.astype(bool)
+
+        # Estado inicial: promedio y perfil semanal de los primeros días observados
+        inicio = mask & (np.cumsum(mask, axis=0) <= self.dias_inicio)
+        n_inicio = np.maximum(inicio.sum(axis=0), 1)
+        level = (Y * inicio).sum(axis=0) / n_inicio
+        season = np.zeros((Y.shape[1], 7))
+        for w in range(7):
+            sel = inicio & (dow == w)[:, None]
+            cnt = sel.sum(axis=0)
+            season[:, w] = np.where(cnt > 0, (Y * sel).sum(axis=0) / np.maximum(cnt, 1) - level, 0.0)
+        trend = np.zeros(Y.shape[1])
+
+        a, b, g, phi = self.alpha, self.beta, self.gamma, self.phi
+        for d in range(len(fechas)):
+            w, y, m = dow[d], Y[d], mask[d]
+            level_pred = level + phi * trend
+            new_level = a * (y - season[:, w]) + (1 - a) * level_pred
+            new_trend = b * (new_level - level) + (1 - b) * phi * trend
+            new_season = g * (y - new_level) + (1 - g) * season[:, w]
+            level = np.where(m, new_level, level_pred)
+            trend = np.where(m, new_trend, phi * trend)
+            season[:, w] = np.where(m, new_season, season[:, w])
+
+        self.level, self.trend, self.season = level, trend, season
+        self.last_date = fechas[-1]
+        return self
+
+    def predict(self, future_dates):
+        future_dates = pd.DatetimeIndex(future_dates)
+        h = (future_dates - self.last_date).days.to_numpy(dtype=float)
+        phi = self.phi
+        damp = h if phi == 1 else phi * (1 - phi ** h) / (1 - phi)
+        return (self.level[:, None] + self.trend[:, None] * damp[None, :]
+                + self.season[:, future_dates.dayofweek.to_numpy()])
+
+    def get_params(self):
+        return {
+            'level': self.level, 'trend': self.trend, 'season': self.season,
+            'last_date': np.datetime64(self.last_date, 'D'),
+            'hiper': np.array([self.alpha, self.beta, self.gamma, self.phi]),
+        }
+
+    @classmethod
+    def from_params(cls, params):
+        model = cls(*params['hiper'])
+        model.level, model.trend, model.season = params['level'], params['trend'], params['season']
+        model.last_date = pd.Timestamp(params['last_date'][()])
+        return model
+
+
+# Modelos disponibles; el primero se usa cuando una sucursal no tiene backtest
+MODELOS = {model.name: model for model in (LinearTrendModel, SeasonalRegressionModel, HoltWintersModel)}
+
+
+# --- HISTÓRICO Y BACKTEST ---
+
+def history_matrix(df):
+    """
+    Pivotea el histórico a una matriz (fechas x sucursales) sobre el calendario
+    diario completo. Retorna (fechas, branches, Y, mask).
+    """
+    wide = df.pivot_table(index='fecha', columns='branch_office', values='total_venta', aggfunc='sum')
+    wide = wide.reindex(pd.date_range(wide.index.min(), wide.index.max(), freq='D'))
+    mask = wide.notna().to_numpy()
+    return wide.index, wide.columns.tolist(), np.nan_to_num(wide.to_numpy(dtype=float)), mask
+
+
+def _backtest_fold(model_name, fechas, Y, mask, cutoff, horizonte):
+    """
+    Entrena 'model_name' con los datos anteriores a 'cutoff' y evalúa los
+    'horizonte' días siguientes. Retorna las sumas por sucursal necesarias
+    para calcular WAPE y MAPE.
+    """
+    train_mask = mask[:cutoff]
+    model = MODELOS[model_name]().fit(fechas[:cutoff], Y[:cutoff], train_mask)
+    pred = model.predict(fechas[cutoff:cutoff + horizonte]).T
+
+    real = Y[cutoff:cutoff + horizonte]
+    test_mask = mask[cutoff:cutoff + horizonte] & (train_mask.sum(axis=0) >= MIN_DIAS_ENTRENAMIENTO)
+    error = np.abs(real - np.maximum(0, pred)) * test_mask
+    ape_mask = test_mask & (real > 0)
+    ape = np.divide(error, np.abs(real), out=np.zeros_like(error), where=ape_mask)
+    return (
+        model_name,
+        error.sum(axis=0),
+        (np.abs(real) * test_mask).sum(axis=0),
+        ape.sum(axis=0),
+        ape_mask.sum(axis=0),
+    )
+
+
+def backtest(fechas, Y, mask, folds=BACKTEST_FOLDS, horizonte=BACKTEST_HORIZONTE, max_workers=None):
+    """
+    Backtest de origen móvil de todos los modelos sobre todas las sucursales.
+
+    Cada combinación (modelo, corte) se ejecuta en un pool de procesos.
+    Retorna un arreglo (modelos x sucursales x 2) con [WAPE, MAPE] en
+    porcentaje; NaN cuando la sucursal no tiene datos suficientes.
+    """
+    cortes = [len(fechas) - k * horizonte for k in range(folds, 0, -1)]
+    cortes = [c for c in cortes if c >= MIN_DIAS_ENTRENAMIENTO]
+    nombres = list(MODELOS)
+    acumulado = {name: np.zeros((4, Y.shape[1])) for name in nombres}
+    tareas = [(name, fechas, Y, mask, c, horizonte) for name in nombres for c in cortes]
+
+    if max_workers == 1 or len(tareas) <= 1:
+        resultados = [_backtest_fold(*t) for t in tareas]
+    else:
+        workers = max_workers or min(len(tareas), os.cpu_count() or 1)
+        # 'spawn': el backend es un proceso con varios hilos (uvicorn, worker) y fork solo copia el actual
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            resultados = list(pool.map(_backtest_fold, *zip(*tareas)))
+
+    for name, err, real, ape, n_ape in resultados:
+        acumulado[name] += np.vstack([err, real, ape, n_ape])
+
+    scores = np.full((len(nombres), Y.shape[1], 2), np.nan)
+    for i, name in enumerate(nombres):
+        err, real, ape, n_ape = acumulado[name]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores[i, :, 0] = np.where(real > 0, err / real * 100, np.nan)
+            scores[i, :, 1] = np.where(n_ape > 0, ape / n_ape * 100, np.nan)
+    return scores
+
+
+def best_models(scores):
+    """Índice del modelo con menor WAPE por sucursal (el primero si no hay backtest)."""
+    wape = np.where(np.isnan(scores[:, :, 0]), np.inf, scores[:, :, 0])
+    return wape.argmin(axis=0)
+
+
+# --- REGISTRO ---
+
+class ModelRegistry:
+    """
+    Modelos ajustados de todas las sucursales para una versión de los datos,
+    junto con los resultados del backtest y el modelo elegido por sucursal.
+    """
+
+    def __init__(self, etag, last_date, branches, models, scores, choice, skipped=None):
+        self.etag = etag
+        self.last_date = pd.Timestamp(last_date)
+        self.branches = list(branches)
+        self.models = models
+        self.scores = np.asarray(scores, dtype=float)
+        self.choice = np.asarray(choice, dtype=int)
+        self.skipped = list(skipped or [])
+        self._index = {branch: i for i, branch in enumerate(self.branches)}
+
+    def __contains__(self, branch):
+        return branch in self._index
+
+    @staticmethod
+    def path_for(etag):
+        return REGISTRY_DIR / f"modelos_{etag}.npz"
+
+    @staticmethod
+    def history_path_for(etag):
+        return REGISTRY_DIR / f"historia_{etag}.npz"
+
+    @classmethod
+    def train(cls, df, etag, max_workers=None):
+        """Entrena y evalúa todos los modelos de todas las sucursales sobre el histórico completo."""
+        fechas, branches, Y, mask = history_matrix(df)
+        keep = mask.sum(axis=0) >= MIN_DIAS_ENTRENAMIENTO
+        skipped = [b for b, k in zip(branches, keep) if not k]
+        branches = [b for b, k in zip(branches, keep) if k]
+        Y, mask = Y[:, keep], mask[:, keep]
+        save_history(etag, fechas, branches, Y, mask)
+
+        models = {name: model().fit(fechas, Y, mask) for name, model in MODELOS.items()}
+        scores = backtest(fechas, Y, mask, max_workers=max_workers)
+        return cls(etag, fechas[-1], branches, models, scores, best_models(scores), skipped)
+
+    def save(self):
+        """Guarda los parámetros en disco y elimina los de versiones anteriores."""
+        REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+        for antiguo in REGISTRY_DIR.glob("*.npz"):
+            if antiguo not in (self.path_for(self.etag), self.history_path_for(self.etag)):
+                antiguo.unlink(missing_ok=True)
+        arrays = {
+            f"{name}__{key}": value
+            for name, model in self.models.items()
+            for key, value in model.get_params().items()
+        }
+        np.savez(
+            self.path_for(self.etag),
+            last_date=np.datetime64(self.last_date, 'D'),
+            branches=np.array(self.branches, dtype=str),
+            skipped=np.array(self.skipped, dtype=str),
+            scores=self.scores,
+            choice=self.choice,
+            **arrays,
+        )
+
+    @classmethod
+    def load(cls, etag):
+        """Carga el registro de la versión 'etag' desde disco, o None si no existe."""
+        path = cls.path_for(etag)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                models = {}
+                for name, model in MODELOS.items():
+                    params = {k.split('__', 1)[1]: data[k] for k in data.files if k.startswith(f"{name}__")}
+                    models[name] = model.from_params(params)
+                return cls(
+                    etag,
+                    data['last_date'][()],
+                    data['branches'].tolist(),
+                    models,
+                    data['scores'],
+                    data['choice'],
+                    data['skipped'].tolist(),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def load_or_train(cls, df, etag):
+        """Devuelve el registro de la versión 'etag', entrenándolo solo si no está en disco."""
+        registry = cls.load(etag)
+        if registry is None:
+            registry = cls.train(df, etag)
+            registry.save()
+        return registry
+
+    def chosen_model(self, branch):
+        """Nombre del modelo elegido por el backtest para la sucursal."""
+        return list(self.models)[self.choice[self._index[branch]]]
+
+    def predict(self, branches, projection_days, modelo=None):
+        """
+        Proyecta las ventas de las sucursales indicadas para los próximos días.
+        Si 'modelo' es None se usa el mejor modelo de cada sucursal.
+        Retorna un DataFrame en formato largo (fecha, branch_office, proyeccion_venta, modelo).
+        """
+        branches = [branch for branch in branches if branch in self]
+        if not branches:
+            return pd.DataFrame(columns=['fecha', 'branch_office', 'proyeccion_venta', 'modelo'])
+
+        future_dates = pd.date_range(self.last_date + timedelta(days=1), periods=projection_days, freq='D')
+        rows = np.array([self._index[branch] for branch in branches])
+        nombres = list(self.models)
+        if modelo is None:
+            elegido = self.choice[rows]
+        else:
+            elegido = np.full(len(rows), nombres.index(modelo))
+
+        # (sucursales x días), evaluando solo los modelos que se usan
+        predicted = np.zeros((len(rows), projection_days))
+        for i in np.unique(elegido):
+            sel = elegido == i
+            predicted[sel] = self.models[nombres[i]].predict(future_dates)[rows[sel]]
+        # Aseguramos que las ventas proyectadas no sean negativas
+        predicted = np.maximum(0, predicted)
+
+        return pd.DataFrame({
+            'fecha': np.tile(future_dates.to_numpy(), len(branches)),
+            'branch_office': np.repeat(branches, projection_days),
+            'proyeccion_venta': predicted.ravel(),
+            'modelo': np.repeat([nombres[i] for i in elegido], projection_days),
+        })
+
+    def backtest_summary(self):
+        """Tabla por sucursal con WAPE/MAPE de cada modelo y el modelo elegido."""
+        labels = [MODELOS[name].label for name in self.models]
+        columnas = {'branch_office': self.branches}
+        for i, label in enumerate(labels):
+            columnas[f"WAPE {label} (%)"] = self.scores[i, :, 0]
+            columnas[f"MAPE {label} (%)"] = self.scores[i, :, 1]
+        columnas['modelo_elegido'] = [labels[i] for i in self.choice]
+        return pd.DataFrame(columnas)
+
+
+def save_history(etag, fechas, branches, Y, mask):
+    """Guarda la matriz de histórico usada para entrenar (para backtests offline)."""
+    REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(
+        ModelRegistry.history_path_for(etag),
+        fechas=fechas.to_numpy().astype('datetime64[D]'),
+        branches=np.array(branches, dtype=str),
+        Y=Y,
+        mask=mask,
+    )
+
+
+def _read_history(path):
+    with np.load(path) as data:
+        return pd.DatetimeIndex(data['fechas']), data['branches'].tolist(), data['Y'], data['mask']
+
+
+def load_history(etag):
+    """Carga el histórico en caché de la versión 'etag'. Retorna (fechas, branches, Y, mask) o None."""
+    path = ModelRegistry.history_path_for(etag)
+    if not path.exists():
+        return None
+    try:
+        return _read_history(path)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_latest_history():
+    """Carga el histórico en caché más reciente. Retorna (fechas, branches, Y, mask) o None."""
+    archivos = sorted(REGISTRY_DIR.glob("historia_*.npz"), key=lambda p: p.stat().st_mtime)
+    if not archivos:
+        return None
+    return _read_history(archivos[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest offline de los modelos de proyección.")
+    parser.add_argument('--backtest', action='store_true', help="Ejecuta el backtest sobre el histórico en caché")
+    parser.add_argument('--folds', type=int, default=BACKTEST_FOLDS)
+    parser.add_argument('--horizonte', type=int, default=BACKTEST_HORIZONTE)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    if not args.backtest:
+        parser.print_help()
+        return
+
+    historia = load_latest_history()
+    if historia is None:
+        print(f"No hay histórico en caché en {REGISTRY_DIR}. Inicie el backend para generarlo.")
+        return
+    fechas, branches, Y, mask = historia
+    scores = backtest(fechas, Y, mask, folds=args.folds, horizonte=args.horizonte, max_workers=args.workers)
+    modelos = {name: model() for name, model in MODELOS.items()}
+    registry = ModelRegistry('offline', fechas[-1], branches, modelos, scores, best_models(scores))
+    resumen = registry.backtest_summary()
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(resumen.round(2).to_string(index=False))
+        print()
+        print(resumen['modelo_elegido'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+# backend/proyeccion_worker.py
+"""
+Servicio de proyección de ventas del backend.
+
+Mantiene en memoria el registro de modelos vigente y la matriz de ventas
+diarias por sucursal. Un hilo en segundo plano revisa periódicamente la
+versión de CABECERA_TRANSACCIONES en DATA_VERSION (sin versión registrada,
+una huella con MAX(id), MAX(date), COUNT(*) y la suma de ventas); cuando
+cambia, por ejemplo tras la carga nocturna que reescribe filas existentes,
+vuelve a consultar el histórico y reentrena los modelos. Si el registro de
+esa versión ya está en disco, se reutiliza sin reentrenar.
+
+El entrenamiento ocurre solo en ese hilo: mientras no hay un registro
+cargado (proceso recién iniciado), ensure_ready() lanza ModelosNoDisponibles
+y los endpoints responden 503.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from database import get_connection, close_connection, create_cursor
+from proyeccion import ModelRegistry, compute_etag, load_history
+from versiones_datos import registro_versiones
+
+logger = logging.getLogger(__name__)
+
+# Minutos entre revisiones de la huella de datos
+INTERVALO_MINUTOS = float(os.getenv('PROYECCION_INTERVALO_MIN', '15'))
+
+TABLA_VENTAS = "CABECERA_TRANSACCIONES"
+
+# Huella de respaldo si la tabla aún no tiene versión en DATA_VERSION
+HUELLA_QUERY = """
+    SELECT MAX(id) AS max_id, MAX(date) AS max_fecha, COUNT(*) AS filas, SUM(cash_amount + card_amount) AS total
+    FROM CABECERA_TRANSACCIONES
+"""
+
+HISTORIA_QUERY = """
+    SELECT
+        ct.date AS fecha,
+        s.branch_office,
+        SUM(ct.cash_amount + ct.card_amount) AS total_venta
+    FROM
+        CABECERA_TRANSACCIONES ct
+    JOIN
+        QRY_BRANCH_OFFICES s ON ct.branch_office_id = s.id
+    WHERE
+        s.status_id = 7
+    GROUP BY
+        ct.date,
+        s.branch_office
+"""
+
+
+class ModelosNoDisponibles(Exception):
+    """Aún no hay modelos cargados: el hilo de fondo los está preparando."""
+
+
+class ProjectionService:
+    """Registro de modelos vigente y su refresco en segundo plano."""
+
+    def __init__(self, intervalo_minutos=INTERVALO_MINUTOS):
+        self.intervalo = intervalo_minutos * 60
+        self.registry = None
+        self.historia = None  # (fechas, branches, Y, mask)
+        self.huella = None
+        self.actualizado = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Acceso a la base de datos ---
+
+    def _consultar(self, query):
+        cnx = get_connection('default')
+        if not cnx:
+            raise RuntimeError("Error de conexión a la base de datos")
+        try:
+            cursor = create_cursor(cnx)
+            cursor.execute(query)
+            return cursor.fetchall()
+        finally:
+            close_connection(cnx)
+
+    def _huella_actual(self):
+        version = registro_versiones.versiones().get(TABLA_VENTAS)
+        if version is not None:
+            return f"v{version}"
+        fila = self._consultar(HUELLA_QUERY)[0]
+        return f"{fila['max_id']}|{fila['max_fecha']}|{fila['filas']}|{fila['total']}"
+
+    def _cargar_historia(self):
+        df = pd.DataFrame(self._consultar(HISTORIA_QUERY), columns=['fecha', 'branch_office', 'total_venta'])
+        df['fecha'] = pd.to_datetime(df['fecha'])
+        df['total_venta'] = pd.to_numeric(df['total_venta'], errors='coerce')
+        return df.dropna()
+
+    # --- Refresco ---
+
+    def refresh(self, force=False):
+        """
+        Reentrena si cambió la huella de los datos (o si 'force').
+        Retorna True si se cargó una nueva versión del registro.
+        """
+        with self._refresh_lock:
+            huella = self._huella_actual()
+            if not force and self.registry is not None and huella == self.huella:
+                return False
+
+            etag = compute_etag(huella.encode('utf-8'))
+            registry = None if force else ModelRegistry.load(etag)
+            historia = None if force else load_history(etag)
+            if registry is None or historia is None:
+                logger.info("Entrenando modelos de proyección para la versión %s", etag)
+                registry = ModelRegistry.train(self._cargar_historia(), etag)
+                registry.save()
+                historia = load_history(etag)
+
+            # Intercambio atómico de referencias: las consultas en curso no se bloquean
+            self.registry, self.historia = registry, historia
+            self.huella, self.actualizado = huella, datetime.now()
+            return True
+
+    def ensure_ready(self):
+        """Registro vigente; ModelosNoDisponibles mientras el hilo de fondo lo prepara."""
+        if self.registry is None:
+            self.start()
+            raise ModelosNoDisponibles("Modelos de proyección en preparación, intente en unos minutos")
+        return self.registry
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.refresh():
+                    logger.info("Modelos de proyección actualizados (%s)", self.registry.etag)
+            except Exception as e:
+                logger.error(f"Error al refrescar los modelos de proyección: {e}")
+            self._stop.wait(self.intervalo)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="proyeccion-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Consultas ---
+
+    def history_tail(self, branches, dias):
+        """Últimos 'dias' del histórico de las sucursales indicadas, en formato largo."""
+        fechas, all_branches, Y, mask = self.historia
+        index = {branch: i for i, branch in enumerate(all_branches)}
+        cols = np.array([index[b] for b in branches if b in index], dtype=int)
+        if dias <= 0 or cols.size == 0:
+            return pd.DataFrame(columns=['fecha', 'branch_office', 'total_venta'])
+
+        fechas, Y, mask = fechas[-dias:], Y[-dias:, cols], mask[-dias:, cols]
+        nombres = np.array(all_branches, dtype=object)[cols]
+        df = pd.DataFrame({
+            'fecha': np.repeat(fechas.to_numpy(), len(cols)),
+            'branch_office': np.tile(nombres, len(fechas)),
+            'total_venta': Y.ravel(),
+        })
+        return df[mask.ravel()].reset_index(drop=True)
+
+
+servicio_proyeccion = ProjectionService()
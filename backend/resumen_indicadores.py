@@ -0,0 +1,216 @@
+# backend/resumen_indicadores.py
+"""
+Resumen mensual de los indicadores económicos (DM_INDICADORES_MES).
+
+/uf buscaba el último día de cada mes con un MAX(fecha) GROUP BY
+YEAR(fecha), MONTH(fecha) sobre toda la historia de DM_uf, y /dolar y /euro
+promediaban el año agrupando por expresiones CONCAT. Los valores mensuales
+ahora se calculan una vez, al cargar el indicador (pages/cargas.py y
+pages/cargas_indicadores.py llaman a actualizar_resumen en la misma
+transacción), y los endpoints leen las filas del año por clave primaria
+(indicador, year, month).
+
+GET /indicadores entrega en una sola respuesta varias series mensuales
+(series()) y el último valor diario de cada indicador (ultimos_valores()),
+todo desde la base local. /ipc agrega el acumulado del año o de 12 meses con
+SUM() OVER sobre el resumen (serie_acumulada()).
+
+Las funciones reciben el cursor: las usan tanto el backend como las páginas
+de carga, que agregan el directorio backend al PYTHONPATH.
+"""
+from datetime import date
+
+# Indicador -> valor mensual que se publica, decimales con que se redondea y unidad
+INDICADORES = {
+    "uf": {"medida": "valor_cierre", "decimales": 0, "unidad": "Pesos"},
+    "dolar": {"medida": "promedio", "decimales": 0, "unidad": "Pesos"},
+    "euro": {"medida": "promedio", "decimales": 0, "unidad": "Pesos"},
+    "ipc": {"medida": "valor_cierre", "decimales": 2, "unidad": "Porcentaje"},
+    "tasa_desempleo": {"medida": "valor_cierre", "decimales": 2, "unidad": "Porcentaje"},
+    "imacec": {"medida": "valor_cierre", "decimales": 2, "unidad": "Porcentaje"},
+    "utm": {"medida": "valor_cierre", "decimales": 0, "unidad": "Pesos"},
+    "tpm": {"medida": "valor_cierre", "decimales": 2, "unidad": "Porcentaje"},
+}
+
+# Series del gráfico de la página de indicadores (GET /indicadores sin 'series')
+SERIES_POR_DEFECTO = ("uf", "dolar", "euro", "ipc", "imacec", "tasa_desempleo")
+
+# Ventanas de acumulación de serie_acumulada(): del año en curso o de los últimos 12 meses
+VENTANAS_ACUMULADO = {
+    "anual": "PARTITION BY year ORDER BY year * 12 + month",
+    "12m": "ORDER BY year * 12 + month RANGE BETWEEN 11 PRECEDING AND CURRENT ROW",
+}
+
+# Una fila por mes de DM_<indicador> entre dos fechas: último valor del mes y estadísticas
+_MESES_SQL = """
+    SELECT year, month, fecha AS fecha_cierre, valor AS valor_cierre, promedio, minimo, maximo, observaciones
+    FROM (
+        SELECT
+            YEAR(fecha) AS year,
+            MONTH(fecha) AS month,
+            fecha,
+            valor,
+            AVG(valor) OVER mes AS promedio,
+            MIN(valor) OVER mes AS minimo,
+            MAX(valor) OVER mes AS maximo,
+            COUNT(*) OVER mes AS observaciones,
+            ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+        FROM DM_{indicador}
+        WHERE fecha >= %s AND fecha < %s
+        WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+    ) AS dias
+    WHERE orden = 1
+"""
+
+_ACTUALIZAR_SQL = """
+    INSERT INTO DM_INDICADORES_MES
+        (indicador, year, month, fecha_cierre, valor_cierre, promedio, minimo, maximo, observaciones, updated_at)
+    SELECT %s, year, month, fecha_cierre, valor_cierre, promedio, minimo, maximo, observaciones, NOW()
+    FROM ({meses}) AS meses
+    ON DUPLICATE KEY UPDATE
+        fecha_cierre = VALUES(fecha_cierre),
+        valor_cierre = VALUES(valor_cierre),
+        promedio = VALUES(promedio),
+        minimo = VALUES(minimo),
+        maximo = VALUES(maximo),
+        observaciones = VALUES(observaciones),
+        updated_at = NOW()
+"""
+
+
+def _rango_meses(desde, hasta):
+    """[primer día del mes de 'desde', primer día del mes siguiente a 'hasta')."""
+    inicio = date(desde.year, desde.month, 1)
+    fin = date(hasta.year + hasta.month // 12, hasta.month % 12 + 1, 1)
+    return inicio, fin
+
+
+def actualizar_resumen(cursor, indicador, desde, hasta):
+    """
+    Recalcula en DM_INDICADORES_MES los meses de 'indicador' entre las fechas
+    'desde' y 'hasta' (los meses completos que las contienen).
+    """
+    meses = _MESES_SQL.format(indicador=indicador)
+    cursor.execute(_ACTUALIZAR_SQL.format(meses=meses), (indicador, *_rango_meses(desde, hasta)))
+
+
+def _periodo(year, month):
+    return f"{year:04d}-{month:02d}"
+
+
+def _valor(indicador):
+    config = INDICADORES[indicador]
+    return f"ROUND({config['medida']}, {config['decimales']})"
+
+
+def _meses_base(cursor, indicador, desde, hasta):
+    """[(year, month, valor)] calculados desde DM_<indicador> (resumen aún sin esas filas)."""
+    cursor.execute(f"""
+        SELECT year, month, {_valor(indicador)} AS valor
+        FROM ({_MESES_SQL.format(indicador=indicador)}) AS meses
+        ORDER BY year, month
+    """, (desde, hasta))
+    return [(fila['year'], fila['month'], fila['valor']) for fila in cursor.fetchall()]
+
+
+def series(cursor, indicadores, desde, hasta):
+    """
+    Valores mensuales de 'indicadores' entre los meses 'desde' y 'hasta'
+    (tuplas (year, month), ambos incluidos) en una tabla ancha:
+    {"columns": ["periodo", *indicadores], "data": [[periodo, valor, ...], ...]}.
+    Un solo recorrido de la clave primaria de DM_INDICADORES_MES; los
+    indicadores que el resumen aún no tiene se calculan desde su tabla.
+    """
+    casos = " ".join(f"WHEN '{indicador}' THEN {_valor(indicador)}" for indicador in indicadores)
+    marcadores = ", ".join(["%s"] * len(indicadores))
+    cursor.execute(f"""
+        SELECT indicador, year, month, CASE indicador {casos} END AS valor
+        FROM DM_INDICADORES_MES
+        WHERE indicador IN ({marcadores})
+          AND year BETWEEN %s AND %s
+          AND year * 100 + month BETWEEN %s AND %s
+    """, (*indicadores, desde[0], hasta[0], desde[0] * 100 + desde[1], hasta[0] * 100 + hasta[1]))
+    por_indicador = {indicador: {} for indicador in indicadores}
+    for fila in cursor.fetchall():
+        por_indicador[fila['indicador']][_periodo(fila['year'], fila['month'])] = fila['valor']
+
+    rango = _rango_meses(date(*desde, 1), date(*hasta, 1))
+    for indicador, valores in por_indicador.items():
+        if not valores:
+            valores.update((_periodo(y, m), v) for y, m, v in _meses_base(cursor, indicador, *rango))
+
+    periodos = sorted(set().union(*por_indicador.values())) if por_indicador else []
+    return {
+        "columns": ["periodo", *indicadores],
+        "data": [[periodo, *(por_indicador[i].get(periodo) for i in indicadores)] for periodo in periodos]
+    }
+
+
+def serie_mensual(cursor, indicador, year=None):
+    """{"columns": ["periodo", "valor"], "data"} del año pedido (o el actual)."""
+    year = year or date.today().year
+    resultado = series(cursor, [indicador], (year, 1), (year, 12))
+    return {"columns": ["periodo", "valor"], "data": [fila for fila in resultado["data"] if fila[1] is not None]}
+
+
+def serie_acumulada(cursor, indicador, year=None, ventana="anual"):
+    """
+    {"columns": ["periodo", "valor", "acumulado"], "data"} del año pedido (o
+    el actual): el valor de cada mes y su suma en la ventana de
+    VENTANAS_ACUMULADO. Para '12m' se leen también los 11 meses anteriores.
+    """
+    year = year or date.today().year
+    decimales = INDICADORES[indicador]["decimales"]
+    desde = year - 1 if ventana == "12m" else year
+    cursor.execute("""
+        SELECT indicador FROM DM_INDICADORES_MES
+        WHERE indicador = %s AND year BETWEEN %s AND %s
+        LIMIT 1
+    """, (indicador, desde, year))
+    if cursor.fetchall():
+        meses, params = f"""
+            SELECT year, month, {INDICADORES[indicador]['medida']} AS valor
+            FROM DM_INDICADORES_MES
+            WHERE indicador = %s AND year BETWEEN %s AND %s
+        """, (indicador, desde, year)
+    else:
+        # Resumen aún sin esos años: los meses salen de DM_<indicador>
+        meses = f"SELECT year, month, {INDICADORES[indicador]['medida']} AS valor FROM ({_MESES_SQL.format(indicador=indicador)}) AS base"
+        params = (date(desde, 1, 1), date(year + 1, 1, 1))
+    cursor.execute(f"""
+        SELECT CONCAT(year, '-', LPAD(month, 2, '0')) AS periodo, valor, acumulado
+        FROM (
+            SELECT
+                year,
+                month,
+                ROUND(valor, {decimales}) AS valor,
+                ROUND(SUM(valor) OVER ({VENTANAS_ACUMULADO[ventana]}), {decimales}) AS acumulado
+            FROM ({meses}) AS meses
+        ) AS ventana
+        WHERE year = %s
+        ORDER BY month
+    """, (*params, year))
+    return {
+        "columns": ["periodo", "valor", "acumulado"],
+        "data": [[fila['periodo'], fila['valor'], fila['acumulado']] for fila in cursor.fetchall()]
+    }
+
+
+def ultimos_valores(cursor, indicadores=tuple(INDICADORES)):
+    """
+    Último valor diario cargado de cada indicador, en una consulta (cada parte
+    lee una fila por el índice de fecha): {"columns": ["indicador", "fecha",
+    "valor", "unidad_medida"], "data"}.
+    """
+    partes = [
+        f"(SELECT '{indicador}' AS indicador, fecha, valor FROM DM_{indicador} ORDER BY fecha DESC LIMIT 1)"
+        for indicador in indicadores
+    ]
+    cursor.execute(" UNION ALL ".join(partes))
+    return {
+        "columns": ["indicador", "fecha", "valor", "unidad_medida"],
+        "data": [
+            [fila['indicador'], fila['fecha'], fila['valor'], INDICADORES[fila['indicador']]["unidad"]]
+            for fila in cursor.fetchall()
+        ]
+    }
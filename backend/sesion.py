@@ -0,0 +1,86 @@
+# backend/sesion.py
+"""
+Tokens de sesión firmados.
+
+/login verifica la clave con bcrypt una sola vez y entrega un token con el
+rut, nombre, rol y sucursales accesibles del usuario, firmado con HMAC-SHA256.
+Los endpoints validan el token sin consultar la base de datos: basta con
+revisar la firma y la expiración.
+
+Formato: base64url(payload JSON) + "." + base64url(firma).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+load_dotenv()
+
+# Clave compartida por todos los procesos de uvicorn (ver backend/.env.example).
+# Sin ella cada proceso generaría la suya: los tokens dejarían de valer al
+# reiniciar y fallarían de forma intermitente entre workers, así que es obligatoria.
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+if not SESSION_SECRET:
+    raise ValueError(
+        "Error Crítico: SESSION_SECRET no está definida en el archivo .env "
+        "(genere una con: python -c \"import secrets; print(secrets.token_urlsafe(32))\")."
+    )
+SESSION_TTL_HORAS = float(os.getenv('SESSION_TTL_HORAS', '12'))
+
+bearer = HTTPBearer(auto_error=False)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+
+def _b64decode(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _firmar(payload_b64):
+    return hmac.new(SESSION_SECRET.encode('utf-8'), payload_b64.encode('ascii'), hashlib.sha256).digest()
+
+
+def crear_token(rut, full_name, role, branch_ids):
+    """Token firmado con los datos de la sesión; retorna (token, expiración epoch)."""
+    exp = int(time.time() + SESSION_TTL_HORAS * 3600)
+    payload = {"rut": rut, "name": full_name, "role": role, "branches": list(branch_ids), "exp": exp}
+    payload_b64 = _b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return f"{payload_b64}.{_b64encode(_firmar(payload_b64))}", exp
+
+
+def verificar_token(token):
+    """Datos de la sesión si la firma es válida y no expiró; None en otro caso."""
+    try:
+        payload_b64, firma_b64 = token.split(".")
+        if not hmac.compare_digest(_firmar(payload_b64), _b64decode(firma_b64)):
+            return None
+        payload = json.loads(_b64decode(payload_b64))
+    except (ValueError, TypeError):
+        return None
+    if payload.get("exp", 0) < time.time():
+        return None
+    return payload
+
+
+def usuario_actual(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    """Dependencia de FastAPI: sesión del token 'Authorization: Bearer ...'."""
+    sesion = verificar_token(credentials.credentials) if credentials else None
+    if sesion is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión inválida o expirada",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return sesion
+
+
+def es_administrador(sesion):
+    return (sesion.get("role") or "").strip().lower() == 'administrador'
@@ -0,0 +1,224 @@
+# backend/versiones_datos.py
+"""
+Versiones de datos por tabla.
+
+Cada carga del ETL (frontend/pages/cargas.py) incrementa la versión de la
+tabla que reemplaza en DATA_VERSION (table_name, version, loaded_at). Con eso
+el backend arma ETags fuertes sin leer los datos: mientras no haya una carga
+nueva, la misma consulta entrega la misma respuesta y se puede contestar 304.
+
+La tabla DATA_VERSION se consulta completa (son pocas filas) y se guarda en
+memoria unos segundos para no agregar una consulta a cada request.
+
+Las mismas versiones son la clave de la caché de respuestas del backend
+(cache_por_version) y, vía GET /versions, de las cachés del frontend: los
+datos se guardan sin vencimiento y se invalidan cuando hay una carga nueva.
+
+La caché de respuestas tiene dos límites: CACHE_RESPUESTAS_POR_ENDPOINT
+respuestas por endpoint (una por sesión y parámetros: el administrador y
+cada supervisor ocupan una entrada distinta) y CACHE_RESPUESTAS_MAX_MB en
+total, medido como el tamaño de la respuesta en JSON. Así un endpoint muy
+consultado no desplaza a los demás, y la memoria usada tiene un tope fijo
+aunque las respuestas sean de un año completo.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from database import get_connection, close_connection, create_cursor
+from sesion import es_administrador
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutiliza la lectura de DATA_VERSION
+TTL_SEGUNDOS = float(os.getenv('DATA_VERSION_TTL_SEG', '5'))
+
+# Respuestas que se guardan en memoria como máximo por endpoint
+CACHE_RESPUESTAS_POR_ENDPOINT = int(os.getenv('CACHE_RESPUESTAS_POR_ENDPOINT', '16'))
+
+# Tamaño total de las respuestas guardadas (MB, estimado como JSON); las más antiguas se descartan primero
+CACHE_RESPUESTAS_MAX_MB = float(os.getenv('CACHE_RESPUESTAS_MAX_MB', '256'))
+
+# Tablas de las que depende cada endpoint. Solo se arma ETag si todas tienen versión.
+TABLAS_POR_ENDPOINT = {
+    "/abonados": ["CABECERA_ABONADOS"],
+    "/depositos": ["DETALLE_DEPOSITOS_DIA"],
+    "/recaudacion": ["DETALLE_RECAUDACION_DIA"],
+    "/venta_hora": ["DETALLE_VENTA_HORA"],
+    "/ingresos_acum_dia": ["KPI_INGRESOS_IMG_MES"],
+    "/ingresos_acum_dia_ppto": ["KPI_INGRESOS_IMG_MES"],
+    "/particiones": ["CABECERA_ABONADOS", "DETALLE_DEPOSITOS_DIA", "DETALLE_RECAUDACION_DIA", "KPI_INGRESOS_IMG_MES"],
+    "/ventas_historicas_diarias": ["CABECERA_TRANSACCIONES"],
+    "/asistencia_diaria": ["ASISTENCIA_DIARIA"],
+    "/inasistencias": ["INASISTENCIAS"],
+    "/uf": ["DM_uf"],
+    "/dolar": ["DM_dolar"],
+    "/euro": ["DM_euro"],
+    "/ipc": ["DM_ipc"],
+    "/tasa_desempleo": ["DM_tasa_desempleo"],
+    "/imacec": ["DM_imacec"],
+    "/indicadores": [f"DM_{indicador}" for indicador in ("uf", "dolar", "euro", "ipc", "tasa_desempleo", "imacec", "utm", "tpm")],
+    "/analitica/depositos_diarios": ["DETALLE_RECAUDACION_DIA", "DETALLE_DEPOSITOS_DIA"],
+}
+
+
+class RegistroVersiones:
+    """Lectura cacheada de DATA_VERSION."""
+
+    def __init__(self, ttl=TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._versiones = {}
+        self._leido = 0.0
+        self._lock = threading.Lock()
+
+    def _leer(self):
+        cnx = get_connection('default')
+        if not cnx:
+            raise RuntimeError("Error de conexión a la base de datos")
+        try:
+            cursor = create_cursor(cnx)
+            cursor.execute("SELECT table_name, version, loaded_at FROM DATA_VERSION")
+            return {row['table_name']: row for row in cursor.fetchall()}
+        finally:
+            close_connection(cnx)
+
+    def filas(self):
+        """{tabla: {'table_name', 'version', 'loaded_at'}}; vacío si no se pudo leer."""
+        with self._lock:
+            if time.monotonic() - self._leido > self.ttl:
+                try:
+                    self._versiones = self._leer()
+                except Exception as e:
+                    # Sin versiones no hay ETag: las respuestas se sirven completas
+                    logger.warning(f"No se pudo leer DATA_VERSION: {e}")
+                    self._versiones = {}
+                self._leido = time.monotonic()
+            return self._versiones
+
+    def versiones(self):
+        """{tabla: versión}."""
+        return {tabla: fila['version'] for tabla, fila in self.filas().items()}
+
+
+registro_versiones = RegistroVersiones()
+
+
+def version_endpoint(path, versiones):
+    """
+    Versión de los datos de 'path': 'fecha:v1.v2...' con las versiones de sus
+    tablas, o None si alguna no tiene versión. Incluye la fecha porque varios
+    endpoints filtran por CURDATE().
+    """
+    tablas = TABLAS_POR_ENDPOINT.get(path)
+    if not tablas or any(tabla not in versiones for tabla in tablas):
+        return None
+    return date.today().isoformat() + ":" + ".".join(str(versiones[t]) for t in tablas)
+
+
+def _clave_argumento(valor):
+    # La sesión entra a la clave solo por lo que cambia el resultado: el filtro de sucursales
+    if isinstance(valor, dict) and 'rut' in valor:
+        return "admin" if es_administrador(valor) else valor['rut']
+    return valor
+
+
+def _tamano_respuesta(respuesta):
+    """Bytes aproximados de una respuesta (su tamaño en JSON)."""
+    return len(json.dumps(respuesta, default=str, separators=(',', ':')))
+
+
+class CacheRespuestas:
+    """
+    LRU de respuestas por (endpoint, versión de los datos, argumentos), con
+    un máximo de entradas por endpoint y un máximo de bytes en total.
+    """
+
+    def __init__(self, max_por_endpoint=CACHE_RESPUESTAS_POR_ENDPOINT, max_bytes=CACHE_RESPUESTAS_MAX_MB * 1024 * 1024):
+        self.max_por_endpoint = max_por_endpoint
+        self.max_bytes = max_bytes
+        self._respuestas = OrderedDict()  # clave -> (respuesta, bytes), de la menos a la más usada
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            if clave not in self._respuestas:
+                return None
+            self._respuestas.move_to_end(clave)
+            return self._respuestas[clave][0]
+
+    def _eliminar(self, clave):
+        self._bytes -= self._respuestas.pop(clave)[1]
+
+    def guardar(self, clave, respuesta):
+        path, version = clave[0], clave[1]
+        tamano = _tamano_respuesta(respuesta)
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            # Las respuestas de versiones anteriores del mismo endpoint ya no se usarán
+            for vieja in [c for c in self._respuestas if c[0] == path and c[1] != version]:
+                self._eliminar(vieja)
+            if clave in self._respuestas:
+                self._eliminar(clave)
+            self._respuestas[clave] = (respuesta, tamano)
+            self._bytes += tamano
+            # Límite por endpoint: se descartan sus respuestas menos usadas
+            mismo_endpoint = [c for c in self._respuestas if c[0] == path]
+            for vieja in mismo_endpoint[:len(mismo_endpoint) - self.max_por_endpoint]:
+                self._eliminar(vieja)
+            while self._bytes > self.max_bytes:
+                self._eliminar(next(iter(self._respuestas)))
+
+    def limpiar(self):
+        with self._lock:
+            self._respuestas.clear()
+            self._bytes = 0
+
+
+cache_respuestas = CacheRespuestas()
+
+
+def cache_por_version(path):
+    """
+    Guarda la respuesta del endpoint 'path' mientras no cambie la versión de
+    sus tablas. Sin versión (tabla no registrada o DATA_VERSION inaccesible)
+    se consulta siempre la base de datos.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            version = version_endpoint(path, registro_versiones.versiones())
+            if version is None:
+                return funcion(*args, **kwargs)
+            clave = (
+                path,
+                version,
+                tuple(_clave_argumento(a) for a in args),
+                tuple(sorted((k, _clave_argumento(v)) for k, v in kwargs.items()))
+            )
+            respuesta = cache_respuestas.obtener(clave)
+            if respuesta is None:
+                respuesta = funcion(*args, **kwargs)
+                cache_respuestas.guardar(clave, respuesta)
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def etag_endpoint(path, query, alcance, versiones):
+    """
+    ETag fuerte de una consulta GET a 'path', o None si alguna de sus tablas
+    no tiene versión. Incluye la consulta y el alcance del usuario (su token).
+    """
+    version = version_endpoint(path, versiones)
+    if version is None:
+        return None
+    base = json.dumps([path, query, alcance, version])
+    return '"' + hashlib.sha1(base.encode('utf-8')).hexdigest() + '"'
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_carga.py
+"""
+Prueba de carga de los endpoints del backend.
+
+Envía a cada endpoint --requests consultas con --concurrencia clientes en
+paralelo y reporta latencia p50/p95/p99, throughput, errores, bytes por
+respuesta y, con --pid del proceso uvicorn, la memoria del servidor (RSS
+pico y crecimiento durante el endpoint).
+
+Los resultados se comparan con la línea base guardada en
+benchmarks/baselines/bench_carga.json: una caída sobre --tolerancia en p95 o
+throughput se marca como regresión y el script termina con código 1.
+
+Preparación típica:
+    python benchmarks/datos_sinteticos.py --base reporteria_bench
+    DB_DATABASE=reporteria_bench uvicorn main:app --app-dir backend --workers 1
+
+El token se genera con backend/sesion.py, por lo que SESSION_SECRET debe ser
+el mismo del backend (ambos leen el .env); también se puede pasar --token.
+
+Uso:
+    python benchmarks/bench_carga.py --concurrencia 8 --requests 200 --pid 12345
+    python benchmarks/bench_carga.py --endpoints depositos venta_hora --guardar-baseline
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import requests
+
+try:
+    import psutil
+except ImportError:  # sin psutil no se mide la memoria del servidor
+    psutil = None
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "bench_carga.json"
+
+_hoy = date.today()
+ENDPOINTS = {
+    "sucursales": {},
+    "depositos": {},
+    "recaudacion": {},
+    "venta_hora": {},
+    "ingresos_acum_dia": {},
+    "ingresos_acum_dia_ppto": {},
+    "ventas_historicas_diarias": {},
+    "asistencia_diaria": {"year": _hoy.year, "month": _hoy.month},
+    "planificacion": {"sucursal": "Sucursal 001", "year": _hoy.year, "month": _hoy.month},
+    "analitica/depositos_diarios": {},
+}
+
+
+def token_sintetico(rol, n_sucursales):
+    """Token firmado para un usuario de los datos sintéticos (administrador o 'bench-sup-0')."""
+    from datos_sinteticos import SUCURSALES_POR_SUPERVISOR
+    from sesion import crear_token
+
+    if rol == "admin":
+        return crear_token("bench-admin", "Bench Admin", "Administrador", range(1, n_sucursales + 1))[0]
+    sucursales = range(1, min(SUCURSALES_POR_SUPERVISOR, n_sucursales) + 1)
+    return crear_token("bench-sup-0", "Bench Supervisor", "Supervisor", sucursales)[0]
+
+
+class MonitorMemoria:
+    """Muestrea el RSS de un proceso (y sus hijos) en un hilo aparte."""
+
+    def __init__(self, pid, intervalo=0.05):
+        self.proceso = psutil.Process(pid) if (psutil and pid) else None
+        self.intervalo = intervalo
+        self.inicial = self.pico = 0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _rss(self):
+        procesos = [self.proceso] + self.proceso.children(recursive=True)
+        return sum(p.memory_info().rss for p in procesos if p.is_running())
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            self.pico = max(self.pico, self._rss())
+
+    def __enter__(self):
+        if self.proceso:
+            self.inicial = self.pico = self._rss()
+            self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._hilo:
+            self._detener.set()
+            self._hilo.join()
+            self.final = self._rss()
+
+    def resumen(self):
+        if not self.proceso:
+            return {}
+        mb = 1024 * 1024
+        return {"rss_pico_mb": round(self.pico / mb, 1), "rss_delta_mb": round((self.final - self.inicial) / mb, 1)}
+
+
+def medir_endpoint(base_url, endpoint, params, headers, n_requests, concurrencia, calentamiento):
+    url = f"{base_url}/{endpoint}"
+    local = threading.local()
+
+    def una_consulta(_):
+        if not hasattr(local, "sesion"):
+            local.sesion = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            response = local.sesion.get(url, params=params, headers=headers, timeout=300)
+            return time.perf_counter() - inicio, response.status_code, len(response.content)
+        except requests.exceptions.RequestException:
+            return time.perf_counter() - inicio, None, 0
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(una_consulta, range(calentamiento)))
+        inicio = time.perf_counter()
+        resultados = list(pool.map(una_consulta, range(n_requests)))
+        duracion = time.perf_counter() - inicio
+
+    latencias = np.array([r[0] for r in resultados if r[1] == 200]) * 1000
+    errores = sum(1 for r in resultados if r[1] != 200)
+    if latencias.size == 0:
+        return {"errores": errores, "status": sorted({str(r[1]) for r in resultados})}
+    return {
+        "p50_ms": round(float(np.percentile(latencias, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencias, 95)), 1),
+        "p99_ms": round(float(np.percentile(latencias, 99)), 1),
+        "media_ms": round(float(latencias.mean()), 1),
+        "rps": round(latencias.size / duracion, 2),
+        "errores": errores,
+        "kb_respuesta": round(statistics.mean(r[2] for r in resultados if r[1] == 200) / 1024, 1),
+    }
+
+
+def comparar(resultados, baseline, tolerancia):
+    """Regresiones respecto de la línea base: p95 más lento o throughput menor que la tolerancia."""
+    regresiones = []
+    for endpoint, actual in resultados.items():
+        base = baseline.get(endpoint)
+        if not base or "p95_ms" not in actual or "p95_ms" not in base:
+            continue
+        if actual["p95_ms"] > base["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{endpoint}: p95 {base['p95_ms']} -> {actual['p95_ms']} ms")
+        if actual["rps"] < base["rps"] * (1 - tolerancia):
+            regresiones.append(f"{endpoint}: throughput {base['rps']} -> {actual['rps']} req/s")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default="http://localhost:8000")
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument('--concurrencia', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help="consultas medidas por endpoint")
+    parser.add_argument('--calentamiento', type=int, default=5)
+    parser.add_argument('--token', help="token de sesión; por defecto se genera uno con --rol")
+    parser.add_argument('--rol', choices=["admin", "supervisor"], default="admin")
+    parser.add_argument('--sucursales', type=int, default=90, help="sucursales de los datos sintéticos (para el token)")
+    parser.add_argument('--gzip', action='store_true', help="aceptar respuestas comprimidas")
+    parser.add_argument('--pid', type=int, help="pid del proceso uvicorn para medir su memoria")
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--guardar-baseline', action='store_true')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help="fracción de empeoramiento aceptada")
+    args = parser.parse_args()
+
+    headers = {
+        "Authorization": f"Bearer {args.token or token_sintetico(args.rol, args.sucursales)}",
+        "Accept-Encoding": "gzip" if args.gzip else "identity",
+    }
+    base_url = args.url.rstrip('/')
+
+    print(f"{args.requests} requests x endpoint, concurrencia {args.concurrencia}\n")
+    print(f"{'endpoint':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'KB':>10}{'err':>5}{'RSS pico':>10}{'ΔRSS':>8}")
+    resultados = {}
+    for endpoint in args.endpoints:
+        with MonitorMemoria(args.pid) as memoria:
+            r = medir_endpoint(base_url, endpoint, ENDPOINTS[endpoint], headers,
+                               args.requests, args.concurrencia, args.calentamiento)
+        r.update(memoria.resumen())
+        resultados[endpoint] = r
+        if "p50_ms" not in r:
+            print(f"{endpoint:<28}  sin respuestas 200 (status {', '.join(r['status'])})")
+            continue
+        print(f"{endpoint:<28}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['rps']:>9}{r['kb_respuesta']:>10}"
+              f"{r['errores']:>5}{r.get('rss_pico_mb', '-'):>10}{r.get('rss_delta_mb', '-'):>8}")
+
+    if args.guardar_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(resultados, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nLínea base guardada en {args.baseline}")
+        return
+
+    if args.baseline.exists():
+        regresiones = comparar(resultados, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerancia)
+        if regresiones:
+            print(f"\nRegresiones (tolerancia {args.tolerancia:.0%}):")
+            for linea in regresiones:
+                print(f"  {linea}")
+            sys.exit(1)
+        print(f"\nSin regresiones respecto de {args.baseline.name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_memoria.py
+"""
+Benchmark de memoria y tiempo de los DataFrames de las páginas.
+
+Arma con datos sintéticos (benchmarks/datos_sinteticos.py) las respuestas
+JSON {"columns","data"} de los endpoints y compara el DataFrame por defecto
+(pd.DataFrame + pd.to_datetime, como hacían las páginas) contra el de
+frontend/esquemas.py: memoria por DataFrame (deep) y tiempo de decodificar,
+del merge depósitos/recaudación/sucursales y de los groupby por sucursal y
+responsable del tablero de depósitos.
+
+Uso:
+    python benchmarks/bench_memoria.py
+    python benchmarks/bench_memoria.py --sucursales 200 --anios 3 --repeticiones 10
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "frontend"))
+
+from datos_sinteticos import generar  # noqa: E402
+from esquemas import ESQUEMAS, dataframe  # noqa: E402
+
+
+def respuestas(tablas):
+    """{endpoint: {"columns", "data"}} con la forma de las respuestas del backend."""
+    sucursales = tablas["QRY_BRANCH_OFFICES"].rename(columns={
+        "id": "branch_office_id", "principal": "marca", "zone": "zona", "segment": "segmento", "address": "direccion",
+    }).drop(columns="status_id")
+    kpi = tablas["KPI_INGRESOS_IMG_MES"]
+    fuentes = {
+        "sucursales": sucursales,
+        "depositos": tablas["DETALLE_DEPOSITOS_DIA"],
+        "recaudacion": tablas["DETALLE_RECAUDACION_DIA"],
+        "ingresos_acum_dia": kpi[kpi["metrica"] == "ingresos"],
+        "venta_hora": tablas["DETALLE_VENTA_HORA"],
+        "asistencia_diaria": tablas["ASISTENCIA_DIARIA"],
+    }
+    # Ida y vuelta por JSON: fechas como texto y números como los entrega FastAPI
+    return {endpoint: json.loads(df.to_json(orient="split", index=False, date_format="iso"))
+            for endpoint, df in fuentes.items()}
+
+
+def por_defecto(endpoint, data):
+    df = pd.DataFrame(data["data"], columns=data["columns"])
+    for columna, tipo in ESQUEMAS[endpoint].items():
+        if tipo == "fecha" and columna in df.columns:
+            df[columna] = pd.to_datetime(df[columna])
+    return df
+
+
+def medir(funcion, repeticiones):
+    """(resultado, mejor tiempo en ms)."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor * 1000
+
+
+def tablero_depositos(dfs):
+    """Merge y agregaciones de pages/depositos.py."""
+    df = dfs["recaudacion"].merge(dfs["depositos"], on=["branch_office_id", "date"], how="left")
+    df = df.merge(dfs["sucursales"][["branch_office_id", "responsable", "branch_office"]], on="branch_office_id", how="left")
+    por_sucursal = df.groupby("branch_office", observed=True)[["recaudacion", "deposito"]].sum()
+    por_responsable = df.groupby("responsable", observed=True)[["recaudacion", "deposito"]].sum()
+    return len(por_sucursal) + len(por_responsable)
+
+
+def mb(n):
+    return f"{n / 1024 / 1024:9.2f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sucursales', type=int, default=90)
+    parser.add_argument('--anios', type=int, default=2)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    print("Generando datos sintéticos...")
+    payloads = respuestas(generar(sucursales=args.sucursales, anios=args.anios))
+
+    print(f"\n{'endpoint':<20}{'filas':>9}{'por defecto':>14}{'con esquema':>14}{'ahorro':>8}{'decod. ms':>16}")
+    crudos, tipados = {}, {}
+    for endpoint, data in payloads.items():
+        crudos[endpoint], ms_crudo = medir(lambda: por_defecto(endpoint, data), args.repeticiones)
+        tipados[endpoint], ms_tipado = medir(lambda: dataframe(endpoint, data), args.repeticiones)
+        antes = crudos[endpoint].memory_usage(deep=True).sum()
+        despues = tipados[endpoint].memory_usage(deep=True).sum()
+        print(f"{endpoint:<20}{len(data['data']):>9,}{mb(antes):>14}{mb(despues):>14}{1 - despues / antes:>8.0%}"
+              f"{ms_crudo:>8.1f}/{ms_tipado:<7.1f}")
+
+    _, ms_crudo = medir(lambda: tablero_depositos(crudos), args.repeticiones)
+    _, ms_tipado = medir(lambda: tablero_depositos(tipados), args.repeticiones)
+    print(f"\nMerge + groupby del tablero de depósitos: {ms_crudo:.1f} ms -> {ms_tipado:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_proyeccion.py
+"""
+Benchmark del motor de proyección por lotes.
+
+Genera un histórico sintético (por defecto ~90 sucursales x 3 años de ventas
+diarias), ajusta cada modelo para todas las sucursales en un solo paso, mide
+el entrenamiento completo (incluido el backtest en paralelo) y proyecta 90 días.
+
+Uso:
+    python benchmarks/bench_proyeccion.py --sucursales 90 --dias-historia 1095 --horizonte 90
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+import proyeccion  # noqa: E402
+from proyeccion import MODELOS, ModelRegistry, history_matrix  # noqa: E402
+
+
+def generar_historico(n_sucursales, dias_historia, seed=0):
+    """Ventas diarias sintéticas con tendencia y estacionalidad semanal."""
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range(end=pd.Timestamp.today().normalize(), periods=dias_historia, freq='D')
+    t = np.arange(dias_historia)
+    frames = []
+    for i in range(n_sucursales):
+        base = rng.uniform(500_000, 3_000_000)
+        semanal = 1 + 0.3 * (fechas.dayofweek >= 5)
+        ventas = base * semanal * (1 + 0.0003 * t) * rng.lognormal(0, 0.1, dias_historia)
+        frames.append(pd.DataFrame({'fecha': fechas, 'branch_office': f"Sucursal {i:03d}", 'total_venta': ventas}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = fn()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, min(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sucursales', type=int, default=90)
+    parser.add_argument('--dias-historia', type=int, default=3 * 365)
+    parser.add_argument('--horizonte', type=int, default=90)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    df = generar_historico(args.sucursales, args.dias_historia)
+    print(f"Histórico: {len(df):,} filas ({args.sucursales} sucursales x {args.dias_historia} días)")
+
+    # El benchmark no debe tocar la caché real de la aplicación
+    proyeccion.REGISTRY_DIR = Path(tempfile.mkdtemp(prefix="bench_proyeccion_"))
+
+    fechas, _, Y, mask = history_matrix(df)
+    for name, model in MODELOS.items():
+        _, ms_fit = medir(lambda: model().fit(fechas, Y, mask), args.repeticiones)
+        print(f"Ajuste {name:<14} ({args.sucursales} sucursales): {ms_fit:8.1f} ms")
+
+    registry, ms_train = medir(lambda: ModelRegistry.train(df, 'bench'), 1)
+    print(f"Entrenamiento completo con backtest:  {ms_train:8.1f} ms")
+
+    branches = registry.branches
+    df_proj, ms_pred = medir(lambda: registry.predict(branches, args.horizonte), args.repeticiones)
+    print(f"Proyección {args.horizonte} días ({len(df_proj):,} filas):   {ms_pred:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
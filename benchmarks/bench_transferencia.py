@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_transferencia.py
+"""
+Benchmark de bytes transferidos por los endpoints de datos.
+
+Contra un backend en ejecución, mide para cada endpoint los bytes en el cable
+sin compresión, con gzip, con brotli (si el backend lo ofrece) y la
+revalidación con If-None-Match (304 sin cuerpo).
+
+Sin backend (--sintetico) arma un JSON {"columns","data"} con la forma de
+/depositos y mide solo la compresión.
+
+Uso:
+    python benchmarks/bench_transferencia.py --token <token de /login>
+    python benchmarks/bench_transferencia.py --sintetico --filas 200000
+"""
+import argparse
+import gzip
+import json
+import time
+
+import numpy as np
+import requests
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+ENDPOINTS = ["depositos", "recaudacion", "venta_hora", "abonados", "ventas_historicas_diarias"]
+
+
+def kb(n):
+    return f"{n / 1024:10,.1f} KB"
+
+
+def descargar(url, headers):
+    """(status, bytes en el cable, ms, ETag, encoding): el cuerpo se lee sin descomprimir."""
+    inicio = time.perf_counter()
+    response = requests.get(url, headers=headers, stream=True, timeout=120)
+    cuerpo = response.raw.read(decode_content=False)
+    ms = (time.perf_counter() - inicio) * 1000
+    return response.status_code, len(cuerpo), ms, response.headers.get("ETag"), response.headers.get("Content-Encoding", "identity")
+
+
+def medir_backend(base_url, token, endpoints):
+    auth = {"Authorization": f"Bearer {token}"} if token else {}
+    print(f"{'endpoint':<28}{'identity':>14}{'gzip':>14}{'br':>14}{'304':>14}")
+    for endpoint in endpoints:
+        url = f"{base_url}/{endpoint}"
+        fila, etag = [], None
+        for encoding in ("identity", "gzip", "br"):
+            status, n, ms, etag_resp, usado = descargar(url, {**auth, "Accept-Encoding": encoding})
+            if status != 200:
+                fila.append(f"{'HTTP ' + str(status):>14}")
+                continue
+            etag = etag or etag_resp
+            fila.append(f"{kb(n)}{'' if usado == encoding else '*':>4}")
+        if etag:
+            status, n, ms, _, _ = descargar(url, {**auth, "Accept-Encoding": "gzip", "If-None-Match": etag})
+            fila.append(f"{kb(n) if status == 304 else 'HTTP ' + str(status):>14}")
+        else:
+            fila.append(f"{'sin ETag':>14}")
+        print(f"{endpoint:<28}" + "".join(fila))
+    print("* el backend respondió con otra codificación (p. ej. sin brotli instalado)")
+
+
+def payload_sintetico(filas, seed=0):
+    """JSON con la forma de /depositos: una fila por sucursal y día."""
+    rng = np.random.default_rng(seed)
+    fechas = np.datetime64('2024-01-01') + rng.integers(0, 365, filas)
+    columnas = ["id", "branch_office_id", "sucursal", "fecha", "monto_venta", "monto_deposito", "diferencia"]
+    venta = rng.integers(100_000, 5_000_000, filas)
+    deposito = venta - rng.integers(0, 50_000, filas)
+    data = [
+        [i, int(b), f"Sucursal {b:03d}", str(f), int(v), int(d), int(v - d)]
+        for i, (b, f, v, d) in enumerate(zip(rng.integers(1, 90, filas), fechas, venta, deposito))
+    ]
+    return json.dumps({"columns": columnas, "data": data}).encode('utf-8')
+
+
+def medir_sintetico(filas):
+    cuerpo = payload_sintetico(filas)
+    print(f"Payload sintético: {filas:,} filas")
+    print(f"  identity           {kb(len(cuerpo))}")
+    for nivel in (1, 6, 9):
+        inicio = time.perf_counter()
+        n = len(gzip.compress(cuerpo, compresslevel=nivel))
+        print(f"  gzip nivel {nivel}       {kb(n)}  ({len(cuerpo) / n:4.1f}x, {(time.perf_counter() - inicio) * 1000:7.1f} ms)")
+    if brotli:
+        for calidad in (4, 11):
+            inicio = time.perf_counter()
+            n = len(brotli.compress(cuerpo, quality=calidad))
+            print(f"  br calidad {calidad:<2}      {kb(n)}  ({len(cuerpo) / n:4.1f}x, {(time.perf_counter() - inicio) * 1000:7.1f} ms)")
+    else:
+        print("  br                 (instale 'brotli' para medirlo)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default="http://localhost:8000")
+    parser.add_argument('--token', help="token de sesión (campo 'token' de /login)")
+    parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS)
+    parser.add_argument('--sintetico', action='store_true', help="medir solo la compresión de un payload sintético")
+    parser.add_argument('--filas', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.sintetico:
+        medir_sintetico(args.filas)
+    else:
+        medir_backend(args.url.rstrip('/'), args.token, args.endpoints)
+
+
+if __name__ == '__main__':
+    main()
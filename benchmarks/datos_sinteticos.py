@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+# benchmarks/datos_sinteticos.py
+"""
+Generador de datos sintéticos para pruebas de carga del backend.
+
+Crea, con el tamaño indicado, las tablas que leen los endpoints de datos:
+CABECERA_TRANSACCIONES, KPI_INGRESOS_IMG_MES, DETALLE_VENTA_HORA,
+DETALLE_DEPOSITOS_DIA, DETALLE_RECAUDACION_DIA, ASISTENCIA_DIARIA y
+ASISTENCIA_MALLA, más las dimensiones que usan sus filtros
+(QRY_BRANCH_OFFICES, branch_offices, ASISTENCIA_TRABAJADOR), el índice de
+mallas y DATA_VERSION.
+
+Los datos se cargan en una base MySQL local (por seguridad el nombre debe
+contener 'bench'; se usan DB_HOST, DB_USER y DB_PASSWORD del .env) o se
+escriben como CSV para cargarlos en otro motor.
+
+Uso:
+    python benchmarks/datos_sinteticos.py --base reporteria_bench --sucursales 90 --anios 3
+    python benchmarks/datos_sinteticos.py --csv /tmp/sinteticos --sucursales 20 --anios 1
+"""
+import argparse
+import os
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Supervisores sintéticos: 'bench-sup-0' .. 'bench-sup-N' (filtro de sucursales de los no administradores)
+SUCURSALES_POR_SUPERVISOR = 10
+CODIGOS_TURNO = np.array(["M1", "M2", "T1", "T2", "N1", "L"])
+MINUTOS_TURNO = np.array([480, 450, 480, 450, 600, 0])
+
+ESQUEMA = {
+    "QRY_BRANCH_OFFICES": """
+        CREATE TABLE QRY_BRANCH_OFFICES (
+          id int NOT NULL, branch_office varchar(255), responsable varchar(255), dte_code int,
+          principal varchar(255), zone varchar(255), segment varchar(255), address varchar(255),
+          region varchar(255), commune varchar(255), status_id int NOT NULL,
+          PRIMARY KEY (id))""",
+    "branch_offices": """
+        CREATE TABLE branch_offices (
+          id int NOT NULL, branch_office varchar(255), principal_supervisor varchar(20), status_id int NOT NULL,
+          PRIMARY KEY (id), KEY idx_supervisor (principal_supervisor))""",
+    "CABECERA_TRANSACCIONES": """
+        CREATE TABLE CABECERA_TRANSACCIONES (
+          id int NOT NULL AUTO_INCREMENT, date date NOT NULL, branch_office_id int NOT NULL,
+          cash_amount float NOT NULL, card_amount float NOT NULL, subscribers int NOT NULL, ticket_number int NOT NULL,
+          PRIMARY KEY (id))""",
+    "KPI_INGRESOS_IMG_MES": """
+        CREATE TABLE KPI_INGRESOS_IMG_MES (
+          date date, periodo varchar(20), `año` int, branch_office_id int, clave int, ind int,
+          cash_amount double, cash_net_amount double, card_amount double, card_net_amount double,
+          subscribers double, ticket_number int, ppto double, metrica varchar(20))""",
+    "DETALLE_VENTA_HORA": """
+        CREATE TABLE DETALLE_VENTA_HORA (
+          branch_office_id int, folio int, total int, entrance_hour time, exit_hour time, date date,
+          hora_exit int, estadia int, minutos int, rango varchar(20))""",
+    "DETALLE_DEPOSITOS_DIA": """
+        CREATE TABLE DETALLE_DEPOSITOS_DIA (date date, branch_office_id int, deposito double)""",
+    "DETALLE_RECAUDACION_DIA": """
+        CREATE TABLE DETALLE_RECAUDACION_DIA (date date, branch_office_id int, recaudacion double)""",
+    "ASISTENCIA_TRABAJADOR": """
+        CREATE TABLE ASISTENCIA_TRABAJADOR (
+          rut varchar(20) NOT NULL, trabajador varchar(255), sucursal varchar(255), PRIMARY KEY (rut))""",
+    "ASISTENCIA_DIARIA": """
+        CREATE TABLE ASISTENCIA_DIARIA (
+          RUT varchar(20), Trabajador varchar(255), Especialidad varchar(255), Sucursal varchar(255),
+          Contrato varchar(255), Supervisor varchar(255), Turno varchar(255),
+          EntradaFecha datetime, SalidaFecha datetime, JornadaTurnoMinutos int, JornadaEfectivaMinutos int,
+          HorasNoTrabajadasMinutos int, HorasExtraordinariasMinutos int, HorasOrdinariasMinutos int)""",
+    "ASISTENCIA_MALLA": """
+        CREATE TABLE ASISTENCIA_MALLA (
+          id int NOT NULL AUTO_INCREMENT, rut varchar(20), sucursal varchar(255), fecha date, codigo varchar(10),
+          PRIMARY KEY (id), UNIQUE KEY uk_malla_sucursal_fecha_rut (sucursal, fecha, rut))""",
+    "ASISTENCIA_MALLA_INDICE": """
+        CREATE TABLE ASISTENCIA_MALLA_INDICE (
+          sucursal varchar(255) NOT NULL, year smallint NOT NULL, month tinyint NOT NULL,
+          version int NOT NULL DEFAULT 0, filas int NOT NULL DEFAULT 0,
+          updated_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (sucursal, year, month))""",
+    "DATA_VERSION": """
+        CREATE TABLE DATA_VERSION (
+          table_name varchar(64) NOT NULL, version bigint NOT NULL DEFAULT 0,
+          loaded_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (table_name))""",
+}
+
+
+# --- Generadores ---
+
+def generar_sucursales(n):
+    ids = np.arange(1, n + 1)
+    nombres = [f"Sucursal {i:03d}" for i in ids]
+    supervisores = [f"bench-sup-{(i - 1) // SUCURSALES_POR_SUPERVISOR}" for i in ids]
+    qry = pd.DataFrame({
+        "id": ids, "branch_office": nombres, "responsable": supervisores, "dte_code": 1000 + ids,
+        "principal": np.where(ids % 3 == 0, "Marca B", "Marca A"), "zone": [f"Zona {i % 5}" for i in ids],
+        "segment": np.where(ids % 2 == 0, "Retail", "Clínica"), "address": [f"Calle {i}" for i in ids],
+        "region": [f"Región {i % 16}" for i in ids], "commune": [f"Comuna {i % 40}" for i in ids], "status_id": 7,
+    })
+    branch = pd.DataFrame({"id": ids, "branch_office": nombres, "principal_supervisor": supervisores, "status_id": 7})
+    return qry, branch
+
+
+def _venta_base(rng, n_sucursales, fechas):
+    """Matriz (días x sucursales) de ventas brutas con tendencia y estacionalidad semanal."""
+    base = rng.uniform(300_000, 3_000_000, n_sucursales)
+    t = np.arange(len(fechas))[:, None]
+    semanal = np.where(fechas.dayofweek.to_numpy()[:, None] >= 5, 1.3, 1.0)
+    return base * semanal * (1 + 0.0003 * t) * rng.lognormal(0, 0.15, (len(fechas), n_sucursales))
+
+
+def _diario(fechas, ids, valores, columnas):
+    return pd.DataFrame({
+        "date": np.repeat(fechas.date, len(ids)),
+        "branch_office_id": np.tile(ids, len(fechas)),
+        **{c: v.ravel() for c, v in zip(columnas, valores)},
+    })
+
+
+def generar_ventas(rng, ids, fechas):
+    """CABECERA_TRANSACCIONES, KPI_INGRESOS_IMG_MES, DETALLE_DEPOSITOS_DIA y DETALLE_RECAUDACION_DIA."""
+    venta = _venta_base(rng, len(ids), fechas)
+    efectivo = venta * rng.uniform(0.2, 0.5, venta.shape)
+    tarjeta = venta - efectivo
+    abonados = (venta * rng.uniform(0.0, 0.1, venta.shape)).round()
+    tickets = np.maximum((venta / rng.uniform(15_000, 40_000, venta.shape)).astype(int), 1)
+
+    cabecera = _diario(fechas, ids, [efectivo.round(), tarjeta.round(), abonados, tickets],
+                       ["cash_amount", "card_amount", "subscribers", "ticket_number"])
+
+    kpi = cabecera.copy()
+    kpi["periodo"] = "Acumulado"
+    kpi["año"] = pd.to_datetime(kpi["date"]).dt.year
+    kpi["clave"] = pd.to_datetime(kpi["date"]).dt.strftime("%m%d").astype(int)
+    kpi["ind"] = 1
+    kpi["cash_net_amount"] = (kpi["cash_amount"] / 1.19).round()
+    kpi["card_net_amount"] = (kpi["card_amount"] / 1.19).round()
+    kpi["ppto"] = 0.0
+    kpi["metrica"] = "ingresos"
+    ppto = kpi[kpi["año"] == fechas[-1].year].copy()
+    ppto["ppto"] = ((ppto["cash_net_amount"] + ppto["card_net_amount"]) * rng.uniform(0.9, 1.15, len(ppto))).round()
+    ppto["metrica"] = "ppto"
+    kpi = pd.concat([kpi, ppto], ignore_index=True)[[
+        "date", "periodo", "año", "branch_office_id", "clave", "ind", "cash_amount", "cash_net_amount",
+        "card_amount", "card_net_amount", "subscribers", "ticket_number", "ppto", "metrica"]]
+
+    recaudacion = _diario(fechas, ids, [efectivo.round()], ["recaudacion"])
+    depositos = _diario(fechas, ids, [(efectivo - rng.integers(0, 20_000, efectivo.shape)).clip(0).round()], ["deposito"])
+    return cabecera, kpi, depositos, recaudacion
+
+
+def generar_venta_hora(rng, ids, fechas, tickets_dia):
+    """DETALLE_VENTA_HORA: un registro por ticket (entrada, salida, estadía y monto)."""
+    n_dias, n_suc = len(fechas), len(ids)
+    por_celda = rng.poisson(tickets_dia, (n_dias, n_suc))
+    total = int(por_celda.sum())
+    dia_idx = np.repeat(np.repeat(np.arange(n_dias), n_suc), por_celda.ravel())
+    suc_idx = np.repeat(np.tile(np.arange(n_suc), n_dias), por_celda.ravel())
+    entrada = rng.integers(7 * 60, 22 * 60, total)
+    estadia = rng.gamma(2.0, 45.0, total).astype(int) + 1
+    salida = np.minimum(entrada + estadia, 23 * 60 + 59)
+    hora_exit = salida // 60
+    return pd.DataFrame({
+        "branch_office_id": ids[suc_idx],
+        "folio": np.arange(1, total + 1),
+        "total": (np.ceil(estadia / 30) * 1500).astype(int),
+        "entrance_hour": [f"{m // 60:02d}:{m % 60:02d}:00" for m in entrada],
+        "exit_hour": [f"{m // 60:02d}:{m % 60:02d}:00" for m in salida],
+        "date": fechas.date[dia_idx],
+        "hora_exit": hora_exit,
+        "estadia": estadia,
+        "minutos": estadia,
+        "rango": pd.cut(estadia, [0, 30, 60, 120, 240, np.inf], labels=["0-30", "31-60", "61-120", "121-240", "240+"]).astype(str),
+    })
+
+
+def generar_personal(rng, sucursales, trabajadores_sucursal):
+    filas = []
+    for _, suc in sucursales.iterrows():
+        for k in range(trabajadores_sucursal):
+            filas.append({"rut": f"{suc['id']:03d}{k:03d}-K", "trabajador": f"Trabajador {suc['id']:03d}-{k:03d}",
+                          "sucursal": suc["branch_office"], "supervisor": suc["responsable"]})
+    return pd.DataFrame(filas)
+
+
+def generar_asistencia(rng, personal, fechas):
+    """ASISTENCIA_MALLA (turno planificado) y ASISTENCIA_DIARIA (marcas según la malla)."""
+    n_trab, n_dias = len(personal), len(fechas)
+    codigo_idx = rng.integers(0, len(CODIGOS_TURNO), (n_trab, n_dias))
+    malla = pd.DataFrame({
+        "rut": np.repeat(personal["rut"].to_numpy(), n_dias),
+        "sucursal": np.repeat(personal["sucursal"].to_numpy(), n_dias),
+        "fecha": np.tile(fechas.date, n_trab),
+        "codigo": CODIGOS_TURNO[codigo_idx].ravel(),
+    })
+
+    trabaja = MINUTOS_TURNO[codigo_idx].ravel() > 0
+    fila_trab = np.repeat(np.arange(n_trab), n_dias)[trabaja]
+    jornada = MINUTOS_TURNO[codigo_idx].ravel()[trabaja]
+    atraso = rng.exponential(5, trabaja.sum()).astype(int)
+    extra = rng.choice([0, 0, 0, 30, 60], trabaja.sum())
+    entrada = (pd.to_datetime(np.tile(fechas.date, n_trab)[trabaja])
+               + pd.to_timedelta(np.where(codigo_idx.ravel()[trabaja] < 2, 8 * 60, 14 * 60) + atraso, unit="m"))
+    efectiva = jornada - atraso + extra
+    diaria = pd.DataFrame({
+        "RUT": personal["rut"].to_numpy()[fila_trab],
+        "Trabajador": personal["trabajador"].to_numpy()[fila_trab],
+        "Especialidad": "Operador",
+        "Sucursal": personal["sucursal"].to_numpy()[fila_trab],
+        "Contrato": "Indefinido",
+        "Supervisor": personal["supervisor"].to_numpy()[fila_trab],
+        "Turno": CODIGOS_TURNO[codigo_idx.ravel()[trabaja]],
+        "EntradaFecha": entrada,
+        "SalidaFecha": entrada + pd.to_timedelta(efectiva, unit="m"),
+        "JornadaTurnoMinutos": jornada,
+        "JornadaEfectivaMinutos": efectiva,
+        "HorasNoTrabajadasMinutos": atraso,
+        "HorasExtraordinariasMinutos": extra,
+        "HorasOrdinariasMinutos": jornada - atraso,
+    })
+    return malla, diaria
+
+
+def generar(sucursales=90, anios=3, meses_detalle=1, tickets_dia=150, trabajadores_sucursal=12, seed=0):
+    """Todas las tablas como {nombre: DataFrame}."""
+    rng = np.random.default_rng(seed)
+    hoy = pd.Timestamp(date.today())
+    # Hasta ayer, como las cargas del ETL
+    fechas = pd.date_range(pd.Timestamp(hoy.year - anios + 1, 1, 1), hoy - pd.Timedelta(days=1), freq="D")
+    fechas_detalle = fechas[fechas >= (hoy - pd.DateOffset(months=meses_detalle - 1)).replace(day=1)]
+
+    qry, branch = generar_sucursales(sucursales)
+    ids = qry["id"].to_numpy()
+    cabecera, kpi, depositos, recaudacion = generar_ventas(rng, ids, fechas)
+    personal = generar_personal(rng, qry, trabajadores_sucursal)
+    malla, diaria = generar_asistencia(rng, personal, fechas_detalle)
+
+    indice = (malla.assign(year=pd.to_datetime(malla["fecha"]).dt.year, month=pd.to_datetime(malla["fecha"]).dt.month)
+              .groupby(["sucursal", "year", "month"]).size().rename("filas").reset_index())
+    indice["version"] = 1
+    indice["updated_at"] = hoy.to_pydatetime()
+
+    return {
+        "QRY_BRANCH_OFFICES": qry,
+        "branch_offices": branch,
+        "CABECERA_TRANSACCIONES": cabecera,
+        "KPI_INGRESOS_IMG_MES": kpi,
+        "DETALLE_VENTA_HORA": generar_venta_hora(rng, ids, fechas_detalle, tickets_dia),
+        "DETALLE_DEPOSITOS_DIA": depositos,
+        "DETALLE_RECAUDACION_DIA": recaudacion,
+        "ASISTENCIA_TRABAJADOR": personal[["rut", "trabajador", "sucursal"]],
+        "ASISTENCIA_DIARIA": diaria,
+        "ASISTENCIA_MALLA": malla,
+        "ASISTENCIA_MALLA_INDICE": indice[["sucursal", "year", "month", "version", "filas", "updated_at"]],
+    }
+
+
+# --- Carga ---
+
+def _nativo(valor):
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def _valores(df):
+    """Filas como tuplas de tipos nativos (mysql.connector no acepta tipos de NumPy)."""
+    objeto = df.astype(object).where(df.notna(), None)
+    return [tuple(_nativo(v) for v in fila) for fila in objeto.itertuples(index=False)]
+
+
+def cargar_mysql(tablas, base, lote=5000):
+    import mysql.connector
+    from dotenv import load_dotenv
+
+    if "bench" not in base:
+        raise SystemExit(f"La base '{base}' no parece de pruebas: su nombre debe contener 'bench'.")
+    load_dotenv()
+    cnx = mysql.connector.connect(host=os.getenv('DB_HOST'), user=os.getenv('DB_USER'), password=os.getenv('DB_PASSWORD'))
+    cursor = cnx.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{base}` CHARACTER SET utf8mb4")
+    cursor.execute(f"USE `{base}`")
+    for tabla, ddl in ESQUEMA.items():
+        cursor.execute(f"DROP TABLE IF EXISTS `{tabla}`")
+        cursor.execute(ddl)
+
+    for tabla, df in tablas.items():
+        inicio = time.perf_counter()
+        columnas = ", ".join(f"`{c}`" for c in df.columns)
+        sql = f"INSERT INTO `{tabla}` ({columnas}) VALUES ({', '.join(['%s'] * len(df.columns))})"
+        for i in range(0, len(df), lote):
+            cursor.executemany(sql, _valores(df.iloc[i:i + lote]))
+        cursor.execute(
+            "INSERT INTO DATA_VERSION (table_name, version, loaded_at) VALUES (%s, 1, NOW()) "
+            "ON DUPLICATE KEY UPDATE version = version + 1, loaded_at = NOW()", (tabla,))
+        cnx.commit()
+        print(f"  {tabla:<26}{len(df):>12,} filas  {time.perf_counter() - inicio:8.1f} s")
+    cursor.close()
+    cnx.close()
+
+
+def escribir_csv(tablas, carpeta):
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    for tabla, df in tablas.items():
+        df.to_csv(carpeta / f"{tabla}.csv", index=False)
+        print(f"  {tabla:<26}{len(df):>12,} filas")
+    (carpeta / "esquema.sql").write_text(";\n".join(ESQUEMA.values()) + ";\n", encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sucursales', type=int, default=90)
+    parser.add_argument('--anios', type=int, default=3, help="años de ventas diarias (hasta ayer)")
+    parser.add_argument('--meses-detalle', type=int, default=1, help="meses de tickets, asistencia y malla")
+    parser.add_argument('--tickets-dia', type=int, default=150, help="tickets promedio por sucursal y día")
+    parser.add_argument('--trabajadores', type=int, default=12, help="trabajadores por sucursal")
+    parser.add_argument('--semilla', type=int, default=0)
+    destino = parser.add_mutually_exclusive_group(required=True)
+    destino.add_argument('--base', help="base MySQL de pruebas (se recrea)")
+    destino.add_argument('--csv', help="carpeta donde escribir un CSV por tabla")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    tablas = generar(args.sucursales, args.anios, args.meses_detalle, args.tickets_dia, args.trabajadores, args.semilla)
+    print(f"Generado en {time.perf_counter() - inicio:.1f} s")
+    if args.base:
+        cargar_mysql(tablas, args.base)
+    else:
+        escribir_csv(tablas, args.csv)
+
+
+if __name__ == '__main__':
+    main()
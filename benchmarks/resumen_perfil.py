@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# benchmarks/resumen_perfil.py
+"""
+Resumen de las etapas registradas por el perfilador de páginas
+(frontend/perfilador.py) entre sesiones.
+
+Por página y etapa: ejecuciones, mediana, p95, máximo y la fracción media del
+tiempo total de la página, ordenadas por tiempo acumulado. Sirve para elegir
+qué etapa optimizar primero.
+
+Uso:
+    python benchmarks/resumen_perfil.py
+    python benchmarks/resumen_perfil.py --pagina depositos --desde 2025-06-01 --top 15
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+LOG_DEFECTO = Path(__file__).resolve().parent.parent / "frontend" / "logs" / "perfil_etapas.jsonl"
+
+
+def cargar(ruta, pagina=None, desde=None):
+    df = pd.read_json(ruta, lines=True, convert_dates=["ts"])
+    if pagina:
+        df = df[df["pagina"] == pagina]
+    if desde:
+        df = df[df["ts"] >= pd.Timestamp(desde)]
+    return df
+
+
+def resumir(df):
+    totales = df[df["etapa"] == "total"].set_index("ejecucion")["ms"]
+    etapas = df[df["etapa"] != "total"].copy()
+    etapas["pct_pagina"] = etapas["ms"] / etapas["ejecucion"].map(totales) * 100
+
+    resumen = etapas.groupby(["pagina", "etapa", "categoria"]).agg(
+        n=("ms", "size"),
+        p50_ms=("ms", "median"),
+        p95_ms=("ms", lambda s: s.quantile(0.95)),
+        max_ms=("ms", "max"),
+        total_ms=("ms", "sum"),
+        pct_pagina=("pct_pagina", "mean"),
+    )
+    return resumen.sort_values("total_ms", ascending=False).round(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', type=Path, default=LOG_DEFECTO)
+    parser.add_argument('--pagina')
+    parser.add_argument('--desde', help="fecha mínima (AAAA-MM-DD)")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    if not args.log.exists():
+        sys.exit(f"No existe {args.log}: active el perfilador en la aplicación para generar registros.")
+    df = cargar(args.log, args.pagina, args.desde)
+    if df.empty:
+        sys.exit("Sin registros para los filtros indicados.")
+
+    totales = df[df["etapa"] == "total"].groupby("pagina")["ms"]
+    print("Tiempo total por página (ms):")
+    print(pd.DataFrame({
+        "ejecuciones": totales.size(),
+        "sesiones": df.groupby("pagina")["sesion"].nunique(),
+        "p50": totales.median(),
+        "p95": totales.quantile(0.95),
+    }).round(1).to_string())
+    print()
+
+    resumen = resumir(df)
+    print(f"Etapas con más tiempo acumulado (top {args.top}):")
+    with pd.option_context('display.width', 160, 'display.max_columns', None):
+        print(resumen.head(args.top).to_string())
+    print()
+    print("Tiempo acumulado por categoría (ms):")
+    print(resumen.groupby("categoria")["total_ms"].sum().sort_values(ascending=False).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# anomalias.py
+"""
+Servicio de detección de anomalías para el dashboard de depósitos.
+
+Las estadísticas robustas por sucursal (cuartiles/IQR) se calculan en una sola
+pasada de groupby-quantile y los z-scores de forma vectorizada. Los modelos
+costosos (IsolationForest y KMeans) se ajustan una sola vez por versión de
+los datos en un hilo en segundo plano y quedan memorizados; al cambiar los
+filtros solo se puntúan las filas visibles con el modelo ya ajustado.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+# Características usadas por los detectores
+FEATURES = ['recaudado', 'depositado', 'diferencia', 'ratio_deposito']
+
+# Versiones de datos que se conservan en memoria por tipo de modelo
+MAX_VERSIONES = 2
+
+
+def data_version(df, columns):
+    """Huella de los valores de 'columns'; cambia solo si cambian los datos."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+
+def robust_branch_flags(df, features, by='sucursal', k=1.5, min_rows=5):
+    """
+    Marca valores fuera de [Q1 - k*IQR, Q3 + k*IQR] calculando los cuartiles de
+    todas las sucursales y columnas en una sola pasada. Las sucursales con menos
+    de 'min_rows' registros no se marcan.
+    """
+    grouped = df.groupby(by, observed=True)[features]
+    cuartiles = grouped.quantile([0.25, 0.75])
+    q1 = cuartiles.xs(0.25, level=-1)
+    q3 = cuartiles.xs(0.75, level=-1)
+    iqr = q3 - q1
+
+    lower = (q1 - k * iqr).reindex(df[by]).to_numpy()
+    upper = (q3 + k * iqr).reindex(df[by]).to_numpy()
+    valid = (grouped.size().reindex(df[by]).to_numpy() >= min_rows)[:, None]
+
+    values = df[features].to_numpy(dtype=float)
+    flags = ((values < lower) | (values > upper)) & valid
+    return pd.DataFrame(flags, index=df.index, columns=[f'anomaly_iqr_{col}' for col in features])
+
+
+def zscores(df, features):
+    """Z-score absoluto de cada columna (NaN reemplazado por la media)."""
+    X = df[features].astype(float)
+    X = X.fillna(X.mean())
+    std = X.std(ddof=0)
+    cols = std.index[std > 0]
+    return ((X[cols] - X[cols].mean()) / std[cols]).abs()
+
+
+def fit_isolation_forest(X):
+    scaler = StandardScaler().fit(X)
+    model = IsolationForest(contamination=0.1, random_state=42).fit(scaler.transform(X))
+    return scaler, model
+
+
+def fit_kmeans(X, n_clusters=3):
+    scaler = StandardScaler().fit(X)
+    model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10).fit(scaler.transform(X))
+    return scaler, model
+
+
+class AnomalyService:
+    """
+    Ejecuta los ajustes costosos en un hilo en segundo plano y memoriza el
+    resultado por (tipo de modelo, versión de datos). Una sola instancia se
+    comparte entre todas las sesiones.
+    """
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="anomalias")
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, version, fn, *args):
+        key = (kind, version)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(fn, *args)
+                self._futures[key] = future
+                # Descartar los modelos de versiones antiguas del mismo tipo
+                antiguos = [k for k in self._futures if k[0] == kind and k != key]
+                for k in antiguos[:max(0, len(antiguos) - (MAX_VERSIONES - 1))]:
+                    del self._futures[k]
+            return future
+
+    def result(self, kind, version, fn, *args, timeout=None):
+        """
+        Resultado memorizado del ajuste; lo lanza en segundo plano si no existe.
+        Retorna None si no termina dentro de 'timeout' segundos.
+        """
+        future = self.submit(kind, version, fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+        except Exception:
+            # No memorizar fallas: el próximo intento vuelve a ajustar
+            with self._lock:
+                self._futures.pop((kind, version), None)
+            raise
@@ -2,7 +2,6 @@
 
 import streamlit as st
 import requests
-import json
 from menu import generarMenu
 
 # Configurar la página para que se vea en formato wide
@@ -28,8 +27,12 @@ def login(rut, password):
     response = requests.post("http://127.0.0.1:8000/login", json=user_data)    
 
     if response.status_code == 200:
+        data = response.json()
         st.session_state.logged_in = True
-        st.session_state.user_info = response.json().get("user")
+        st.session_state.user_info = data.get("user")
+        # Token firmado de la sesión: el menú y las páginas lo usan sin volver a consultar al usuario
+        st.session_state.token = data.get("token")
+        st.session_state.token_exp = data.get("expires_at", 0)
         st.success("Login exitoso")
         st.write(f"Bienvenido, {st.session_state.user_info['full_name']}!")
         st.write(f"Rut: {st.session_state.user_info['rut']}")
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# dimensiones.py
+"""
+Dimensiones (sucursales y calendario de periodos) cargadas una vez y
+consultadas por posición.
+
+Las páginas unían los hechos con df_sucursales y df_periodos con merge en
+cada ejecución (depositos.py creaba 'date_for_merge' en ambos lados solo
+para unir DM_PERIODO_DATE). Aquí cada dimensión se carga una vez por
+versión de los datos, se comparte entre sesiones (st.cache_resource) y
+resuelve la fila de cada hecho sin hash join:
+
+- sucursales: arreglo denso branch_office_id -> fila
+- calendario: días desde la primera fecha -> fila
+- periodos: índice de 'period' -> fila
+
+agregar() copia las columnas pedidas tomando esas filas (las categorías se
+copian por código).
+"""
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+
+from esquemas import dataframe
+from particiones import alcance
+from utils import get_json, version_datos
+
+
+class Dimension:
+    """Tabla de una dimensión con búsqueda de filas por 'clave'."""
+
+    def __init__(self, df, clave):
+        self.clave = clave
+        self.tabla = df.drop_duplicates(clave).reset_index(drop=True)
+        self._indice = pd.Index(self.tabla[clave])
+
+    @property
+    def columnas(self):
+        return [c for c in self.tabla.columns if c != self.clave]
+
+    def posiciones(self, valores):
+        """Fila de cada valor en la tabla; -1 si no está."""
+        return self._indice.get_indexer(valores)
+
+    def _tomar(self, columna, filas, index):
+        serie = self.tabla[columna]
+        if len(serie) == 0:
+            return pd.Series(np.nan, index=index)
+        valores = serie.take(np.maximum(filas, 0)).set_axis(index)
+        faltan = filas < 0
+        return valores.where(~faltan) if faltan.any() else valores
+
+    def agregar(self, df, columnas=None, clave=None):
+        """
+        'df' con las 'columnas' de la dimensión (todas por defecto) de la fila
+        de df[clave], como un merge how='left'. Las columnas que ya están en
+        'df' no se tocan.
+        """
+        filas = self.posiciones(df[clave or self.clave])
+        for columna in columnas or self.columnas:
+            if columna not in df.columns and columna in self.tabla.columns:
+                df[columna] = self._tomar(columna, filas, df.index)
+        return df
+
+
+class DimensionSucursales(Dimension):
+    """Sucursales con un arreglo denso branch_office_id -> fila."""
+
+    def __init__(self, df):
+        super().__init__(df, 'branch_office_id')
+        ids = self._indice.to_numpy(dtype=np.int64)
+        self._fila = np.full(ids.max() + 1 if len(ids) else 1, -1, dtype=np.int32)
+        self._fila[ids] = np.arange(len(ids))
+
+    def posiciones(self, valores):
+        ids = pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=float)
+        validos = np.isfinite(ids) & (ids >= 0) & (ids < len(self._fila))
+        filas = np.full(len(ids), -1, dtype=np.int32)
+        filas[validos] = self._fila[ids[validos].astype(np.int64)]
+        return filas
+
+
+class Calendario(Dimension):
+    """Calendario de periodos (DM_PERIODO_DATE) con búsqueda por días desde la primera fecha."""
+
+    def __init__(self, df):
+        super().__init__(df.assign(date=pd.to_datetime(df['date']).dt.normalize()), 'date')
+        if len(self.tabla):
+            self._inicio = self.tabla['date'].min()
+            dias = (self.tabla['date'] - self._inicio).dt.days.to_numpy()
+            self._fila = np.full(dias.max() + 1, -1, dtype=np.int32)
+            self._fila[dias] = np.arange(len(dias))
+        else:
+            self._inicio, self._fila = pd.Timestamp(0), np.full(1, -1, dtype=np.int32)
+
+    def posiciones(self, valores):
+        dias = (pd.to_datetime(pd.Series(valores)).dt.normalize() - self._inicio).dt.days.to_numpy(dtype=float)
+        validos = np.isfinite(dias) & (dias >= 0) & (dias < len(self._fila))
+        filas = np.full(len(dias), -1, dtype=np.int32)
+        filas[validos] = self._fila[dias[validos].astype(np.int64)]
+        return filas
+
+
+class _CargaFallida(Exception):
+    """Se lanza para no dejar en caché una dimensión vacía."""
+
+
+def _cargar(endpoint, token=None):
+    try:
+        return dataframe(endpoint, get_json(endpoint, token=token))
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Error al cargar {endpoint}: {e}")
+        raise _CargaFallida(endpoint) from e
+
+
+# Un objeto por alcance ('admin' o rut) y versión de los datos, compartido por las sesiones
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _sucursales(alcance_datos, version, _token):
+    return DimensionSucursales(_cargar("sucursales", _token))
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _calendario(version):
+    return Calendario(_cargar("periodos_date"))
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _periodos(version):
+    return Dimension(_cargar("periodos"), 'period')
+
+
+def sucursales(token=None):
+    """Sucursales del usuario del token (el backend las filtra)."""
+    token = token or st.session_state.get('token')
+    try:
+        return _sucursales(alcance(token), version_datos("sucursales"), token)
+    except _CargaFallida:
+        return DimensionSucursales(pd.DataFrame(columns=['branch_office_id']))
+
+
+def calendario():
+    """Calendario de DM_PERIODO_DATE (año anterior y actual)."""
+    try:
+        return _calendario(version_datos("periodos_date"))
+    except _CargaFallida:
+        return Calendario(pd.DataFrame(columns=['date']))
+
+
+def periodos():
+    """Periodos de DM_PERIODO por 'period'."""
+    try:
+        return _periodos(version_datos("periodos"))
+    except _CargaFallida:
+        return Dimension(pd.DataFrame(columns=['period']), 'period')
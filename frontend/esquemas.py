@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# esquemas.py
+"""
+Tipos de las columnas de cada endpoint para armar DataFrames compactos.
+
+pd.DataFrame(data['data']) deja los textos como objetos Python repetidos en
+cada fila (nombre de sucursal, responsable, supervisor...), los ids en int64
+y las fechas como texto que cada página convierte con pd.to_datetime. Con
+los tipos declarados aquí los textos de pocas categorías quedan como
+'category', los ids como enteros chicos y las fechas como datetime64 desde
+la carga: los DataFrames en caché ocupan menos y los merge/groupby son más
+rápidos.
+
+Los montos quedan en float64: en float32 las sumas de pesos de un año
+pierden unidades. Al agrupar por una columna 'category' se usa
+observed=True para no generar grupos vacíos, y para contar valores conteo()
+en vez de value_counts().
+"""
+import pandas as pd
+
+FECHA = "fecha"
+
+_SUCURSAL = {"branch_office_id": "int32"}
+_INGRESOS = {"date": FECHA, "periodo": "category", "año": "int16", "branch_office_id": "int32", "metrica": "category"}
+_PERSONAL = {col: "category" for col in ("RUT", "Trabajador", "Especialidad", "Sucursal", "Contrato", "Supervisor", "Turno")}
+
+ESQUEMAS = {
+    "sucursales": {
+        **_SUCURSAL,
+        **{col: "category" for col in ("responsable", "branch_office", "marca", "zona", "segmento", "region", "commune")},
+    },
+    "depositos": {"date": FECHA, **_SUCURSAL},
+    "recaudacion": {"date": FECHA, **_SUCURSAL},
+    "abonados": {
+        "date": FECHA, **_SUCURSAL, "dte_type_id": "int16", "status_id": "int16",
+        "rut": "category", "cliente": "category", "razon_social": "category", "status": "category",
+    },
+    "venta_hora": {"date": FECHA, **_SUCURSAL, "rango": "category"},
+    "ingresos_acum_dia": _INGRESOS,
+    "ingresos_acum_dia_ppto": _INGRESOS,
+    "periodos_date": {"date": FECHA, "año": "int16"},
+    "asistencia_diaria": {**_PERSONAL, "EntradaFecha": FECHA, "SalidaFecha": FECHA},
+    "inasistencias": {**_PERSONAL, "FechaInasistencia": FECHA, "Motivo": "category"},
+}
+
+
+def _convertir(serie, tipo):
+    if tipo == FECHA:
+        return pd.to_datetime(serie, errors="coerce")
+    if tipo.startswith("int"):
+        # Con nulos se deja como viene (float64): int32 no admite NaN
+        return serie if serie.isna().any() else serie.astype(tipo)
+    return serie.astype(tipo)
+
+
+def aplicar_esquema(endpoint, df):
+    """'df' con los tipos de ESQUEMAS[endpoint]; las columnas no declaradas no cambian."""
+    esquema = ESQUEMAS.get(endpoint.strip("/"), {})
+    for columna, tipo in esquema.items():
+        if columna in df.columns and str(df[columna].dtype) != tipo:
+            df[columna] = _convertir(df[columna], tipo)
+    return df
+
+
+def dataframe(endpoint, data):
+    """DataFrame de una respuesta {"columns", "data"} con los tipos de su endpoint."""
+    return aplicar_esquema(endpoint, pd.DataFrame(data['data'], columns=data['columns']))
+
+
+def conteo(serie):
+    """value_counts() sin las categorías que no aparecen (en 'category' se cuentan con 0)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.cat.remove_unused_categories()
+    return serie.value_counts()
+
+
+def rellenar(serie, valor):
+    """fillna(valor) que también sirve en columnas 'category' (agrega el valor a las categorías)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype) and valor not in serie.cat.categories:
+        serie = serie.cat.add_categories([valor])
+    return serie.fillna(valor)
@@ -1,19 +1,23 @@
+import time
 import streamlit as st
-import pandas as pd
-import requests
+from perfilador import iniciar_ejecucion
+
+def sesion_vigente():
+    """True si hay un token de sesión que aún no expira."""
+    return 'token' in st.session_state and st.session_state.get('token_exp', 0) > time.time()
 
 def generarMenu():
     """Genera el menú dependiendo del usuario"""
+    iniciar_ejecucion()
     with st.sidebar:
         if 'user_info' in st.session_state:
-            usuario = st.session_state.user_info['rut']
-            # Obtener los datos del usuario
-            response = requests.get(f"http://127.0.0.1:8000/api/usuarios/{usuario}")
-            if response.status_code == 200:
-                data = response.json()
-                dfUsuario = pd.DataFrame([data])  # Convertir el diccionario a un DataFrame
-                # Cargamos el nombre del usuario
-                nombre = dfUsuario['full_name'].values[0]
+            # Los datos del usuario vienen en la sesión del login: no se consulta el backend
+            if not sesion_vigente():
+                st.session_state.clear()
+                st.warning("Tu sesión expiró. Vuelve a iniciar sesión.")
+                return
+            nombre = st.session_state.user_info['full_name']
+            if nombre:
                 # Mostramos el nombre del usuario
                 st.write(f"Hola **:blue-background[{nombre}]** ")
                 # Mostramos los enlaces de páginas
@@ -33,6 +37,8 @@ def generarMenu():
                 st.page_link("pages/planificaciones.py", label="Malla Horaria", icon="📅")
                 st.page_link("pages/proyeccion.py", label="Proyeccion", icon="📅")
                 st.markdown("---")
+                # Mide las etapas de la página (ver perfilador.py)
+                st.toggle("⏱️ Perfilador", key="perfilador")
                 # Botón para cerrar la sesión
                 btnSalir = st.button("Salir")
                 if btnSalir:
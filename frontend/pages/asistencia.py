@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 import locale
 import requests
 from menu import generarMenu
+from utils import get_json, version_datos
+from esquemas import dataframe
 import plotly.express as px
 import plotly.graph_objects as go
 from io import BytesIO
@@ -37,18 +39,15 @@ st.markdown("---")
 
 # --- 2. FUNCIONES AUXILIARES ---
 
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint: str, params: dict = None):
-    API_BASE_URL = "http://localhost:8000"
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint: str, params: dict = None, token: str = None, version: str = None):
     try:
         with st.spinner(f'Cargando datos de {endpoint}...'):
-            response = requests.get(f"{API_BASE_URL}/{endpoint}", params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = get_json(endpoint, params=params, token=token)
             if 'data' not in data or 'columns' not in data:
                 st.error(f"Respuesta con formato incorrecto desde el endpoint '{endpoint}'")
                 return pd.DataFrame()
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Error al conectar con la API ({endpoint}): {e}")
@@ -126,7 +125,7 @@ selected_year = st.sidebar.selectbox("Año", list(range(current_year - 2, curren
 selected_month = st.sidebar.selectbox("Mes", range(1, 13), index=datetime.now().month - 1)
 
 params = {"year": selected_year, "month": selected_month}
-df_raw = fetch_data_from_endpoint("asistencia_diaria", params=params)
+df_raw = fetch_data_from_endpoint("asistencia_diaria", params=params, token=st.session_state.get("token"), version=version_datos("asistencia_diaria"))
 df_processed = process_asistencia_data(df_raw)
 
 if df_processed.empty:
@@ -231,13 +230,13 @@ else:
             st.write("#### Rankings de Trabajadores")
             col_extras, col_retrasos = st.columns(2)
             with col_extras:
-                top_extras = df_final_filtrado.groupby('Trabajador')['Horas Extraordinarias Minutos'].sum().nlargest(15).sort_values(ascending=True)
+                top_extras = df_final_filtrado.groupby('Trabajador', observed=True)['Horas Extraordinarias Minutos'].sum().nlargest(15).sort_values(ascending=True)
                 if not top_extras.empty:
                     fig_extras = px.bar(top_extras, x='Horas Extraordinarias Minutos', y=top_extras.index, orientation='h', title='Top 15: Más Horas Extras', text=top_extras.apply(minutes_to_time))
                     fig_extras.update_traces(marker_color='#38f9d7', texttemplate='%{text}', textposition='outside')
                     st.plotly_chart(fig_extras, use_container_width=True)
             with col_retrasos:
-                top_retrasos = df_final_filtrado.groupby('Trabajador')['Horas No Trabajadas Minutos'].sum().nlargest(15).sort_values(ascending=True)
+                top_retrasos = df_final_filtrado.groupby('Trabajador', observed=True)['Horas No Trabajadas Minutos'].sum().nlargest(15).sort_values(ascending=True)
                 if not top_retrasos.empty:
                     fig_retrasos = px.bar(top_retrasos, x='Horas No Trabajadas Minutos', y=top_retrasos.index, orientation='h', title='Top 15: Mayores Retrasos', text=top_retrasos.apply(minutes_to_time))
                     fig_retrasos.update_traces(marker_color='#f093fb', texttemplate='%{text}', textposition='outside')
@@ -249,7 +248,7 @@ else:
         st.header("Análisis Agrupado")
         if not df_final_filtrado.empty:
             st.write("#### Resumen por Supervisor")
-            summary_supervisor = df_final_filtrado.groupby('Supervisor').agg(
+            summary_supervisor = df_final_filtrado.groupby('Supervisor', observed=True).agg(
                 Cantidad_Trabajadores=('Trabajador', 'nunique'), Jornada_Turno_Total_Min=('Jornada Turno Minutos', 'sum'),
                 Jornada_Efectiva_Total_Min=('Jornada Efectiva Minutos', 'sum'), Horas_Perdidas_Total_Min=('Horas Perdidas Minutos', 'sum'),
                 Horas_Extraordinarias_Total_Min=('Horas Extraordinarias Minutos', 'sum'),
@@ -269,7 +268,7 @@ else:
             st.dataframe(summary_supervisor_with_totals[['Supervisor', 'Cantidad_Trabajadores', 'Tasa de Puntualidad', 'Horas_Planificadas_Total', 'Jornada_Efectiva_Total', 'Horas_Perdidas_Total', 'Horas_Extraordinarias_Total', 'Retrasos_Total']], use_container_width=True)
             st.markdown("---")
             st.write("#### Resumen por Sucursal")
-            summary_area = df_final_filtrado.groupby('Sucursal').agg(
+            summary_area = df_final_filtrado.groupby('Sucursal', observed=True).agg(
                 Cantidad_Trabajadores=('Trabajador', 'nunique'), Jornada_Turno_Total_Min=('Jornada Turno Minutos', 'sum'),
                 Jornada_Efectiva_Total_Min=('Jornada Efectiva Minutos', 'sum'), Horas_Perdidas_Total_Min=('Horas Perdidas Minutos', 'sum'),
                 Horas_Extraordinarias_Total_Min=('Horas Extraordinarias Minutos', 'sum'), Horas_No_Trabajadas_Total_Min=('Horas No Trabajadas Minutos', 'sum'),
@@ -286,7 +285,7 @@ else:
             st.dataframe(summary_area_with_totals[['Sucursal', 'Cantidad_Trabajadores', 'Tasa de Puntualidad', 'Horas_Planificadas_Total', 'Jornada_Efectiva_Total', 'Horas_Perdidas_Total', 'Horas_Extraordinarias_Total', 'Retrasos_Total']], use_container_width=True)
             st.markdown("---")
             st.write("#### Resumen por Trabajador (dentro de los grupos seleccionados)")
-            summary_trabajador_grupo = df_final_filtrado.groupby(['Trabajador', 'Sucursal', 'Supervisor']).agg(
+            summary_trabajador_grupo = df_final_filtrado.groupby(['Trabajador', 'Sucursal', 'Supervisor'], observed=True).agg(
                 Jornada_Turno_Total_Min=('Jornada Turno Minutos', 'sum'), Jornada_Efectiva_Total_Min=('Jornada Efectiva Minutos', 'sum'),
                 Horas_Perdidas_Total_Min=('Horas Perdidas Minutos', 'sum'), Horas_Extraordinarias_Total_Min=('Horas Extraordinarias Minutos', 'sum'),
                 Horas_No_Trabajadas_Total_Min=('Horas No Trabajadas Minutos', 'sum'), Total_Registros=('Puntual', 'size'),
@@ -311,7 +310,7 @@ else:
         if trabajadores_seleccionados:
             df_trabajador_detalle_view = df_final_filtrado[df_final_filtrado['Trabajador'].isin(trabajadores_seleccionados)].copy()
             if not df_trabajador_detalle_view.empty:
-                summary_trabajador = df_trabajador_detalle_view.groupby('Trabajador').agg(Total_Jornada_Turno_Min=('Jornada Turno Minutos', 'sum'), Total_Jornada_Efectiva_Min=('Jornada Efectiva Minutos', 'sum'), Total_Horas_Perdidas_Min=('Horas Perdidas Minutos', 'sum'), Total_Horas_No_Trabajadas_Min=('Horas No Trabajadas Minutos', 'sum'), Total_Horas_Extraordinarias_Min=('Horas Extraordinarias Minutos', 'sum')).reset_index()
+                summary_trabajador = df_trabajador_detalle_view.groupby('Trabajador', observed=True).agg(Total_Jornada_Turno_Min=('Jornada Turno Minutos', 'sum'), Total_Jornada_Efectiva_Min=('Jornada Efectiva Minutos', 'sum'), Total_Horas_Perdidas_Min=('Horas Perdidas Minutos', 'sum'), Total_Horas_No_Trabajadas_Min=('Horas No Trabajadas Minutos', 'sum'), Total_Horas_Extraordinarias_Min=('Horas Extraordinarias Minutos', 'sum')).reset_index()
                 for index, row in summary_trabajador.iterrows():
                     st.markdown(f"#### Resumen para: {row['Trabajador']}")
                     trabajador_info = df_trabajador_detalle_view[df_trabajador_detalle_view['Trabajador'] == row['Trabajador']].iloc[0]
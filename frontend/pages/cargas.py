@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 import mysql.connector
 from mysql.connector import Error
 from menu import generarMenu
+from utils import registrar_version_datos
 from dotenv import load_dotenv
 from pathlib import Path
 import requests
@@ -21,6 +22,7 @@ load_dotenv(env_path)
 
 # Añadir el directorio 'backend' al PYTHONPATH
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+from resumen_indicadores import actualizar_resumen
 
 # Configuración de la base de datos desde variables de entorno
 db_config = {
@@ -99,15 +101,20 @@ def save_to_database(data, tipo_indicador):
         cursor = create_cursor(cnx)
 
         # Insertar datos en la tabla correspondiente
+        fechas = []
         for entry in data['serie']:
-            fecha = datetime.strptime(entry['fecha'], '%Y-%m-%dT%H:%M:%S.%fZ').strftime('%Y-%m-%d')
+            fecha = datetime.strptime(entry['fecha'], '%Y-%m-%dT%H:%M:%S.%fZ').date()
+            fechas.append(fecha)
             insert_query = f"""
             INSERT INTO DM_{tipo_indicador} (fecha, valor)
             VALUES (%s, %s)
             ON DUPLICATE KEY UPDATE valor = VALUES(valor)
             """
-            cursor.execute(insert_query, (fecha, entry['valor']))
+            cursor.execute(insert_query, (fecha.strftime('%Y-%m-%d'), entry['valor']))
 
+        # Meses cargados en el resumen mensual que leen los endpoints de indicadores
+        actualizar_resumen(cursor, tipo_indicador, min(fechas), max(fechas))
+        registrar_version_datos(cursor, f'DM_{tipo_indicador}')
         cnx.commit()
         close_connection(cnx)
 
@@ -173,6 +180,7 @@ def update_venta_x_hora(year, month):
         {base_query}
         """
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'DETALLE_VENTA_HORA')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Ejecutar la consulta base para obtener los datos
@@ -278,6 +286,7 @@ def update_ingresos_acumulado_actual():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -369,6 +378,7 @@ def update_ingresos_mes_actual():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -464,6 +474,7 @@ def update_ingresos_acumulado_anterior():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -555,6 +566,7 @@ def update_ingresos_mes_anterior():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -647,6 +659,7 @@ def update_ingresos_acumulado_ppto():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -733,6 +746,7 @@ def update_ingresos_mes_ppto():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'KPI_INGRESOS_IMG_MES')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -809,6 +823,7 @@ def update_abonados_actual():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'CABECERA_ABONADOS')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -862,6 +877,7 @@ def update_depositos_dia():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'DETALLE_DEPOSITOS_DIA')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -918,6 +934,7 @@ def update_recaudacion_dia():
 
         # Ejecutar la consulta de inserción
         cursor.execute(insert_query)
+        registrar_version_datos(cursor, 'DETALLE_RECAUDACION_DIA')
         connection.commit()  # Confirmar la transacción de inserción
 
         # Cerrar la conexión
@@ -1059,8 +1076,10 @@ def cargar_asistencia_diaria(year, month, uploaded_file):
                 ))
             
             cursor.executemany(insert_query, data_to_insert)
+            registros_insertados = cursor.rowcount
+            registrar_version_datos(cursor, 'ASISTENCIA_DIARIA')
             cnx.commit()
-            st.success(f"¡Éxito! Se han guardado {cursor.rowcount} nuevos registros de asistencia.")
+            st.success(f"¡Éxito! Se han guardado {registros_insertados} nuevos registros de asistencia.")
             
     except Exception as e:
         st.error(f"Ocurrió un error inesperado durante el proceso de carga: {e}")
@@ -1160,8 +1179,10 @@ def cargar_inasistencias(year, month, uploaded_file):
                 ))
             
             cursor.executemany(insert_query, data_to_insert)
+            registros_insertados = cursor.rowcount
+            registrar_version_datos(cursor, 'INASISTENCIAS')
             cnx.commit()
-            st.success(f"¡Éxito! Se han guardado {cursor.rowcount} nuevos registros de inasistencias.")
+            st.success(f"¡Éxito! Se han guardado {registros_insertados} nuevos registros de inasistencias.")
             
     except Exception as e:
         st.error(f"Ocurrió un error inesperado durante la carga de inasistencias: {e}")
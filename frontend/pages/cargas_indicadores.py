@@ -9,6 +9,7 @@ from mysql.connector import Error
 from dotenv import load_dotenv
 from pathlib import Path
 from menu import generarMenu
+from utils import registrar_version_datos
 
 
 # Obtener la ruta del directorio actual del script
@@ -23,6 +24,7 @@ load_dotenv(env_path)
 
 # Añadir el directorio 'backend' al PYTHONPATH
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../backend')))
+from resumen_indicadores import actualizar_resumen
 
 # Configuración de la base de datos desde variables de entorno
 db_config = {
@@ -89,15 +91,20 @@ def save_to_database(data, tipo_indicador):
         cursor = create_cursor(cnx)
 
         # Insertar datos en la tabla correspondiente
+        fechas = []
         for entry in data['serie']:
-            fecha = datetime.strptime(entry['fecha'], '%Y-%m-%dT%H:%M:%S.%fZ').strftime('%Y-%m-%d')
+            fecha = datetime.strptime(entry['fecha'], '%Y-%m-%dT%H:%M:%S.%fZ').date()
+            fechas.append(fecha)
             insert_query = f"""
             INSERT INTO DM_{tipo_indicador} (fecha, valor)
             VALUES (%s, %s)
             ON DUPLICATE KEY UPDATE valor = VALUES(valor)
             """
-            cursor.execute(insert_query, (fecha, entry['valor']))
+            cursor.execute(insert_query, (fecha.strftime('%Y-%m-%d'), entry['valor']))
 
+        # Meses cargados en el resumen mensual que leen los endpoints de indicadores
+        actualizar_resumen(cursor, tipo_indicador, min(fechas), max(fechas))
+        registrar_version_datos(cursor, f'DM_{tipo_indicador}')
         cnx.commit()
         close_connection(cnx)
 
@@ -12,14 +12,20 @@ from scipy import stats
 from scipy.signal import find_peaks
 import seaborn as sns
 from menu import generarMenu
-from utils import format_currency, format_percentage
+from perfilador import perfilado, mostrar_perfil
+from utils import format_currency, format_percentage, get_json, version_datos
+from esquemas import aplicar_esquema, dataframe
+import dimensiones
+import particiones
+from series_tiempo import medias_moviles
 import warnings
 import base64
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
 import plotly.figure_factory as ff
+from anomalias import (
+    FEATURES as ANOMALY_FEATURES, AnomalyService, data_version, fit_isolation_forest,
+    fit_kmeans, robust_branch_flags, zscores
+)
 
 warnings.filterwarnings('ignore')
 
@@ -68,34 +74,24 @@ st.markdown("""
 generarMenu()
 
 # ================ FUNCIONES DE OBTENCIÓN DE DATOS MEJORADAS ================
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint, sucursales=None, rut=None):
-    """Función mejorada para obtener datos de endpoints con manejo de errores"""
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
+    """
+    Función mejorada para obtener datos de endpoints con manejo de errores.
+    El backend filtra las filas según las sucursales del usuario del token.
+    """
     try:
         with st.spinner(f'Cargando datos de {endpoint}...'):
-            if endpoint == "sucursales" and rut:
-                # Si el endpoint es sucursales y tenemos un rut, usamos el endpoint sucursales_rut
-                response = requests.get(f"http://localhost:8000/sucursales_rut", params={"rut": rut}, timeout=30)
-            else:
-                # Para otros endpoints, usamos la URL normal
-                response = requests.get(f"http://localhost:8000/{endpoint}", timeout=30)
-
-            response.raise_for_status()
-            data = response.json()
+            if endpoint in particiones.ENDPOINTS:
+                # Desde el caché por mes en disco, compartido por las sesiones del host
+                return aplicar_esquema(endpoint, particiones.leer(endpoint, token))
+            data = get_json(endpoint, token=token)
 
             if 'data' not in data or 'columns' not in data:
                 st.error(f"Formato de datos incorrecto en {endpoint}")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(data['data'], columns=data['columns'])
-
-            # Filtrar por sucursales si se proporcionan
-            if sucursales is not None and not df.empty and 'branch_office_id' in df.columns:
-                st.write(f"Filtrando sucursales: {sucursales}")  # Depuración
-                df = df[df['branch_office_id'].isin(sucursales)]
-                st.write(f"DataFrame después del filtrado: {df}")  # Depuración
-
-            return df
+            return dataframe(endpoint, data)
 
     except requests.exceptions.Timeout:
         st.error(f"⏱️ Timeout al conectar con {endpoint}")
@@ -110,27 +106,30 @@ def fetch_data_from_endpoint(endpoint, sucursales=None, rut=None):
         st.error(f"💥 Error inesperado en {endpoint}: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=600)
-def load_and_process_data():
-    """Carga y procesa todos los datos necesarios"""
-    # Obtener las sucursales del usuario desde st.session_state
-    rut = None
-    sucursales = None
-    if 'user_info' in st.session_state and 'rut' in st.session_state.user_info:
-        rut = st.session_state.user_info['rut']
-        st.write(f"RUT del usuario: {rut}")  # Depuración
-
-    st.write(f"RUT del usuario: {rut}")
-
-    # Cargar datos
-    df_deposito = fetch_data_from_endpoint("depositos", sucursales)
-    df_recaudacion = fetch_data_from_endpoint("recaudacion", sucursales)
-    df_sucursales = fetch_data_from_endpoint("sucursales", sucursales, rut=rut)  # Pasar el rut al endpoint de sucursales
+# Columnas con medias móviles de 7 y 30 días
+MEDIAS_MOVILES = ['recaudado', 'depositado', 'diferencia']
 
-    st.write("DataFrame de sucursales después de filtrar:")
-    st.write(df_sucursales)
-
-    df_periodos = fetch_data_from_endpoint("periodos_date")
+@st.cache_data(show_spinner=False, max_entries=16)
+def fetch_medias_moviles(token=None, version=None):
+    """
+    Medias móviles de 7 y 30 días ya calculadas en el backend (motor analítico,
+    /analitica/depositos_diarios), una vez por versión de los datos para todas
+    las sesiones. None si el motor no está disponible.
+    """
+    try:
+        data = get_json("analitica/depositos_diarios", token=token)
+    except requests.exceptions.RequestException:
+        return None
+    df = pd.DataFrame(data['data'], columns=data['columns'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df[['branch_office_id', 'date'] + [f'{col}_{ma}' for col in MEDIAS_MOVILES for ma in ('ma7', 'ma30')]]
+
+@perfilado("fetch")
+@st.cache_data(max_entries=16)
+def load_and_process_data(token=None, version=None):
+    """Carga y procesa todos los datos necesarios (solo las sucursales del usuario)"""
+    df_deposito = fetch_data_from_endpoint("depositos", token=token, version=version_datos("depositos"))
+    df_recaudacion = fetch_data_from_endpoint("recaudacion", token=token, version=version_datos("recaudacion"))
 
     if df_deposito.empty or df_recaudacion.empty:
         return pd.DataFrame(), {}
@@ -141,23 +140,10 @@ def load_and_process_data():
     dte_final['diferencia'] = dte_final['recaudacion'] - dte_final['deposito']
     dte_final['status'] = dte_final['diferencia'].apply(lambda x: "Si" if x != 0 else "No")
 
-    # Merge con sucursales
-    if not df_sucursales.empty:
-        dte_final = dte_final.merge(
-            df_sucursales[['branch_office_id', 'responsable', 'branch_office']],
-            on='branch_office_id', how='left'
-        )
-
-    # Procesar fechas
+    # Sucursal y periodo desde las dimensiones en memoria (sin merge)
     dte_final['date'] = pd.to_datetime(dte_final['date'])
-    if not df_periodos.empty:
-        df_periodos['date'] = pd.to_datetime(df_periodos['date'])
-        dte_final['date_for_merge'] = dte_final['date'].dt.date
-        df_periodos['date_for_merge'] = df_periodos['date'].dt.date
-        dte_final = dte_final.merge(
-            df_periodos[['date_for_merge', 'periodo', 'period', 'año']],
-            on='date_for_merge', how='left'
-        )
+    dte_final = dimensiones.sucursales(token).agregar(dte_final, ['responsable', 'branch_office'])
+    dte_final = dimensiones.calendario().agregar(dte_final, ['periodo', 'period', 'año'])
 
     # Renombrar columnas
     dte_final.rename(columns={
@@ -174,15 +160,14 @@ def load_and_process_data():
     dte_final['ratio_deposito'] = np.where(dte_final['recaudado'] > 0,
                                           dte_final['depositado'] / dte_final['recaudado'], 0)
 
-    # Calcular métricas móviles
+    # Calcular métricas móviles: las del backend si están, si no en una pasada vectorizada
     dte_final = dte_final.sort_values(['sucursal', 'date'])
-    for col in ['recaudado', 'depositado', 'diferencia']:
-        dte_final[f'{col}_ma7'] = dte_final.groupby('sucursal')[col].transform(
-            lambda x: x.rolling(window=7, min_periods=1).mean()
-        )
-        dte_final[f'{col}_ma30'] = dte_final.groupby('sucursal')[col].transform(
-            lambda x: x.rolling(window=30, min_periods=1).mean()
-        )
+    df_moviles = fetch_medias_moviles(token=token, version=version_datos("analitica/depositos_diarios"))
+    if df_moviles is not None:
+        dte_final = dte_final.merge(df_moviles, on=['branch_office_id', 'date'], how='left')
+    if df_moviles is None or dte_final[df_moviles.columns[2:]].isna().any().any():
+        dte_final = medias_moviles(dte_final.drop(columns=dte_final.filter(regex='_ma(7|30)$').columns),
+                                   MEDIAS_MOVILES, ventanas=(7, 30))
 
     # Estadísticas de calidad de datos
     data_quality = {
@@ -191,12 +176,15 @@ def load_and_process_data():
         'duplicates': dte_final.duplicated().sum(),
         'date_range': (dte_final['date'].min(), dte_final['date'].max()),
         'unique_branches': dte_final['sucursal'].nunique(),
-        'data_completeness': (1 - dte_final.isnull().sum().sum() / (len(dte_final) * len(dte_final.columns))) * 100
+        'data_completeness': (1 - dte_final.isnull().sum().sum() / (len(dte_final) * len(dte_final.columns))) * 100,
+        # Versión de los datos: llave de los modelos de anomalías y clustering
+        'version': data_version(dte_final, ['branch_office_id', 'date'] + ANOMALY_FEATURES)
     }
 
     return dte_final, data_quality
 
 # ================ ANÁLISIS ESTADÍSTICOS AVANZADOS ================
+@perfilado("model")
 def advanced_statistical_analysis(df):
     """Análisis estadístico completo y avanzado"""
     if df.empty:
@@ -303,8 +291,18 @@ def advanced_statistical_analysis(df):
 
     return analysis
 
-def detect_anomalies_advanced(df):
-    """Detección avanzada de anomalías usando múltiples métodos"""
+@st.cache_resource
+def get_anomaly_service():
+    """Servicio compartido entre sesiones que ajusta los modelos en segundo plano."""
+    return AnomalyService()
+
+@perfilado("model")
+def detect_anomalies_advanced(df, df_base, version):
+    """
+    Detección avanzada de anomalías usando múltiples métodos.
+    IsolationForest se ajusta una vez por versión de datos sobre 'df_base'
+    (los datos sin filtrar) y aquí solo se puntúan las filas filtradas.
+    """
     if df.empty:
         return df, {}
 
@@ -312,47 +310,38 @@ def detect_anomalies_advanced(df):
     anomaly_info = {}
 
     # Características para análisis
-    features = ['recaudado', 'depositado', 'diferencia', 'ratio_deposito']
-    available_features = [col for col in features if col in df.columns]
+    available_features = [col for col in ANOMALY_FEATURES if col in df.columns]
 
     if not available_features:
         return df_result, anomaly_info
 
-    # 1. Isolation Forest
-    if len(df) > 10:
-        scaler = StandardScaler()
-        X = scaler.fit_transform(df[available_features].fillna(0))
-
-        iso_forest = IsolationForest(contamination=0.1, random_state=42)
-        df_result['anomaly_isolation'] = iso_forest.fit_predict(X) == -1
+    # 1. Isolation Forest (modelo memorizado por versión de datos)
+    df_result['anomaly_isolation'] = False
+    if len(df_base) > 10:
+        modelo = get_anomaly_service().result(
+            'isolation_forest', version, fit_isolation_forest,
+            df_base[available_features].fillna(0), timeout=5
+        )
+        if modelo is None:
+            anomaly_info['isolation_forest'] = {'estado': 'Modelo en entrenamiento, vuelva a cargar en unos segundos'}
+        else:
+            scaler, iso_forest = modelo
+            X = scaler.transform(df[available_features].fillna(0))
+            df_result['anomaly_isolation'] = iso_forest.predict(X) == -1
+            anomaly_info['isolation_forest'] = {
+                'total_anomalies': int(df_result['anomaly_isolation'].sum()),
+                'percentage': (df_result['anomaly_isolation'].sum() / len(df_result)) * 100
+            }
 
-        anomaly_info['isolation_forest'] = {
-            'total_anomalies': df_result['anomaly_isolation'].sum(),
-            'percentage': (df_result['anomaly_isolation'].sum() / len(df_result)) * 100
-        }
+    # 2. Z-Score multivariado (todas las columnas a la vez)
+    z_scores = zscores(df, available_features)
+    for col in z_scores.columns:
+        df_result[f'zscore_{col}'] = z_scores[col]
+        df_result[f'anomaly_zscore_{col}'] = z_scores[col] > 3
 
-    # 2. Z-Score multivariado
-    for col in available_features:
-        if df[col].std() > 0:
-            z_scores = np.abs(stats.zscore(df[col].fillna(df[col].mean())))
-            df_result[f'zscore_{col}'] = z_scores
-            df_result[f'anomaly_zscore_{col}'] = z_scores > 3
-
-    # 3. IQR method por sucursal
+    # 3. IQR por sucursal (una sola pasada de groupby-quantile)
     if 'sucursal' in df.columns:
-        for sucursal in df['sucursal'].unique():
-            mask = df['sucursal'] == sucursal
-            for col in available_features:
-                data = df.loc[mask, col]
-                if len(data) > 4:
-                    Q1 = data.quantile(0.25)
-                    Q3 = data.quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-
-                    outlier_mask = (data < lower_bound) | (data > upper_bound)
-                    df_result.loc[mask, f'anomaly_iqr_{col}'] = outlier_mask
+        df_result = df_result.join(robust_branch_flags(df, available_features))
 
     # 4. Detección de picos
     for col in available_features:
@@ -364,37 +353,33 @@ def detect_anomalies_advanced(df):
 
     return df_result, anomaly_info
 
-def clustering_analysis(df):
-    """Análisis de clustering para segmentación"""
+@perfilado("model")
+def clustering_analysis(df, df_base, version):
+    """
+    Análisis de clustering para segmentación.
+    KMeans (k=3) se ajusta una vez por versión de datos sobre 'df_base' y las
+    filas filtradas se asignan al centroide más cercano.
+    """
     if df.empty:
         return df, {}
 
     # Características para clustering
-    features = ['recaudado', 'depositado', 'diferencia', 'ratio_deposito']
-    available_features = [col for col in features if col in df.columns]
+    available_features = [col for col in ANOMALY_FEATURES if col in df.columns]
 
-    if len(available_features) < 2 or len(df) < 10:
+    if len(available_features) < 2 or len(df_base) < 10:
         return df, {}
 
-    # Preparar datos
-    X = df[available_features].fillna(0)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # Determinar número óptimo de clusters usando método del codo
-    max_clusters = min(10, len(df) // 2)
-    inertias = []
-    K_range = range(2, max_clusters + 1)
-
-    for k in K_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        kmeans.fit(X_scaled)
-        inertias.append(kmeans.inertia_)
+    optimal_k = 3
+    modelo = get_anomaly_service().result(
+        'kmeans', version, fit_kmeans,
+        df_base[available_features].fillna(0), optimal_k, timeout=5
+    )
+    if modelo is None:
+        return df, {'estado': 'Modelo en entrenamiento, vuelva a cargar en unos segundos'}
 
-    # Aplicar K-means con número óptimo (usando método simple)
-    optimal_k = 3 if len(K_range) >= 2 else 2
-    kmeans = KMeans(n_clusters=optimal_k, random_state=42, n_init=10)
-    df['cluster'] = kmeans.fit_predict(X_scaled)
+    scaler, kmeans = modelo
+    df = df.copy()
+    df['cluster'] = kmeans.predict(scaler.transform(df[available_features].fillna(0)))
 
     # Análisis de clusters
     cluster_analysis = {}
@@ -411,14 +396,14 @@ def clustering_analysis(df):
             }
         }
 
-    return df, {'clusters': cluster_analysis, 'optimal_k': optimal_k, 'inertias': inertias}
+    return df, {'clusters': cluster_analysis, 'optimal_k': optimal_k}
 
 # ================ VISUALIZACIONES AVANZADAS ================
 def create_advanced_dashboard():
     """Crea dashboard principal con múltiples pestañas"""
 
     # Cargar datos
-    df, data_quality = load_and_process_data()
+    df, data_quality = load_and_process_data(st.session_state.get("token"), version_datos("depositos", "recaudacion", "sucursales", "periodos_date"))
 
     if df.empty:
         st.error("❌ No se pudieron cargar los datos")
@@ -464,17 +449,18 @@ def create_advanced_dashboard():
         create_temporal_analysis(df_filtered)
 
     with tab3:
-        create_anomaly_detection_tab(df_filtered)
+        create_anomaly_detection_tab(df_filtered, df, data_quality['version'])
 
     with tab4:
         create_statistical_analysis_tab(df_filtered)
 
     with tab5:
-        create_clustering_tab(df_filtered)
+        create_clustering_tab(df_filtered, df, data_quality['version'])
 
     with tab6:
         create_branch_analysis_tab(df_filtered)
 
+@perfilado("transform")
 def apply_filters(df):
     """Aplica filtros desde sidebar"""
     st.sidebar.header("🔍 Filtros de Análisis")
@@ -543,6 +529,7 @@ def apply_filters(df):
 
     return df_filtered
 
+@perfilado("chart")
 def create_executive_summary(df):
     """Pestaña de resumen ejecutivo"""
     if df.empty:
@@ -575,7 +562,7 @@ def create_executive_summary(df):
     with col1:
         # Distribución por sucursal
         fig_pie = px.pie(
-            df.groupby('sucursal')['recaudado'].sum().reset_index(),
+            df.groupby('sucursal', observed=True)['recaudado'].sum().reset_index(),
             values='recaudado',
             names='sucursal',
             title='Distribución de Recaudación por Sucursal'
@@ -638,6 +625,7 @@ def create_executive_summary(df):
         </div>
         """.format(tasa_discrepancias), unsafe_allow_html=True)
 
+@perfilado("chart")
 def create_temporal_analysis(df):
     """Análisis temporal avanzado"""
     if df.empty:
@@ -699,7 +687,8 @@ def create_temporal_analysis(df):
     fig.update_layout(height=800, showlegend=True)
     st.plotly_chart(fig, use_container_width=True)
 
-def create_anomaly_detection_tab(df):
+@perfilado("chart")
+def create_anomaly_detection_tab(df, df_base, version):
     """Pestaña de detección de anomalías"""
     if df.empty:
         st.warning("No hay datos para detección de anomalías")
@@ -708,7 +697,7 @@ def create_anomaly_detection_tab(df):
     st.subheader("🔍 Detección de Anomalías")
 
     # Aplicar detección de anomalías
-    df_with_anomalies, anomaly_info = detect_anomalies_advanced(df)
+    df_with_anomalies, anomaly_info = detect_anomalies_advanced(df, df_base, version)
 
     # Mostrar información de anomalías
     st.write("### Información de Anomalías")
@@ -739,6 +728,7 @@ def create_anomaly_detection_tab(df):
         )
         st.plotly_chart(fig_zscore, use_container_width=True)
 
+@perfilado("chart")
 def create_statistical_analysis_tab(df):
     """Pestaña de análisis estadístico"""
     if df.empty:
@@ -797,7 +787,8 @@ def create_statistical_analysis_tab(df):
             st.write("---")
 
 
-def create_clustering_tab(df):
+@perfilado("chart")
+def create_clustering_tab(df, df_base, version):
     """Pestaña de análisis de clustering"""
     if df.empty:
         st.warning("No hay datos para análisis de clustering")
@@ -806,12 +797,16 @@ def create_clustering_tab(df):
     st.subheader("🎯 Análisis de Segmentación por Clustering")
 
     # Realizar análisis de clustering
-    df_with_clusters, cluster_info = clustering_analysis(df)
+    df_with_clusters, cluster_info = clustering_analysis(df, df_base, version)
 
     # Mostrar información de clusters
     st.write("### Información de Clusters")
     st.json(cluster_info)
 
+    if 'cluster' not in df_with_clusters.columns:
+        st.info("⏳ El modelo de segmentación aún no está disponible.")
+        return
+
     # Visualización de clusters
     fig_cluster = px.scatter(
         df_with_clusters,
@@ -822,6 +817,7 @@ def create_clustering_tab(df):
     )
     st.plotly_chart(fig_cluster, use_container_width=True)
 
+@perfilado("chart")
 def create_branch_analysis_tab(df):
     """Pestaña de análisis por sucursal"""
     if df.empty:
@@ -831,7 +827,7 @@ def create_branch_analysis_tab(df):
     st.subheader("🏢 Análisis por Sucursal")
 
     # Análisis por sucursal
-    sucursal_stats = df.groupby('sucursal').agg({
+    sucursal_stats = df.groupby('sucursal', observed=True).agg({
         'recaudado': ['sum', 'mean', 'std'],
         'depositado': ['sum', 'mean', 'std'],
         'diferencia': ['sum', 'mean', 'std']
@@ -920,3 +916,4 @@ def create_branch_analysis_tab(df):
 # Punto de entrada de la aplicación
 if __name__ == "__main__":
     create_advanced_dashboard()
+    mostrar_perfil("depositos")
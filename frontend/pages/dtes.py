@@ -7,7 +7,10 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from menu import generarMenu
-from utils import format_currency, format_percentage
+from utils import format_currency, format_percentage, get_json, version_datos
+from esquemas import aplicar_esquema, conteo, dataframe, rellenar
+import dimensiones
+import particiones
 
 # Configuración de página
 st.set_page_config(page_title="Dashboard DTEs", layout="wide")
@@ -26,39 +29,31 @@ st.markdown("""
 st.markdown("---")
 
 # Función para obtener datos de un endpoint
-@st.cache_data(ttl=300)  # Cache por 5 minutos
-def fetch_data_from_endpoint(endpoint, rut=None):
+@st.cache_data(max_entries=32)  # Se invalida con la versión de los datos
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
     try:
-        if endpoint == "sucursales" and rut:
-            # Usar el endpoint sucursales_rut si se proporciona un rut
-            response = requests.get(f"http://localhost:8000/sucursales_rut", params={"rut": rut})
-        else:
-            # Para otros endpoints, usar la URL normal
-            response = requests.get(f"http://localhost:8000/{endpoint}")
-
-        response.raise_for_status()
-        data = response.json()
-        df = pd.DataFrame(data['data'], columns=data['columns'])
+        # El backend filtra las filas según las sucursales del usuario del token
+        if endpoint in particiones.ENDPOINTS:
+            return aplicar_esquema(endpoint, particiones.leer(endpoint, token))
+        data = get_json(endpoint, token=token)
+        df = dataframe(endpoint, data)
         return df
     except requests.exceptions.RequestException as e:
         st.error(f"Error al obtener datos del endpoint {endpoint}: {e}")
         return pd.DataFrame()
 
 # Obtener datos
-rut = None
-if 'user_info' in st.session_state and 'rut' in st.session_state.user_info:
-    rut = st.session_state.user_info['rut']
+token = st.session_state.get("token")
 
 with st.spinner('Cargando datos...'):
-    df_abonados = fetch_data_from_endpoint("abonados")
+    df_abonados = fetch_data_from_endpoint("abonados", token=token, version=version_datos("abonados"))
     st.write(df_abonados)
-    df_sucursales = fetch_data_from_endpoint("sucursales", rut=rut)  # Pasar el rut al endpoint de sucursales
-    st.write(df_sucursales)
-    df_periodos = fetch_data_from_endpoint("periodos")
+    dim_sucursales = dimensiones.sucursales(token)
+    st.write(dim_sucursales.tabla)
 
-# Procesar datos
-dte_final = df_abonados.merge(df_sucursales, on='branch_office_id', how='left')
-dte_final = dte_final.merge(df_periodos, left_on='period', right_on='period', how='left')
+# Procesar datos: sucursal y periodo desde las dimensiones en memoria
+dte_final = dim_sucursales.agregar(df_abonados)
+dte_final = dimensiones.periodos().agregar(dte_final)
 
 # Verificar la fusión
 st.write("DataFrame después de la fusión:")
@@ -72,7 +67,7 @@ dte_final = dte_final.rename(columns={
 })
 
 # Asegúrate de que no hay valores NaN en la columna 'responsable'
-dte_final['responsable'] = dte_final['responsable'].fillna('Sin Responsable')
+dte_final['responsable'] = rellenar(dte_final['responsable'], 'Sin Responsable')
 
 # Verificar la limpieza de datos
 st.write("Valores únicos en 'responsable' después de la limpieza:")
@@ -179,8 +174,8 @@ with col1:
     st.subheader("📊 Distribución por Status")
     
     # Gráfico de dona - Status
-    status_counts = df_filtrado['status'].value_counts()
-    status_amounts = df_filtrado.groupby('status')['total'].sum()
+    status_counts = conteo(df_filtrado['status'])
+    status_amounts = df_filtrado.groupby('status', observed=True)['total'].sum()
     
     fig_status = go.Figure(data=[go.Pie(
         labels=status_counts.index,
@@ -224,7 +219,7 @@ with col1:
     # Evolución por período
     st.subheader("📅 Evolución por Período")
     
-    periodo_analysis = df_filtrado.groupby(['Periodo', 'status']).agg({
+    periodo_analysis = df_filtrado.groupby(['Periodo', 'status'], observed=True).agg({
         'contador': 'sum',
         'total': 'sum'
     }).reset_index()
@@ -245,7 +240,7 @@ with col2:
     # Top sucursales
     st.subheader("🏢 Top 10 Sucursales")
     
-    sucursal_analysis = df_filtrado.groupby('sucursal').agg({
+    sucursal_analysis = df_filtrado.groupby('sucursal', observed=True).agg({
         'contador': 'sum',
         'total': 'sum'
     }).reset_index().sort_values('total', ascending=False).head(10)
@@ -268,7 +263,7 @@ if responsable_seleccionados:
     st.markdown("---")
     st.subheader("👥 Análisis por Responsable")
     
-    responsable_analysis = df_filtrado.groupby(['responsable', 'status']).agg({
+    responsable_analysis = df_filtrado.groupby(['responsable', 'status'], observed=True).agg({
         'contador': 'sum',
         'total': 'sum'
     }).reset_index()
@@ -291,7 +286,8 @@ st.subheader("📋 Resumen Detallado")
 tab1, tab2, tab3 = st.tabs(["📊 Resumen por Sucursal", "👥 Resumen por Responsable", "📅 Resumen por Período"])
 
 with tab1:
-    resumen_sucursal = df_filtrado.groupby('sucursal').agg({
+    # 'status' como object: agg no admite un dict por grupo en una columna 'category'
+    resumen_sucursal = df_filtrado.assign(status=df_filtrado['status'].astype(object)).groupby('sucursal', observed=True).agg({
         'contador': 'sum',
         'total': ['sum', 'mean'],
         'status': lambda x: x.value_counts().to_dict()
@@ -305,7 +301,7 @@ with tab1:
 
 with tab2:
     if not df_filtrado.empty:
-        resumen_responsable = df_filtrado.groupby('responsable').agg({
+        resumen_responsable = df_filtrado.groupby('responsable', observed=True).agg({
             'contador': 'sum',
             'total': ['sum', 'mean'],
             'sucursal': 'nunique'
@@ -5,6 +5,8 @@ from datetime import datetime
 import locale
 import requests
 from menu import generarMenu
+from utils import get_json, version_datos
+from esquemas import conteo, dataframe, rellenar
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -36,19 +38,16 @@ st.markdown("---")
 
 # --- 2. FUNCIONES AUXILIARES ---
 
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint: str, params: dict = None):
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint: str, params: dict = None, token: str = None, version: str = None):
     """Función genérica para obtener datos de la API."""
-    API_BASE_URL = "http://localhost:8000"
     try:
         with st.spinner(f'Cargando datos de {endpoint}...'):
-            response = requests.get(f"{API_BASE_URL}/{endpoint}", params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = get_json(endpoint, params=params, token=token)
             if 'data' not in data or 'columns' not in data:
                 st.error(f"Respuesta con formato incorrecto desde '{endpoint}'")
                 return pd.DataFrame()
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Error al conectar con la API ({endpoint}): {e}")
@@ -70,7 +69,7 @@ def process_inasistencia_data(df):
         'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
     }
     df['Dia Sem'] = df['Dia Sem'].map(traduccion_dias).fillna(df['Dia Sem'])
-    df['Motivo'] = df['Motivo'].fillna('No especificado')
+    df['Motivo'] = rellenar(df['Motivo'], 'No especificado')
     return df
 
 
@@ -86,7 +85,7 @@ selected_year = st.sidebar.selectbox("Año", list(range(current_year - 2, curren
 selected_month = st.sidebar.selectbox("Mes", range(1, 13), index=datetime.now().month - 1)
 
 params = {"year": selected_year, "month": selected_month}
-df_raw = fetch_data_from_endpoint("inasistencias", params=params)
+df_raw = fetch_data_from_endpoint("inasistencias", params=params, token=st.session_state.get("token"), version=version_datos("inasistencias"))
 df_processed = process_inasistencia_data(df_raw)
 
 
@@ -166,7 +165,7 @@ else:
             col1, col2 = st.columns(2)
             with col1:
                 st.write("#### Inasistencias por Motivo")
-                motivo_counts = df_final_filtrado['Motivo'].value_counts().nlargest(10)
+                motivo_counts = conteo(df_final_filtrado['Motivo']).nlargest(10)
                 fig_motivos = px.bar(motivo_counts, y=motivo_counts.index, x=motivo_counts.values, orientation='h', 
                                      labels={'y': 'Motivo', 'x': 'Cantidad de Inasistencias'},
                                      text=motivo_counts.values)
@@ -188,7 +187,7 @@ else:
         st.header("Análisis Agrupado de Inasistencias")
         if not df_final_filtrado.empty:
             st.write("#### Resumen por Sucursal")
-            summary_sucursal = df_final_filtrado.groupby('Sucursal').agg(
+            summary_sucursal = df_final_filtrado.groupby('Sucursal', observed=True).agg(
                 Total_Inasistencias=('Trabajador', 'size'),
                 Trabajadores_Unicos=('Trabajador', 'nunique')
             ).reset_index().sort_values(by='Total_Inasistencias', ascending=False)
@@ -197,7 +196,7 @@ else:
             st.markdown("---")
 
             st.write("#### Resumen por Supervisor")
-            summary_supervisor = df_final_filtrado.groupby('Supervisor').agg(
+            summary_supervisor = df_final_filtrado.groupby('Supervisor', observed=True).agg(
                 Total_Inasistencias=('Trabajador', 'size'),
                 Trabajadores_Unicos=('Trabajador', 'nunique')
             ).reset_index().sort_values(by='Total_Inasistencias', ascending=False)
@@ -8,7 +8,7 @@ from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime, timedelta
 from menu import generarMenu
-from utils import format_currency, format_percentage, format_number
+from utils import format_currency, format_percentage, format_number, get_json, version_datos
 import streamlit.components.v1 as components
 from scipy import stats
 import warnings
@@ -32,69 +32,38 @@ if not check_login():
 generarMenu()
 
 # ============== FUNCIONES DE API ==============
-def get_uf_data():
-    url = "http://localhost:8000/uf"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de UF")
-        return None
-
-def get_dolar_data():
-    url = "http://localhost:8000/dolar"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de Dólar")
-        return None
-
-def get_ipc_data():
-    url = "http://localhost:8000/ipc"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de IPC")
-        return None
-
-def get_euro_data():
-    url = "http://localhost:8000/euro"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de Euro")
-        return None
+# Nombre de cada serie de GET /indicadores en los gráficos
+SERIES = {
+    "uf": "UF",
+    "dolar": "DOLAR",
+    "euro": "EURO",
+    "ipc": "IPC",
+    "imacec": "IMACEC",
+    "tasa_desempleo": "DESEMPLEO",
+}
 
-def get_imacec_data():
-    url = "http://localhost:8000/imacec"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de IMACEC")
+@st.cache_data(show_spinner=False)
+def get_indicadores(version):
+    """
+    Series mensuales y últimos valores de todos los indicadores en una sola
+    consulta a la base local (GET /indicadores). 'version' es la clave de
+    caché de version_datos.
+    """
+    try:
+        return get_json("indicadores", params={"series": ",".join(SERIES)})
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error al obtener los indicadores económicos: {e}")
         return None
 
-def get_tasa_desempleo_data():
-    url = "http://localhost:8000/tasa_desempleo"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de Tasa de Desempleo")
-        return None
 
+def ultimos_valores(data):
+    """{indicador: {"valor", "unidad_medida", "fecha"}} como los entregaba mindicador.cl."""
+    ultimos = data["ultimos"]
+    return {
+        fila["indicador"]: fila
+        for fila in pd.DataFrame(ultimos["data"], columns=ultimos["columns"]).to_dict("records")
+    }
 
-def get_daily_indicators():
-    url = "https://mindicador.cl/api"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error("Error al obtener datos de la API de Mindicador")
-        return None
 
 # ============== FUNCIONES DE ANÁLISIS ESTADÍSTICO ==============
 def calculate_statistics(df, value_col='valor'):
@@ -377,29 +346,18 @@ def main():
     
     # Obtener datos
     with st.spinner("Cargando datos de indicadores económicos..."):
-        data = get_daily_indicators()
-        uf_data = get_uf_data()
-        dolar_data = get_dolar_data()
-        ipc_data = get_ipc_data()
-        euro_data = get_euro_data()
-        imacec_data = get_imacec_data()
-        tasa_desempleo_data = get_tasa_desempleo_data()
- 
-    
-    # Procesar DataFrames
+        indicadores_data = get_indicadores(version_datos("indicadores"))
+    data = ultimos_valores(indicadores_data) if indicadores_data else None
+
+    # Procesar DataFrames: una serie (periodo, valor) por indicador
     dfs = {}
-    if uf_data:
-        dfs['UF'] = pd.DataFrame(uf_data["data"], columns=uf_data["columns"])
-    if dolar_data:
-        dfs['DOLAR'] = pd.DataFrame(dolar_data["data"], columns=dolar_data["columns"])
-    if euro_data:
-        dfs['EURO'] = pd.DataFrame(euro_data["data"], columns=euro_data["columns"])
-    if ipc_data:
-        dfs['IPC'] = pd.DataFrame(ipc_data["data"], columns=ipc_data["columns"])
-    if imacec_data:
-        dfs['IMACEC'] = pd.DataFrame(imacec_data["data"], columns=imacec_data["columns"])
-    if tasa_desempleo_data:
-        dfs['DESEMPLEO'] = pd.DataFrame(tasa_desempleo_data["data"], columns=tasa_desempleo_data["columns"])
+    if indicadores_data:
+        df_series = pd.DataFrame(indicadores_data["data"], columns=indicadores_data["columns"])
+        for serie, nombre in SERIES.items():
+            if serie in df_series.columns:
+                df_serie = df_series[["periodo", serie]].rename(columns={serie: "valor"}).dropna(subset=["valor"])
+                if not df_serie.empty:
+                    dfs[nombre] = df_serie.reset_index(drop=True)
     
     # Sección de Cards con valores actuales
     st.subheader("📋 Resumen de Indicadores")
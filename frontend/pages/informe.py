@@ -6,7 +6,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from menu import generarMenu
-from utils import format_currency, format_percentage, calcular_variacion, calcular_ticket_promedio, calcular_variacion_total, calcular_ticket_total
+from perfilador import hito, mostrar_perfil
+from utils import format_currency, format_percentage, calcular_variacion, calcular_ticket_promedio, calcular_variacion_total, calcular_ticket_total, get_json, version_datos
+from esquemas import aplicar_esquema, dataframe
+import dimensiones
+import particiones
 import warnings
 import numpy as np
 from datetime import datetime, timedelta
@@ -167,19 +171,20 @@ st.markdown("""
 generarMenu()
 
 # Función para obtener datos de endpoints
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint):
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
     try:
         with st.spinner(f'🔄 Cargando datos de {endpoint}...'):
-            response = requests.get(f"http://localhost:8000/{endpoint}", timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            if endpoint in particiones.ENDPOINTS:
+                # Desde el caché por mes en disco, compartido por las sesiones del host
+                return aplicar_esquema(endpoint, particiones.leer(endpoint, token))
+            data = get_json(endpoint, token=token)
 
             if 'data' not in data or 'columns' not in data:
                 st.error(f"❌ Formato de datos incorrecto en {endpoint}")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Error de conexión en {endpoint}: {e}")
@@ -264,36 +269,31 @@ def calculate_performance_indicators(df_group):
 # Función principal mejorada
 def display_informe_ventas():
     # Cargar los datos primero
-    df_total = fetch_data_from_endpoint("ingresos_acum_dia")
-    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto")
-    df_sucursales = fetch_data_from_endpoint("sucursales")
+    df_total = fetch_data_from_endpoint("ingresos_acum_dia", token=st.session_state.get("token"), version=version_datos("ingresos_acum_dia"))
+    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto", token=st.session_state.get("token"), version=version_datos("ingresos_acum_dia_ppto"))
+    dim_sucursales = dimensiones.sucursales(st.session_state.get("token"))
     
-    if df_total.empty or df_ppto.empty or df_sucursales.empty:
+    if df_total.empty or df_ppto.empty or dim_sucursales.tabla.empty:
         st.error("No se pudieron cargar todos los datos necesarios")
         return pd.DataFrame()
 
-    # Procesamiento de datos (mantener la lógica original)
+    hito("carga de datos", "fetch")
+
+    # Procesamiento de datos (mantener la lógica original); 'date' ya llega como datetime64
     # INGRESOS ACTUAL 2025  
     df_ingresos_2025 = df_total[(df_total['año'] == 2025)]
-    df_ingresos_2025['date'] = pd.to_datetime(df_ingresos_2025['date'])
-    df_ingresos_2025['date'] = df_ingresos_2025['date'].dt.strftime('%Y-%m-%d')
     df_ingresos_2025 = df_ingresos_2025.rename(columns={'date': 'fecha'})
     df_ingresos_2025_grouped = df_ingresos_2025.groupby(['fecha', 'branch_office_id'])[["ticket_number", "cash_amount", "cash_net_amount", "card_amount", 
                        "card_net_amount", "subscribers", "venta_neta", "venta_bruta", "ingresos_neto", "venta_sss", "ingresos_sss"]].sum().reset_index()
     
     # INGRESOS ANTERIOR 2024
-    df_ingresos_2024 = df_total[(df_total['año'] == 2024)]
-    df_ingresos_2024['date'] = pd.to_datetime(df_ingresos_2024['date'])
+    df_ingresos_2024 = df_total[(df_total['año'] == 2024)].copy()
     df_ingresos_2024['fecha'] = df_ingresos_2024['date'] + pd.Timedelta(days=366)
-    df_ingresos_2024['fecha'] = df_ingresos_2024['fecha'].dt.strftime('%Y-%m-%d')
-    df_ingresos_2024['date'] = df_ingresos_2024['date'].dt.strftime('%Y-%m-%d')
     df_ingresos_2024_grouped = df_ingresos_2024.groupby(['fecha', 'branch_office_id'])[["ticket_number", "cash_amount", "cash_net_amount", "card_amount", 
                        "card_net_amount", "subscribers", "venta_neta", "venta_bruta", "ingresos_neto", "venta_sss", "ingresos_sss"]].sum().reset_index()
     
     # PPTO 2025
     df_ppto_2025 = df_ppto[(df_ppto['año'] == 2025)]
-    df_ppto_2025['date'] = pd.to_datetime(df_ppto_2025['date'])
-    df_ppto_2025['date'] = df_ppto_2025['date'].dt.strftime('%Y-%m-%d')
     df_ppto_2025 = df_ppto_2025.rename(columns={'date': 'fecha'})
     df_ppto_2025_grouped = df_ppto_2025.groupby(['fecha', 'branch_office_id'])[['ppto']].sum().reset_index()
     
@@ -322,8 +322,7 @@ def display_informe_ventas():
     df_concat = df_concat.rename(columns={'ppto': 'Presupuesto'})
     df_concat['Presupuesto'] = df_concat['Presupuesto'].fillna(0)
     
-    df_sucursales['branch_office_id'] = df_sucursales['branch_office_id'].astype(int)
-    df_concat = pd.merge(df_concat, df_sucursales, on='branch_office_id', how='left')
+    df_concat = dim_sucursales.agregar(df_concat)
     
     # Crear columnas renombradas para mejor visualización
     df_concat['Ingresos_2025'] = df_concat['ingresos_neto_2025']  
@@ -331,6 +330,8 @@ def display_informe_ventas():
     df_concat['Ingresos_SSS_2025'] = df_concat['ingresos_sss_2025']
     df_concat['Ingresos_SSS_2024'] = df_concat['ingresos_sss_2024']
 
+    hito("procesamiento", "transform")
+
     # FILTROS EN EL SIDEBAR MEJORADOS
     st.sidebar.markdown("### 🎛️ Filtros de Análisis")
     
@@ -343,7 +344,7 @@ def display_informe_ventas():
     )
     
     # Filtros existentes mejorados
-    responsables = df_sucursales['responsable'].unique().tolist()
+    responsables = dim_sucursales.tabla['responsable'].unique().tolist()
     responsables.insert(0, 'Todos')
     
     st.sidebar.markdown("#### 👤 Responsables")
@@ -390,8 +391,10 @@ def display_informe_ventas():
     df_concat_show = df_concat_show[(df_concat_show['fecha'] >= pd.to_datetime(start_date)) &
                                     (df_concat_show['fecha'] <= pd.to_datetime(end_date))]
 
+    hito("filtros", "transform")
+
     # TABLA AGRUPADOS (mantener lógica original)
-    df_grupo_total = df_concat_show.groupby(['branch_office'])[['Ingresos_2025', 'Ingresos_2024', 'Presupuesto','Ingresos_SSS_2025', 'Ingresos_SSS_2024', 'ticket_number_2025', 'ticket_number_2024']].sum().reset_index()
+    df_grupo_total = df_concat_show.groupby(['branch_office'], observed=True)[['Ingresos_2025', 'Ingresos_2024', 'Presupuesto','Ingresos_SSS_2025', 'Ingresos_SSS_2024', 'ticket_number_2025', 'ticket_number_2024']].sum().reset_index()
     df_grupo_total['Variacion'] = df_grupo_total.apply(lambda row: calcular_variacion(pd.DataFrame({'Ingresos_SSS_2025': [row['Ingresos_SSS_2025']], 'Ingresos_SSS_2024': [row['Ingresos_SSS_2024']]}), 'Ingresos_SSS_2025', 'Ingresos_SSS_2024'), axis=1)
     df_grupo_total['Desviacion'] = df_grupo_total.apply(lambda row: calcular_variacion(pd.DataFrame({'Ingresos_2025': [row['Ingresos_2025']], 'Presupuesto': [row['Presupuesto']]}), 'Ingresos_2025', 'Presupuesto'), axis=1)
     df_grupo_total['Ticket Promedio'] = df_grupo_total.apply(lambda row: calcular_ticket_promedio(pd.DataFrame({'Ingresos_2025': [row['Ingresos_2025']], 'ticket_number_2025': [row['ticket_number_2025']]}), 'Ingresos_2025', 'ticket_number_2025'), axis=1)
@@ -414,6 +417,8 @@ def display_informe_ventas():
 
     
     
+    hito("tabla agrupada", "transform")
+
     # ==================== DASHBOARD PRINCIPAL ====================
     
     # Calcular indicadores de performance
@@ -456,6 +461,8 @@ def display_informe_ventas():
         </div>
         """, unsafe_allow_html=True)
 
+    hito("resumen ejecutivo", "chart")
+
     # TARJETAS DE MÉTRICAS PRINCIPALES MEJORADAS
     st.markdown('<div class="section-header">💰 MÉTRICAS CLAVE</div>', unsafe_allow_html=True)
     
@@ -593,6 +600,8 @@ def display_informe_ventas():
 
 
 
+    hito("construcción de figuras", "chart")
+
     # SECCIÓN DE GRÁFICOS AVANZADOS
     st.markdown('<div class="section-header">📊 ANÁLISIS VISUAL AVANZADO</div>', unsafe_allow_html=True)
     
@@ -650,6 +659,9 @@ def display_informe_ventas():
         
     with col2:
         st.plotly_chart(fig_temporal6, use_container_width=True)
+
+    hito("render de gráficos", "chart")
         
 # Llamar a la función principal para mostrar el informe
 display_informe_ventas()
+mostrar_perfil("informe")
@@ -11,10 +11,14 @@ from menu import generarMenu
 import plotly.graph_objects as go
 import plotly.express as px
 from io import BytesIO
-import zipfile
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-
-from fpdf import FPDF
+from planificacion_pdf import format_rut_with_dots, generar_zip
+from utils import auth_headers
+from planificacion_analitica import DIAS_SEMANA, MallaAnalitica, formatear_minutos
 
 # --- 1. CONFIGURACIÓN INICIAL ---
 st.set_page_config(page_title="Planificación de Turnos", layout="wide", initial_sidebar_state="expanded", page_icon="📅")
@@ -42,16 +46,6 @@ st.markdown("---")
 
 # --- 2. FUNCIONES AUXILIARES ---
 
-def format_rut_with_dots(rut_str):
-    if not isinstance(rut_str, str) or '-' not in rut_str: return rut_str
-    body, verifier = rut_str.split('-')
-    body = body.replace('.', '')
-    try:
-        formatted_body = f"{int(body):,}".replace(",", ".")
-        return f"{formatted_body}-{verifier}"
-    except ValueError:
-        return rut_str
-
 def generar_color_por_hash(texto: str):
     hash_object = hashlib.md5(texto.encode())
     hash_int = int(hash_object.hexdigest(), 16)
@@ -64,11 +58,12 @@ def get_dia_semana_es(fecha):
     return dias[fecha.weekday()]
 
 @st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint: str, params: dict = None):
+def fetch_data_from_endpoint(endpoint: str, params: dict = None, token: str = None):
+    """El token es parte de la clave de caché: el backend filtra por las sucursales del usuario."""
     API_BASE_URL = "http://localhost:8000"
     try:
         with st.spinner(f'Cargando datos de {endpoint}...'):
-            response = requests.get(f"{API_BASE_URL}/{endpoint}", params=params, timeout=30)
+            response = requests.get(f"{API_BASE_URL}/{endpoint}", params=params, headers=auth_headers(token), timeout=30)
             response.raise_for_status()
             data = response.json()
             if 'data' not in data: return pd.DataFrame()
@@ -83,11 +78,39 @@ def fetch_data_from_endpoint(endpoint: str, params: dict = None):
         st.error(f"💥 Error inesperado al procesar datos de '{endpoint}': {e}")
         return pd.DataFrame()
 
+def load_malla_guardada(sucursal: str, year: int, month: int):
+    """
+    Planificación guardada del mes y su versión, desde GET /planificacion.
+    Sin st.cache_data: la versión debe ser la vigente para que el guardado
+    diferencial detecte conflictos. La última respuesta se guarda en la sesión
+    y se revalida con If-None-Match, así un plan sin cambios no se vuelve a enviar.
+    """
+    API_BASE_URL = "http://localhost:8000"
+    params = {"sucursal": sucursal, "year": year, "month": month}
+    cache = st.session_state.setdefault('malla_respuestas', {})
+    etag, data = cache.get((sucursal, year, month), (None, None))
+    try:
+        headers = auth_headers()
+        if etag:
+            headers["If-None-Match"] = etag
+        response = requests.get(f"{API_BASE_URL}/planificacion", params=params, headers=headers, timeout=30)
+        if response.status_code != 304:
+            response.raise_for_status()
+            etag, data = response.headers.get("ETag"), response.json()
+            cache[(sucursal, year, month)] = (etag, data)
+        return data
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Error al cargar la planificación guardada: {e}")
+        return None
+
 def save_malla_to_endpoint(payload: dict):
+    """Envía solo las celdas modificadas (PATCH) junto con la versión cargada."""
     API_BASE_URL = "http://localhost:8000"
     endpoint = "guardar_malla"
     try:
-        response = requests.post(f"{API_BASE_URL}/{endpoint}", json=payload, timeout=60)
+        response = requests.patch(f"{API_BASE_URL}/{endpoint}", json=payload, headers=auth_headers(), timeout=60)
+        if response.status_code == 409:
+            return {"success": False, "conflict": True, "message": response.json().get('detail', 'Conflicto de versión.')}
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -97,36 +120,57 @@ def save_malla_to_endpoint(payload: dict):
         st.error(f"Error inesperado al guardar la planificación: {e}")
         return {"success": False, "message": f"Error inesperado: {e}"}
 
+def construir_grilla_guardada(malla, ruts, columnas_planas):
+    """Grilla (rut x fecha) con los turnos guardados; "" donde no hay turno."""
+    if not malla or not malla['ruts']:
+        return pd.DataFrame("", index=pd.Index(ruts, name='rut'), columns=columnas_planas)
+    grilla = pd.DataFrame(
+        np.array(malla['codigos'], dtype=object)[np.array(malla['grid'])],
+        index=pd.Index(malla['ruts'], name='rut'),
+        columns=columnas_planas[:malla['dias']]
+    )
+    return grilla.reindex(index=pd.Index(ruts, name='rut'), columns=columnas_planas).fillna("")
+
+def calcular_cambios(df_editada, grilla_base, columnas_planas):
+    """
+    Celdas distintas de la versión guardada, como lista de {rut, fecha, codigo}.
+    Un código "" indica que la celda se vació y debe borrarse.
+    """
+    actual = df_editada.set_index('rut')[columnas_planas].fillna("")
+    base = grilla_base.reindex(index=actual.index, columns=columnas_planas).fillna("")
+    cambios = actual.stack()[actual.ne(base).stack()].rename('codigo').reset_index()
+    if cambios.empty:
+        return []
+    cambios.columns = ['rut', 'fecha', 'codigo']
+    cambios['fecha'] = pd.to_datetime(cambios['fecha'], format='%d-%m-%Y').dt.strftime('%Y-%m-%d')
+    return cambios.to_dict('records')
+
 def seconds_to_time_str(value):
     if pd.isna(value) or not isinstance(value, (int, float)): return ""
     m, s = divmod(int(value), 60)
     h, m = divmod(m, 60)
     return f"{h:02d}:{m:02d}:{s:02d}"
 
-def minutes_to_time(total_minutes):
-    if pd.isna(total_minutes) or total_minutes is None or total_minutes == 0: return "0:00"
-    hours, minutes = int(total_minutes // 60), int(total_minutes % 60)
-    return f"{hours:02d}:{minutes:02d}"
+def resumen_semanal(analitica, df_editada):
+    """Minutos por trabajador y semana, solo trabajadores y semanas con turnos."""
+    filas = analitica.turnos_trabajador > 0
+    semanas = analitica.semanas_con_turnos()
+    index = pd.MultiIndex.from_frame(df_editada[['rut', 'Trabajador']].iloc[filas])
+    columnas = np.array(analitica.etiquetas_semanas())[semanas]
+    return pd.DataFrame(analitica.minutos_semana[np.ix_(filas, semanas)], index=index, columns=columnas)
+
+def formatear_resumen(resumen):
+    formateado = pd.DataFrame(formatear_minutos(resumen.to_numpy()), index=resumen.index, columns=resumen.columns)
+    formateado['Total Mes'] = formatear_minutos(resumen.sum(axis=1).to_numpy())
+    return formateado
 
-def calcular_estadisticas_avanzadas(df_editada, turnos_dict, dates, df_personal_completo):
+def calcular_estadisticas_avanzadas(analitica, df_editada, dates, df_personal_completo):
     stats = {}
     if df_editada.empty: return stats
 
     stats['total_trabajadores'] = df_editada.shape[0]
-    df_melted = df_editada.melt(id_vars=['rut', 'Trabajador'], var_name='Fecha', value_name='Turno')
-    df_melted = df_melted[df_melted['Turno'] != ""].copy()
-    
-    if df_melted.empty:
-        df_horas_planificadas = df_editada[['rut']].copy()
-        df_horas_planificadas['Horas_Planificadas'] = 0.0
-    else:
-        df_melted['Minutos'] = df_melted['Turno'].apply(lambda x: turnos_dict.get(x, {}).get('working_minutes', 0))
-        df_horas_calc = df_melted.groupby('rut')['Minutos'].sum().reset_index()
-        df_horas_calc['Horas_Planificadas'] = df_horas_calc['Minutos'] / 60
-        df_horas_planificadas = df_horas_calc[['rut', 'Horas_Planificadas']]
-
-    df_analisis = pd.merge(df_editada[['rut', 'Trabajador']], df_horas_planificadas, on='rut', how='left')
-    df_analisis['Horas_Planificadas'] = df_analisis['Horas_Planificadas'].fillna(0)
+    df_analisis = df_editada[['rut', 'Trabajador']].copy()
+    df_analisis['Horas_Planificadas'] = analitica.minutos_trabajador / 60
     
     df_personal_contrato = df_personal_completo[['rut', 'horas']].drop_duplicates()
     df_analisis = pd.merge(df_analisis, df_personal_contrato, on='rut', how='left')
@@ -143,19 +187,21 @@ def calcular_estadisticas_avanzadas(df_editada, turnos_dict, dates, df_personal_
     stats['trabajadores_subplanificados'] = df_analisis[df_analisis['Diferencia_Horas'] < -df_analisis['Umbral_Absoluto']].to_dict('records')
     stats['trabajadores_sin_turnos'] = df_analisis[df_analisis['Horas_Planificadas'] == 0].to_dict('records')
 
-    stats['trabajadores_con_turnos'] = df_melted['rut'].nunique()
-    if not df_melted.empty:
-        df_melted['Fecha'] = pd.to_datetime(df_melted['Fecha'], format='%d-%m-%Y')
-        df_melted['Dia_Semana'] = df_melted['Fecha'].apply(get_dia_semana_es)
+    stats['trabajadores_con_turnos'] = int((analitica.turnos_trabajador > 0).sum())
+    total_turnos = int(analitica.turnos_dia.sum())
+    if total_turnos:
+        fin_semana = analitica.weekday >= 5
+        total_horas = analitica.minutos_dia.sum() / 60
+        conteo = pd.Series(analitica.conteo_codigos[1:], index=analitica.codigos[1:])
         stats.update({
-            'total_turnos_asignados': len(df_melted),
-            'total_horas_planificadas': df_melted['Minutos'].sum() / 60,
-            'promedio_horas_por_trabajador': (df_melted['Minutos'].sum() / 60) / max(stats['trabajadores_con_turnos'], 1),
-            'horas_por_dia_semana': (df_melted.groupby('Dia_Semana')['Minutos'].sum() / 60).to_dict(),
-            'turnos_mas_usados': df_melted['Turno'].value_counts().head(5).to_dict(),
-            'cobertura_porcentaje': (df_melted['Fecha'].nunique() / len(dates)) * 100,
-            'turnos_fin_semana': len(df_melted[df_melted['Fecha'].dt.weekday >= 5]),
-            'horas_fin_semana': (df_melted[df_melted['Fecha'].dt.weekday >= 5]['Minutos'].sum() / 60)
+            'total_turnos_asignados': total_turnos,
+            'total_horas_planificadas': total_horas,
+            'promedio_horas_por_trabajador': total_horas / max(stats['trabajadores_con_turnos'], 1),
+            'horas_por_dia_semana': dict(zip(DIAS_SEMANA.tolist(), analitica.minutos_dia_semana() / 60)),
+            'turnos_mas_usados': conteo[conteo > 0].sort_values(ascending=False).head(5).to_dict(),
+            'cobertura_porcentaje': ((analitica.turnos_dia > 0).sum() / len(dates)) * 100,
+            'turnos_fin_semana': int(analitica.turnos_dia[fin_semana].sum()),
+            'horas_fin_semana': analitica.minutos_dia[fin_semana].sum() / 60
         })
     return stats
 
@@ -276,136 +322,60 @@ def create_excel_report(df_data, sucursal, year, month):
     return output.getvalue()
 
 
-def crear_pdf_trabajador(worker_data, schedule_df, weekly_summary, sucursal, month_name, year):
-    pdf = FPDF(orientation="P", unit="mm", format="A4")
-    pdf.add_page()    
-    # --- 1. ENCABEZADO CON LOGO Y DATOS ALINEADOS ---
-    try:
-        pdf.image("pages/logo.jpg", x=170, y=8, w=30)
-    except FileNotFoundError:
-        pass
-
-    pdf.set_y(12)
-    pdf.set_font("Helvetica", "B", 16)
-    pdf.cell(0, 8, "Planilla de Turnos Mensual", 0, 1, "C")
-    pdf.ln(4)
-
-    pdf.set_font("Helvetica", "", 9)
-    pdf.cell(20, 5, "Nombre:", 0, 0)
-    pdf.set_font("Helvetica", "B", 9)
-    pdf.cell(85, 5, worker_data['Trabajador'], 0, 0)
-    
-    pdf.set_font("Helvetica", "", 9)
-    pdf.cell(15, 5, "RUT:")
-    pdf.set_font("Helvetica", "B", 9)
-    pdf.cell(0, 5, format_rut_with_dots(worker_data['rut']), 0, 1)
-
-    pdf.set_font("Helvetica", "", 9)
-    pdf.cell(20, 5, "Sucursal:")
-    pdf.set_font("Helvetica", "B", 9)
-    pdf.cell(85, 5, sucursal, 0, 0)
-
-    pdf.set_font("Helvetica", "", 9)
-    pdf.cell(15, 5, "Periodo:")
-    pdf.set_font("Helvetica", "B", 9)
-    pdf.cell(0, 5, f"{month_name.capitalize()} {year}", 0, 1)
-    
-    pdf.ln(6)
-
-    # --- 2. TABLA DE HORARIOS DETALLADA (CENTRADA) ---
-    pdf.set_font("Helvetica", "B", 8)
-    pdf.set_fill_color(224, 224, 224)
-    col_widths = [30, 25, 20, 20, 40]
-    total_width = sum(col_widths)
-    start_x = (pdf.w - total_width) / 2
-    pdf.set_x(start_x)
-
-    headers = ["Día", "Fecha", "Turno", "Jornada", "Horario"]
-    for i, header in enumerate(headers):
-        pdf.cell(col_widths[i], 6, header, 1, 0, "C", 1)
-    pdf.ln()
-
-    pdf.set_font("Helvetica", "", 8)
-    for _, row in schedule_df.iterrows():
-        pdf.set_x(start_x)
-        pdf.cell(col_widths[0], 5, str(row['Dia_Semana']), 1, 0, "L")
-        pdf.cell(col_widths[1], 5, str(row['Fecha_str']), 1, 0, "C")
-        pdf.cell(col_widths[2], 5, str(row['Turno']), 1, 0, "C")
-        pdf.cell(col_widths[3], 5, str(row['working_time']), 1, 0, "C")
-        pdf.cell(col_widths[4], 5, str(row['desde - hasta']), 1, 1, "C")
-
-    # --- 3. TABLA DE RESUMEN DE HORAS (CENTRADA) ---
-    pdf.ln(5)
-    pdf.set_font("Helvetica", "B", 10)
-    pdf.cell(0, 6, "Resumen de Horas", 0, 1, "C")
-    
-    pdf.set_font("Helvetica", "B", 8)
-    summary_headers = list(weekly_summary.columns)
-    num_summary_cols = len(summary_headers)
-    summary_total_width = total_width
-    summary_col_width = summary_total_width / num_summary_cols
-    
-    start_x_summary = (pdf.w - summary_total_width) / 2
-    pdf.set_x(start_x_summary)
-    
-    for header in summary_headers:
-        pdf.cell(summary_col_width, 6, header, 1, 0, "C", 1)
-    pdf.ln()
-
-    pdf.set_font("Helvetica", "B", 9)
-    pdf.set_x(start_x_summary)
-    for header in summary_headers:
-        pdf.cell(summary_col_width, 6, weekly_summary.iloc[0][header], 1, 0, "C")
-    pdf.ln()
-
-    # --- 4. SECCIÓN DE FIRMA (POSICIONADA AL FINAL) ---
-    # Posicionar a 250mm desde el borde superior
-    pdf.set_y(250)
-    
-    pdf.set_font("Helvetica", "", 10)
-    pdf.cell(95, 6, "Recibido Conforme,", 0, 1, "L")
-    pdf.ln(8)
-    
-    # Líneas y texto para Firma y Fecha en la misma "fila" visual
-    pdf.line(pdf.get_x() + 10, pdf.get_y(), pdf.get_x() + 80, pdf.get_y())
-    pdf.line(pdf.get_x() + 115, pdf.get_y(), pdf.get_x() + 165, pdf.get_y())
-    
-    pdf.cell(95, 6, "Firma Trabajador", 0, 0, "C")
-    pdf.cell(0, 6, "Fecha", 0, 1, "C")
-    
-    return pdf.output()
-def generar_zip_con_pdfs(df_editada, turnos_dict, sucursal, month_name, year, dates):
-    df_melted = df_editada.melt(id_vars=['rut', 'Trabajador'], var_name='Fecha_str', value_name='Turno')
-    df_melted = df_melted[df_melted['Turno'] != ""].copy()
-    if df_melted.empty:
+@st.cache_resource
+def get_pdf_executor():
+    """
+    Pool de procesos compartido para generar los PDFs en paralelo. Usa 'spawn'
+    como backend/proyeccion.py: hacer fork del servidor de Streamlit, que
+    tiene varios hilos, puede dejar locks tomados en los hijos.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max(1, (os.cpu_count() or 2) - 1),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def generar_zip_con_pdfs(analitica, df_editada, sucursal, month_name, year):
+    filas, cols, codes = analitica.celdas_ocupadas()
+    if filas.size == 0:
         return None
 
-    df_melted['Fecha'] = pd.to_datetime(df_melted['Fecha_str'], format='%d-%m-%Y')
-    df_melted['Dia_Semana'] = df_melted['Fecha'].apply(get_dia_semana_es)
-    df_melted['working_minutes'] = df_melted['Turno'].apply(lambda x: turnos_dict.get(x, {}).get('working_minutes', 0))
-    df_melted['working_time'] = df_melted['working_minutes'].apply(minutes_to_time)
-    df_melted['desde - hasta'] = df_melted['Turno'].apply(lambda x: turnos_dict.get(x, {}).get('desde - hasta', '-'))
-    
-    df_melted['Semana'] = 'Semana ' + df_melted['Fecha'].dt.isocalendar().week.astype(str)
-    pivot_resumen = df_melted.pivot_table(index='rut', columns='Semana', values='working_minutes', aggfunc='sum').fillna(0)
-    pivot_formateado = pivot_resumen.applymap(minutes_to_time)
-    pivot_formateado['Total Mes'] = pivot_resumen.sum(axis=1).apply(minutes_to_time)
-
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as zip_file:
-        for _, worker in df_editada.iterrows():
-            worker_rut, worker_name_for_file = worker['rut'], worker['Trabajador'].replace(" ", "_")
-            schedule_df = df_melted[df_melted['rut'] == worker_rut].sort_values(by='Fecha')
-            weekly_summary_worker = pivot_formateado[pivot_formateado.index == worker_rut]
-            if schedule_df.empty: continue
-            pdf_bytes = crear_pdf_trabajador(worker, schedule_df, weekly_summary_worker, sucursal, month_name, year)
-            file_name = f"Planificacion_{worker_name_for_file}_{month_name}_{year}.pdf"
-            zip_file.writestr(file_name, pdf_bytes)
-            
-    return zip_buffer.getvalue()
+    resumen = formatear_resumen(resumen_semanal(analitica, df_editada)).droplevel('Trabajador')
+
+    # Filas (Día, Fecha, Turno, Jornada, Horario) de todas las celdas con turno,
+    # ordenadas por trabajador y fecha
+    schedule = np.column_stack([
+        DIAS_SEMANA[analitica.weekday[cols]],
+        np.array(analitica.columnas)[cols],
+        np.array(analitica.codigos)[codes],
+        formatear_minutos(analitica.minutos)[codes],
+        analitica.matriz_campo('desde - hasta')[filas, cols],
+    ]).astype(str)
+    limites = np.searchsorted(filas, np.arange(len(df_editada) + 1))
+
+    # Un trabajo por trabajador con datos planos (hashables y serializables)
+    jobs = []
+    for i, worker in enumerate(df_editada[['rut', 'Trabajador']].to_dict('records')):
+        if limites[i] == limites[i + 1]: continue
+        jobs.append({
+            'file_name': f"Planificacion_{worker['Trabajador'].replace(' ', '_')}_{month_name}_{year}.pdf",
+            'worker': worker,
+            'schedule': schedule[limites[i]:limites[i + 1]].tolist(),
+            'summary': resumen.loc[worker['rut']].to_dict(),
+            'sucursal': sucursal,
+            'month_name': month_name,
+            'year': year,
+        })
+
+    try:
+        return generar_zip(jobs, executor=get_pdf_executor())
+    except BrokenProcessPool:
+        # Un worker murió y el pool quedó inutilizable: se reemplaza y se reintenta una vez
+        get_pdf_executor().shutdown(wait=False, cancel_futures=True)
+        get_pdf_executor.clear()
+        return generar_zip(jobs, executor=get_pdf_executor())
 
 # --- 3. LÓGICA PRINCIPAL DEL DASHBOARD ---
-df_personal = fetch_data_from_endpoint("trabajadores")
+df_personal = fetch_data_from_endpoint("trabajadores", token=st.session_state.get("token"))
 
 if 'plantilla_generada' not in st.session_state:
     st.session_state.plantilla_generada = False
@@ -439,6 +409,7 @@ with col_der:
         st.session_state.month_name_plan = month_name
         st.session_state.supervisor_plan = selected_supervisor
         st.session_state.sucursal_plan = selected_sucursal
+        st.session_state.pop('malla_clave', None)
         if "planificacion_editor" in st.session_state: del st.session_state["planificacion_editor"]
     st.button("📝 Generar Plantilla de Planificación", on_click=on_generate_click, type="primary")
 
@@ -449,7 +420,7 @@ if st.session_state.plantilla_generada:
     year, month, month_name, supervisor, sucursal = st.session_state.year_plan, st.session_state.month_plan, st.session_state.month_name_plan, st.session_state.supervisor_plan, st.session_state.sucursal_plan
     st.header(f"3. Ingrese los Turnos para {sucursal}")
     st.subheader(f"Periodo: {month_name.upper()} {year} | Supervisor: {supervisor}")
-    df_turnos_validos = fetch_data_from_endpoint("asistencia_turnos")
+    df_turnos_validos = fetch_data_from_endpoint("asistencia_turnos", token=st.session_state.get("token"))
     if df_turnos_validos.empty:
         st.error("No se pudieron cargar los tipos de turno desde la BD.")
     else:
@@ -472,8 +443,22 @@ if st.session_state.plantilla_generada:
             _, num_days = calendar.monthrange(year, month)
             dates = [datetime(year, month, day) for day in range(1, num_days + 1)]
             columnas_planas = [d.strftime('%d-%m-%Y') for d in dates]
-            df_planificacion = df_plantilla_base.copy()
-            for col_name in columnas_planas: df_planificacion[col_name] = ""
+            # Cargar la planificación guardada una vez por (sucursal, año, mes):
+            # es la base contra la que se calculan los cambios al guardar
+            clave_malla = (sucursal, year, month)
+            if st.session_state.get('malla_clave') != clave_malla:
+                malla = load_malla_guardada(sucursal, year, month)
+                st.session_state.malla_clave = clave_malla
+                st.session_state.malla_version = malla['version'] if malla else None
+                st.session_state.malla_base = construir_grilla_guardada(malla, df_plantilla_base['rut'], columnas_planas)
+                if malla and malla['exists']:
+                    st.toast(f"📂 Planificación guardada cargada (versión {malla['version']}).")
+                if "planificacion_editor" in st.session_state: del st.session_state["planificacion_editor"]
+            grilla_base = st.session_state.malla_base
+            df_planificacion = pd.concat([
+                df_plantilla_base,
+                grilla_base.reindex(index=df_plantilla_base['rut'], columns=columnas_planas).fillna("").reset_index(drop=True)
+            ], axis=1)
             
             config_columnas = {}
             for col in columnas_planas:
@@ -486,6 +471,14 @@ if st.session_state.plantilla_generada:
             st.info("💡 Haga clic en una celda para seleccionar un turno. Use Ctrl+C y Ctrl+V para copiar turnos entre celdas.")
             df_editada = st.data_editor(df_planificacion, column_config=config_columnas, use_container_width=True, hide_index=True, disabled=["rut", "Trabajador"], num_rows="fixed", key="planificacion_editor")
             
+            # El motor de estadísticas se conserva entre ejecuciones y solo
+            # recalcula las celdas que cambiaron en el editor
+            clave_analitica = (clave_malla, tuple(df_plantilla_base['rut']), tuple(lista_turnos), tuple(df_turnos_validos['working']))
+            if st.session_state.get('analitica_clave') != clave_analitica:
+                st.session_state.analitica = MallaAnalitica(turnos_dict, dates)
+                st.session_state.analitica_clave = clave_analitica
+            analitica = st.session_state.analitica.actualizar(df_editada)
+
             st.markdown("---")
             st.header("3.1. Información del turno")
 
@@ -501,27 +494,17 @@ if st.session_state.plantilla_generada:
 
                 for campo_api, titulo_tabla in info_campos.items():
                     st.write(f"##### {titulo_tabla}")
-                    data_matrix = []
-                    for index, row in df_editada.iterrows():
-                        row_data = [turnos_dict.get(row[col_fecha], {}).get(campo_api, "-") for col_fecha in columnas_planas]
-                        data_matrix.append(row_data)
-                    df_temp_info = pd.DataFrame(data_matrix, index=base_info_df.index, columns=nuevas_columnas_display)
+                    df_temp_info = pd.DataFrame(analitica.matriz_campo(campo_api), index=base_info_df.index, columns=nuevas_columnas_display)
                     df_info_final = pd.concat([base_info_df.reset_index(drop=True), df_temp_info.reset_index(drop=True)], axis=1)
                     st.dataframe(df_info_final.style.apply(lambda x: ['color: #d32f2f; font-weight: bold;' if (x.name in sunday_cols) else '' for i in x], axis=0), use_container_width=True, hide_index=True)
 
             st.markdown("---")
             st.header("4. 📋 Resumen Semanal Detallado")
-            df_melted_semanal = df_editada.melt(id_vars=['rut', 'Trabajador'], var_name='Fecha', value_name='Turno')
-            df_melted_semanal = df_melted_semanal[df_melted_semanal['Turno'] != ""].copy()
-            if not df_melted_semanal.empty:
-                df_melted_semanal['Fecha'] = pd.to_datetime(df_melted_semanal['Fecha'], format='%d-%m-%Y')
-                df_melted_semanal['Minutos Planificados'] = df_melted_semanal['Turno'].apply(lambda x: turnos_dict.get(x, {}).get('working_minutes', 0))
-                df_melted_semanal['Semana'] = 'Semana ' + df_melted_semanal['Fecha'].dt.isocalendar().week.astype(str)
-                pivot_resumen = df_melted_semanal.pivot_table(index=['rut', 'Trabajador'], columns='Semana', values='Minutos Planificados', aggfunc='sum').fillna(0)
-                pivot_formateado = pivot_resumen.applymap(minutes_to_time)
-                pivot_formateado['Total Mes'] = pivot_resumen.sum(axis=1).apply(minutes_to_time)
-                total_row = pivot_resumen.sum(axis=0).apply(minutes_to_time)
-                total_row['Total Mes'] = minutes_to_time(pivot_resumen.sum().sum())
+            resumen = resumen_semanal(analitica, df_editada)
+            if not resumen.empty:
+                pivot_formateado = formatear_resumen(resumen)
+                total_row = pd.Series(formatear_minutos(resumen.sum(axis=0).to_numpy()), index=resumen.columns)
+                total_row['Total Mes'] = str(formatear_minutos(resumen.to_numpy().sum()))
                 total_row.name = ('TOTAL', '')
                 pivot_final = pd.concat([pivot_formateado, total_row.to_frame().T])
                 st.write("#### Horas Planificadas por Semana")
@@ -529,7 +512,7 @@ if st.session_state.plantilla_generada:
             
             st.markdown("---")
             st.header("5. 📊 Resumen Ejecutivo")
-            stats = calcular_estadisticas_avanzadas(df_editada, turnos_dict, dates, df_personal)
+            stats = calcular_estadisticas_avanzadas(analitica, df_editada, dates, df_personal)
             if stats:
                 mostrar_metricas_principales(stats)
             
@@ -557,34 +540,38 @@ if st.session_state.plantilla_generada:
                 excel_data = create_excel_report(df_editada, sucursal, year, month)
                 st.download_button(label="📥 Planilla (Excel)", data=excel_data, file_name=f"planificacion_{sucursal}_{month_name}_{year}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
             with col_export2:
-                zip_bytes = generar_zip_con_pdfs(df_editada, turnos_dict, sucursal, month_name, year, dates)
+                zip_bytes = generar_zip_con_pdfs(analitica, df_editada, sucursal, month_name, year)
                 st.download_button(label="📄 PDFs Individuales", data=zip_bytes, file_name=f"PDFs_Planificacion_{sucursal}_{month_name}_{year}.zip", mime="application/zip")
             with col_save:
                 if st.button("💾 Guardar en BD", type="primary", key="save_final"):
                     with st.spinner("Preparando y guardando planificación..."):
-                        # --- LÍNEA CORREGIDA ---
-                        df_to_save = df_editada.melt(
-                            id_vars=['rut', 'Trabajador'], # Incluir 'Trabajador' aquí
-                            var_name='fecha',
-                            value_name='codigo'
-                        )
-                        df_to_save = df_to_save[df_to_save['codigo'].notna() & (df_to_save['codigo'] != "")].copy()
-                        
-                        if df_to_save.empty:
-                            st.warning("No se ingresó ningún turno para guardar.")
+                        cambios = calcular_cambios(df_editada, grilla_base, columnas_planas)
+
+                        if st.session_state.malla_version is None:
+                            st.error("No se pudo cargar la versión guardada; recargue la planificación antes de guardar.")
+                        elif not cambios:
+                            st.info("No hay cambios respecto de la planificación guardada.")
                         else:
-                            df_to_save['fecha'] = pd.to_datetime(df_to_save['fecha'], format='%d-%m-%Y').dt.strftime('%Y-%m-%d')
-                            
                             payload = {
+                                "sucursal": sucursal,
                                 "year": year,
                                 "month": month,
-                                "ruts": df_editada['rut'].tolist(),
-                                "data": df_to_save[['rut', 'fecha', 'codigo']].to_dict('records') # Enviar solo las columnas necesarias
+                                "version": st.session_state.malla_version,
+                                "cambios": cambios
                             }
 
                             result = save_malla_to_endpoint(payload)
-                            
+
                             if result.get("success", False):
+                                # La grilla guardada pasa a ser la nueva base de comparación
+                                st.session_state.malla_version = result.get("version")
+                                st.session_state.malla_base = df_editada.set_index('rut')[columnas_planas].fillna("")
                                 st.success(result.get("message", "¡Planificación guardada con éxito en la base de datos!"))
+                            elif result.get("conflict"):
+                                st.error(f"⚠️ {result['message']}")
                             else:
-                                st.error(f"Error al guardar: {result.get('message', 'Ocurrió un error desconocido.')}")
\ No newline at end of file
+                                st.error(f"Error al guardar: {result.get('message', 'Ocurrió un error desconocido.')}")
+
+                def on_reload_click():
+                    st.session_state.pop('malla_clave', None)
+                st.button("🔄 Recargar desde BD", on_click=on_reload_click, help="Descarta los cambios no guardados y carga la última versión guardada.")
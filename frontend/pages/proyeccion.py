@@ -2,12 +2,10 @@
 # pages/proyeccion.py
 import streamlit as st
 import pandas as pd
-import numpy as np
 import requests
 import plotly.graph_objects as go
-from sklearn.linear_model import LinearRegression
-from datetime import datetime, timedelta
 from menu import generarMenu # Asumo que tienes este archivo
+from utils import get_json
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -53,123 +51,50 @@ st.markdown("""
 generarMenu()
 
 # --- CARGA Y PROCESAMIENTO DE DATOS ---
-@st.cache_data(ttl=600, show_spinner="🔄 Cargando datos históricos...")
-def load_historical_data():
-    """
-    Carga los datos históricos de ventas desde el endpoint de FastAPI.
-    """
-    try:
-        # Usamos el endpoint que creamos para obtener todos los datos necesarios
-        response = requests.get("http://localhost:8000/ventas_historicas_diarias", timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'data' not in data or 'columns' not in data:
-            st.error("❌ Formato de datos incorrecto en el endpoint.")
-            return pd.DataFrame()
 
-        df = pd.DataFrame(data['data'], columns=data['columns'])
-        
-        # --- Limpieza y pre-procesamiento fundamental ---
-        df['fecha'] = pd.to_datetime(df['fecha'])
-        df['total_venta'] = pd.to_numeric(df['total_venta'], errors='coerce')
-        df.dropna(inplace=True)
-        
-        return df
+class ModelosEnPreparacion(Exception):
+    """El backend responde 503 mientras entrena los modelos (no se guarda en caché)."""
 
-    except requests.exceptions.RequestException as e:
-        st.error(f"❌ Error de conexión al cargar datos históricos: {e}")
-        return pd.DataFrame()
-    except Exception as e:
-        st.error(f"❌ Error inesperado al procesar datos históricos: {e}")
-        return pd.DataFrame()
 
-def create_features(df):
-    """
-    Crea características de ingeniería de tiempo (features) a partir de la columna de fecha.
-    Estas características son las que el modelo usará para "entender" la estacionalidad.
+@st.cache_data(ttl=600, show_spinner="🔄 Cargando sucursales...")
+def load_projection_branches(token=None):
     """
-    df['año'] = df['fecha'].dt.year
-    df['mes'] = df['fecha'].dt.month
-    df['dia_del_mes'] = df['fecha'].dt.day
-    df['dia_de_la_semana'] = df['fecha'].dt.dayofweek  # Lunes=0, Domingo=6
-    df['dia_del_año'] = df['fecha'].dt.dayofyear
-    df['semana_del_año'] = df['fecha'].dt.isocalendar().week.astype(int)
-    # Variable para capturar el tiempo de forma continua (tendencia general)
-    df['tiempo'] = (df['fecha'] - df['fecha'].min()).dt.days
-    
-    return df
-
-@st.cache_data(ttl=3600, show_spinner="⚙️ Entrenando modelos de proyección...")
-def train_projection_models(df, branches_to_train):
+    Obtiene las sucursales del usuario con modelo disponible en el backend.
+    Los modelos se entrenan en el servidor; aquí no se descarga el histórico.
     """
-    Entrena un modelo de regresión lineal para cada sucursal seleccionada.
-    Retorna un diccionario de modelos entrenados.
-    """
-    models = {}
-    for branch in branches_to_train:
-        # 1. Filtrar datos para la sucursal actual
-        branch_df = df[df['branch_office'] == branch].copy()
-        
-        # Si no hay suficientes datos, no se puede entrenar un modelo
-        if len(branch_df) < 30: # Un umbral mínimo de datos para entrenar
-            st.warning(f"⚠️ Datos insuficientes para entrenar un modelo para la sucursal '{branch}'. Se omitirá.")
-            continue
-
-        # 2. Crear características (features) para el modelo
-        branch_df = create_features(branch_df)
-        
-        # 3. Definir variables (X) y objetivo (y)
-        # Usamos las características de tiempo para predecir la venta
-        features = ['tiempo', 'mes', 'dia_de_la_semana', 'dia_del_año', 'semana_del_año']
-        X = branch_df[features]
-        y = branch_df['total_venta']
-        
-        # 4. Entrenar el modelo
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        # 5. Guardar el modelo entrenado
-        models[branch] = model
-        
-    return models
+    try:
+        return get_json("proyeccion/sucursales", token=token, timeout=120)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 503:
+            raise ModelosEnPreparacion() from e
+        st.error(f"❌ Error al cargar las sucursales: {e}")
+        return {}
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Error de conexión al cargar las sucursales: {e}")
+        return {}
 
-def generate_projections(models, df_historical, projection_days):
+@st.cache_data(ttl=600, show_spinner="🔮 Generando proyección...")
+def load_projection(etag, branches, projection_days, modelo, token=None):
     """
-    Usa los modelos entrenados para generar proyecciones de ventas futuras.
+    Solicita al backend la cola del histórico, la proyección y el backtest de las
+    sucursales seleccionadas. El ETag forma parte de la llave de caché, de modo que
+    una nueva versión de los modelos invalida las respuestas anteriores.
     """
-    if not models:
-        return pd.DataFrame()
-
-    last_date = df_historical['fecha'].max()
-    future_dates = pd.to_datetime([last_date + timedelta(days=i) for i in range(1, projection_days + 1)])
-    
-    df_projection = pd.DataFrame()
+    params = {"sucursales": tuple(branches), "dias": projection_days}
+    if modelo:
+        params["modelo"] = modelo
+    try:
+        data = get_json("proyeccion", params=params, token=token, timeout=120)
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Error de conexión al generar la proyección: {e}")
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
-    for branch, model in models.items():
-        # Crear un DataFrame futuro para esta sucursal
-        df_future_branch = pd.DataFrame({'fecha': future_dates})
-        df_future_branch['branch_office'] = branch
-        
-        # Crear las mismas características que usamos para entrenar
-        df_future_branch = create_features(df_future_branch)
-
-        # Ajustar la característica 'tiempo' para que sea continua con los datos históricos
-        min_historical_date = df_historical['fecha'].min()
-        df_future_branch['tiempo'] = (df_future_branch['fecha'] - min_historical_date).dt.days
-
-        # Predecir
-        features = ['tiempo', 'mes', 'dia_de_la_semana', 'dia_del_año', 'semana_del_año']
-        X_future = df_future_branch[features]
-        
-        predicted_sales = model.predict(X_future)
-        
-        # Asegurarnos de que las ventas proyectadas no sean negativas
-        df_future_branch['proyeccion_venta'] = np.maximum(0, predicted_sales)
-        
-        df_projection = pd.concat([df_projection, df_future_branch], ignore_index=True)
-        
-    return df_projection
+    df_hist = pd.DataFrame(data['historia']['data'], columns=data['historia']['columns'])
+    df_proj = pd.DataFrame(data['proyeccion']['data'], columns=data['proyeccion']['columns'])
+    df_backtest = pd.DataFrame(data['backtest']['data'], columns=data['backtest']['columns'])
+    df_hist['fecha'] = pd.to_datetime(df_hist['fecha'])
+    df_proj['fecha'] = pd.to_datetime(df_proj['fecha'])
+    return df_hist, df_proj, df_backtest
 
 
 # --- INTERFAZ DE USUARIO (Streamlit) ---
@@ -177,18 +102,25 @@ def generate_projections(models, df_historical, projection_days):
 # Header
 st.markdown("<div class='main-header'><h1>🔮 Módulo de Proyección de Ventas</h1></div>", unsafe_allow_html=True)
 
-# Cargar los datos
-df_sales = load_historical_data()
+# Cargar las sucursales con modelo
+try:
+    info_modelos = load_projection_branches(st.session_state.get("token"))
+except ModelosEnPreparacion:
+    st.info("⏳ Los modelos de proyección se están preparando en el servidor. Vuelve a intentarlo en unos minutos.")
+    st.stop()
 
-if df_sales.empty:
+if not info_modelos.get('sucursales'):
     st.error("No se pudieron cargar los datos para la proyección. Verifica la conexión con la API o la base de datos.")
     st.stop()
 
+MODELOS = info_modelos['modelos']
+modelo_elegido = dict(zip(info_modelos['sucursales'], info_modelos['modelo_elegido']))
+
 # Sidebar con filtros
 with st.sidebar:
     st.markdown("### 🎛️ Parámetros de Proyección")
     
-    all_branches = sorted(df_sales['branch_office'].unique())
+    all_branches = sorted(info_modelos['sucursales'] + info_modelos['omitidas'])
     selected_branches = st.multiselect(
         "🏢 Seleccionar Sucursales para Proyectar",
         options=all_branches,
@@ -204,13 +136,27 @@ with st.sidebar:
         help="Selecciona el horizonte de tiempo para la proyección."
     )
 
+    opciones_modelo = {"Automático (mejor por sucursal)": None}
+    opciones_modelo.update({label: name for name, label in MODELOS.items()})
+    modelo_label = st.selectbox(
+        "🧠 Modelo de Proyección",
+        options=list(opciones_modelo.keys()),
+        help="En modo automático se usa, para cada sucursal, el modelo con menor WAPE en el backtest."
+    )
+    selected_model = opciones_modelo[modelo_label]
+
 if not selected_branches:
     st.warning("Por favor, selecciona al menos una sucursal para generar la proyección.")
     st.stop()
 
-# Entrenar modelos y generar proyecciones
-trained_models = train_projection_models(df_sales, selected_branches)
-df_projection = generate_projections(trained_models, df_sales, projection_days)
+for branch in selected_branches:
+    if branch in info_modelos['omitidas']:
+        st.warning(f"⚠️ Datos insuficientes para entrenar un modelo para la sucursal '{branch}'. Se omitirá.")
+
+# La proyección se calcula en el servidor con los modelos vigentes
+df_sales, df_projection, df_backtest = load_projection(
+    info_modelos['etag'], tuple(selected_branches), projection_days, selected_model, st.session_state.get("token")
+)
 
 # Resumen de Métricas
 if not df_projection.empty:
@@ -241,7 +187,7 @@ else:
 
 
 # Tabs para visualización
-tab1, tab2, tab3 = st.tabs(["📈 Proyección General", "🏢 Detalle por Sucursal", "📋 Datos Proyectados"])
+tab1, tab2, tab3, tab4 = st.tabs(["📈 Proyección General", "🏢 Detalle por Sucursal", "📋 Datos Proyectados", "🧪 Backtesting"])
 
 with tab1:
     st.markdown("### Proyección General de Ventas (Sucursales Seleccionadas)")
@@ -285,10 +231,12 @@ with tab2:
     st.markdown("### Desglose de la Proyección por Sucursal")
     
     for branch in selected_branches:
-        if branch not in trained_models:
+        if branch not in modelo_elegido:
             continue
             
         st.markdown(f"#### 🏢 Proyección para: **{branch}**")
+        modelo_branch = selected_model or modelo_elegido[branch]
+        st.caption(f"Modelo utilizado: {MODELOS[modelo_branch]}")
         
         fig_branch = go.Figure()
         
@@ -326,8 +274,15 @@ with tab3:
     st.info("Puedes ordenar la tabla haciendo clic en los encabezados de las columnas.")
     
     # Formatear la tabla para una mejor visualización
-    df_display = df_projection[['fecha', 'branch_office', 'proyeccion_venta']].copy()
+    df_display = df_projection[['fecha', 'branch_office', 'proyeccion_venta', 'modelo']].copy()
     df_display['fecha'] = df_display['fecha'].dt.strftime('%Y-%m-%d')
     df_display['proyeccion_venta'] = df_display['proyeccion_venta'].apply(lambda x: f"${x:,.2f}")
+    df_display['modelo'] = df_display['modelo'].map(MODELOS)
     
-    st.dataframe(df_display, use_container_width=True, height=500)
\ No newline at end of file
+    st.dataframe(df_display, use_container_width=True, height=500)
+
+with tab4:
+    st.markdown("### Backtesting de Modelos (Origen Móvil)")
+    st.info("Cada modelo se reentrena en varios cortes del histórico y se evalúa sobre las semanas siguientes. "
+            "Se elige por sucursal el modelo con menor WAPE (error absoluto ponderado).")
+    st.dataframe(df_backtest.round(2), use_container_width=True, hide_index=True)
\ No newline at end of file
@@ -6,7 +6,9 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from menu import generarMenu
-from utils import format_currency, format_percentage
+from utils import format_currency, format_percentage, get_json, version_datos
+from esquemas import aplicar_esquema, dataframe
+import particiones
 import warnings
 import numpy as np
 from datetime import datetime, timedelta
@@ -109,19 +111,20 @@ st.markdown("""
 generarMenu()
 
 # Función para obtener datos de endpoints
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint):
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
     try:
         with st.spinner(f'🔄 Cargando datos de {endpoint}...'):
-            response = requests.get(f"http://localhost:8000/{endpoint}", timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            if endpoint in particiones.ENDPOINTS:
+                # Desde el caché por mes en disco, compartido por las sesiones del host
+                return aplicar_esquema(endpoint, particiones.leer(endpoint, token))
+            data = get_json(endpoint, token=token)
 
             if 'data' not in data or 'columns' not in data:
                 st.error(f"❌ Formato de datos incorrecto en {endpoint}")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
     except Exception as e:
         st.error(f"❌ Error al cargar datos de {endpoint}: {e}")
@@ -168,13 +171,13 @@ def process_sales_data(df_ingresos, df_sucursales, df_periodos):
 
 
 # Cargar y procesar datos
-@st.cache_data(ttl=600)
-def load_and_process_data():
+@st.cache_data(max_entries=16)
+def load_and_process_data(token=None, version=None):
     # Cargar datos desde los endpoints
-    df_ingresos = fetch_data_from_endpoint("ingresos_acum_dia")
-    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto")
-    df_sucursales = fetch_data_from_endpoint("sucursales")
-    df_periodos = fetch_data_from_endpoint("periodos")
+    df_ingresos = fetch_data_from_endpoint("ingresos_acum_dia", token=token, version=version_datos("ingresos_acum_dia"))
+    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto", token=token, version=version_datos("ingresos_acum_dia_ppto"))
+    df_sucursales = fetch_data_from_endpoint("sucursales", token=token, version=version_datos("sucursales"))
+    df_periodos = fetch_data_from_endpoint("periodos", token=token, version=version_datos("periodos"))
 
     # Verifica si df_ingresos está vacío y muestra un mensaje de error si es así
     if df_ingresos.empty:
@@ -251,7 +254,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Cargar datos
-df_current, df_previous, df_budget = load_and_process_data()
+df_current, df_previous, df_budget = load_and_process_data(st.session_state.get("token"), version_datos("ingresos_acum_dia", "ingresos_acum_dia_ppto", "sucursales", "periodos"))
 
 if df_current.empty:
     st.error("❌ No se pudieron cargar los datos correctamente.")
@@ -343,18 +346,18 @@ crecimiento = ((total_ventas_current - total_ventas_previous) / total_ventas_pre
 
 # Calcular promedios mensuales
 if 'periodo' in df_current.columns and not df_current.empty:
-    promedio_mensual_current = df_current.groupby('periodo')[ventas_column].sum().mean()
+    promedio_mensual_current = df_current.groupby('periodo', observed=True)[ventas_column].sum().mean()
 else:
     promedio_mensual_current = total_ventas_current / 12
 
 if 'periodo' in df_previous.columns and not df_previous.empty:
-    promedio_mensual_previous = df_previous.groupby('periodo')[ventas_column].sum().mean()
+    promedio_mensual_previous = df_previous.groupby('periodo', observed=True)[ventas_column].sum().mean()
 else:
     promedio_mensual_previous = total_ventas_previous / 12
 
 # Encontrar la mejor sucursal
 if not df_current.empty:
-    mejor_sucursal = df_current.groupby('branch_office')[ventas_column].sum().idxmax()
+    mejor_sucursal = df_current.groupby('branch_office', observed=True)[ventas_column].sum().idxmax()
 else:
     mejor_sucursal = "N/A"
 
@@ -446,10 +449,10 @@ with tab1:
     with col2:
         # Gráfico de crecimiento por sucursal
         if not df_current_filtered.empty:
-            ventas_por_sucursal_current = df_current_filtered.groupby('branch_office')[ventas_column].sum()
+            ventas_por_sucursal_current = df_current_filtered.groupby('branch_office', observed=True)[ventas_column].sum()
             
             if not df_previous_filtered.empty:
-                ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office')[ventas_column].sum()
+                ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office', observed=True)[ventas_column].sum()
                 
                 crecimiento_por_sucursal = []
                 sucursales_labels = []
@@ -490,8 +493,8 @@ with tab2:
     st.markdown("### 🏢 Análisis por Sucursal")
     
     # Ventas por sucursal - comparativo
-    ventas_por_sucursal_current = df_current_filtered.groupby('branch_office')[ventas_column].sum().reset_index()
-    ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office')[ventas_column].sum().reset_index()
+    ventas_por_sucursal_current = df_current_filtered.groupby('branch_office', observed=True)[ventas_column].sum().reset_index()
+    ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office', observed=True)[ventas_column].sum().reset_index()
     
     fig_sucursal = go.Figure()
     
@@ -541,8 +544,8 @@ with tab3:
         st.markdown("### 👤 Análisis por Responsable")
         
         # Ventas por responsable
-        ventas_por_responsable_current = df_current_filtered.groupby('responsable')[ventas_column].sum().reset_index()
-        ventas_por_responsable_previous = df_previous_filtered.groupby('responsable')[ventas_column].sum().reset_index()
+        ventas_por_responsable_current = df_current_filtered.groupby('responsable', observed=True)[ventas_column].sum().reset_index()
+        ventas_por_responsable_previous = df_previous_filtered.groupby('responsable', observed=True)[ventas_column].sum().reset_index()
         
         # Gráfico de dona
         fig_dona = px.pie(
@@ -6,7 +6,10 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from menu import generarMenu
-from utils import format_currency, format_percentage
+from perfilador import perfilado, hito, mostrar_perfil
+from utils import format_currency, format_percentage, get_json, version_datos
+from esquemas import aplicar_esquema, dataframe, rellenar
+import particiones
 import warnings
 import numpy as np
 from datetime import datetime, timedelta
@@ -109,19 +112,20 @@ st.markdown("""
 generarMenu()
 
 # Función para obtener datos de endpoints
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint):
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
     try:
         with st.spinner(f'🔄 Cargando datos de {endpoint}...'):
-            response = requests.get(f"http://localhost:8000/{endpoint}", timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            if endpoint in particiones.ENDPOINTS:
+                # Desde el caché por mes en disco, compartido por las sesiones del host
+                return aplicar_esquema(endpoint, particiones.leer(endpoint, token))
+            data = get_json(endpoint, token=token)
 
             if 'data' not in data or 'columns' not in data:
                 st.error(f"❌ Formato de datos incorrecto en {endpoint}")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Error de conexión en {endpoint}: {e}")
@@ -131,6 +135,7 @@ def fetch_data_from_endpoint(endpoint):
         return pd.DataFrame()
 
 # Función para procesar y limpiar datos de ingresos
+@perfilado("transform")
 def process_sales_data(df_ingresos, df_sucursales, df_periodos):
     """
     Procesa los datos de ingresos agregando información de sucursales.
@@ -158,9 +163,9 @@ def process_sales_data(df_ingresos, df_sucursales, df_periodos):
     # Manejar la columna responsable
     if 'responsable' not in df_ingresos.columns:
         if not df_sucursales.empty and 'responsable' in df_sucursales.columns and 'branch_office_id' in df_ingresos.columns:
-            df_ingresos['responsable'] = df_ingresos['branch_office_id'].map(
+            df_ingresos['responsable'] = rellenar(df_ingresos['branch_office_id'].map(
                 df_sucursales.set_index('branch_office_id')['responsable']
-            ).fillna('Sin Asignar')  # Llenar valores NaN
+            ), 'Sin Asignar')  # Llenar valores NaN
         else:
             # Crear responsables genéricos
             unique_sucursales = df_ingresos['branch_office'].unique()
@@ -170,13 +175,14 @@ def process_sales_data(df_ingresos, df_sucursales, df_periodos):
     return df_ingresos
 
 # Cargar y procesar datos
-@st.cache_data(ttl=600)
-def load_and_process_data():
+@perfilado("fetch")
+@st.cache_data(max_entries=16)
+def load_and_process_data(token=None, version=None):
     # Cargar datos desde los endpoints
-    df_ingresos = fetch_data_from_endpoint("ingresos_acum_dia")
-    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto")
-    df_sucursales = fetch_data_from_endpoint("sucursales")
-    df_periodos = fetch_data_from_endpoint("periodos")
+    df_ingresos = fetch_data_from_endpoint("ingresos_acum_dia", token=token, version=version_datos("ingresos_acum_dia"))
+    df_ppto = fetch_data_from_endpoint("ingresos_acum_dia_ppto", token=token, version=version_datos("ingresos_acum_dia_ppto"))
+    df_sucursales = fetch_data_from_endpoint("sucursales", token=token, version=version_datos("sucursales"))
+    df_periodos = fetch_data_from_endpoint("periodos", token=token, version=version_datos("periodos"))
 
     if df_ingresos.empty:
         st.error("❌ No se pudieron cargar los datos de ingresos desde la API.")
@@ -227,7 +233,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Cargar datos
-df_current, df_previous, df_budget = load_and_process_data()
+df_current, df_previous, df_budget = load_and_process_data(st.session_state.get("token"), version_datos("ingresos_acum_dia", "ingresos_acum_dia_ppto", "sucursales", "periodos"))
 
 if df_current.empty:
     st.error("❌ No se pudieron cargar los datos correctamente.")
@@ -307,6 +313,8 @@ if periodos_selected and 'periodo' in df_current.columns:
     if not df_previous.empty:
         df_previous_filtered = df_previous_filtered[df_previous_filtered['periodo'].isin(periodos_selected)]
 
+hito("filtros", "transform")
+
 # Validar que tenemos datos después de filtrar
 if df_current_filtered.empty:
     st.error("❌ No se encontraron datos para los filtros seleccionados en el año actual.")
@@ -321,18 +329,18 @@ crecimiento = ((total_ventas_current - total_ventas_previous) / total_ventas_pre
 
 # Calcular promedios mensuales
 if 'periodo' in df_current_filtered.columns and not df_current_filtered.empty:
-    promedio_mensual_current = df_current_filtered.groupby('periodo')[ventas_column].sum().mean()
+    promedio_mensual_current = df_current_filtered.groupby('periodo', observed=True)[ventas_column].sum().mean()
 else:
     promedio_mensual_current = total_ventas_current / 12 if total_ventas_current > 0 else 0
 
 if 'periodo' in df_previous_filtered.columns and not df_previous_filtered.empty:
-    promedio_mensual_previous = df_previous_filtered.groupby('periodo')[ventas_column].sum().mean()
+    promedio_mensual_previous = df_previous_filtered.groupby('periodo', observed=True)[ventas_column].sum().mean()
 else:
     promedio_mensual_previous = total_ventas_previous / 12 if total_ventas_previous > 0 else 0
 
 # Encontrar la mejor sucursal
 if not df_current_filtered.empty and 'branch_office' in df_current_filtered.columns:
-    mejor_sucursal = df_current_filtered.groupby('branch_office')[ventas_column].sum().idxmax()
+    mejor_sucursal = df_current_filtered.groupby('branch_office', observed=True)[ventas_column].sum().idxmax()
 else:
     mejor_sucursal = "N/A"
 
@@ -387,6 +395,8 @@ if not df_budget.empty and ventas_column in df_budget.columns:
         </div>
         """, unsafe_allow_html=True)
 
+hito("métricas principales", "transform")
+
 # Tabs para diferentes análisis
 tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Análisis General", "🏢 Por Sucursal", "👤 Por Responsable", "📅 Tendencias", "📋 Datos Detallados"])
 
@@ -424,10 +434,10 @@ with tab1:
     with col2:
         # Gráfico de crecimiento por sucursal
         if not df_current_filtered.empty and 'branch_office' in df_current_filtered.columns:
-            ventas_por_sucursal_current = df_current_filtered.groupby('branch_office')[ventas_column].sum()
+            ventas_por_sucursal_current = df_current_filtered.groupby('branch_office', observed=True)[ventas_column].sum()
             
             if not df_previous_filtered.empty and 'branch_office' in df_previous_filtered.columns:
-                ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office')[ventas_column].sum()
+                ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office', observed=True)[ventas_column].sum()
                 
                 crecimiento_por_sucursal = []
                 sucursales_labels = []
@@ -465,15 +475,17 @@ with tab1:
                 fig_current_only.update_layout(height=400)
                 st.plotly_chart(fig_current_only, use_container_width=True)
 
+hito("tab análisis general", "chart")
+
 with tab2:
     if 'branch_office' in df_current_filtered.columns:
         st.markdown("### 🏢 Análisis por Sucursal")
         
         # Ventas por sucursal - comparativo
-        ventas_por_sucursal_current = df_current_filtered.groupby('branch_office')[ventas_column].sum().reset_index()
+        ventas_por_sucursal_current = df_current_filtered.groupby('branch_office', observed=True)[ventas_column].sum().reset_index()
         
         if not df_previous_filtered.empty and 'branch_office' in df_previous_filtered.columns:
-            ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office')[ventas_column].sum().reset_index()
+            ventas_por_sucursal_previous = df_previous_filtered.groupby('branch_office', observed=True)[ventas_column].sum().reset_index()
         else:
             ventas_por_sucursal_previous = pd.DataFrame(columns=['branch_office', ventas_column])
         
@@ -532,13 +544,15 @@ with tab2:
     else:
         st.info("📝 No hay datos de sucursales disponibles.")
 
+hito("tab por sucursal", "chart")
+
 with tab3:
     if 'responsable' in df_current_filtered.columns:
         st.markdown("### 👤 Análisis por Responsable")
         
         # Ventas por responsable
-        ventas_por_responsable_current = df_current_filtered.groupby('responsable')[ventas_column].sum().reset_index()
-        ventas_por_responsable_previous = df_previous_filtered.groupby('responsable')[ventas_column].sum().reset_index()
+        ventas_por_responsable_current = df_current_filtered.groupby('responsable', observed=True)[ventas_column].sum().reset_index()
+        ventas_por_responsable_previous = df_previous_filtered.groupby('responsable', observed=True)[ventas_column].sum().reset_index()
         
         # Gráfico de dona
         fig_dona = px.pie(
@@ -589,6 +603,8 @@ with tab3:
     else:
         st.info("📝 No hay datos de responsables disponibles en el dataset actual.")
 
+hito("tab por responsable", "chart")
+
 with tab4:
     st.markdown("### 📅 Análisis de Tendencias")
     
@@ -663,6 +679,8 @@ with tab4:
             </div>
             """, unsafe_allow_html=True)
 
+hito("tab tendencias", "chart")
+
 with tab5:
     st.markdown("### 📋 Datos Detallados")
     
@@ -690,6 +708,8 @@ with tab5:
         st.markdown(f"**Año {current_year-1}:**")
         st.write(df_previous_filtered[ventas_column].describe())
 
+hito("tab datos detallados", "chart")
+
 # Footer con información adicional
 st.markdown("---")
 #st.markdown("""
@@ -697,4 +717,6 @@ st.markdown("---")
 #    <p style='margin: 0; color: #6c757d;'>📊 Dashboard de Ventas - Actualizado automáticamente cada 5 minutos</p>
 #    <p style='margin: 0; color: #6c757d;'>Última actualización: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
 #</div>
-#""", unsafe_allow_html=True)
\ No newline at end of file
+#""", unsafe_allow_html=True)
+
+mostrar_perfil("ventas")
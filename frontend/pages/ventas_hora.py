@@ -11,7 +11,10 @@ from scipy import stats
 from scipy.signal import find_peaks
 import seaborn as sns
 from menu import generarMenu
-from utils import format_currency, format_percentage
+from perfilador import perfilado, mostrar_perfil
+from utils import format_currency, format_percentage, get_json, version_datos
+from esquemas import dataframe
+import dimensiones
 import warnings
 import base64
 from sklearn.ensemble import IsolationForest
@@ -67,20 +70,18 @@ st.markdown("""
 generarMenu()
 
 # ================ FUNCIONES DE OBTENCIÓN DE DATOS MEJORADAS ================
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_data_from_endpoint(endpoint):
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_data_from_endpoint(endpoint, token=None, version=None):
     """Función mejorada para obtener datos de endpoints con manejo de errores"""
     try:
         with st.spinner(f'Cargando datos de {endpoint}...'):
-            response = requests.get(f"http://localhost:8000/{endpoint}", timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            data = get_json(endpoint, token=token)
 
             if 'data' not in data or 'columns' not in data:
                 st.error(f"Formato de datos incorrecto en {endpoint}")
                 return pd.DataFrame()
 
-            df = pd.DataFrame(data['data'], columns=data['columns'])
+            df = dataframe(endpoint, data)
             return df
 
     except requests.exceptions.Timeout:
@@ -96,26 +97,19 @@ def fetch_data_from_endpoint(endpoint):
         st.error(f"💥 Error inesperado en {endpoint}: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=600)
-def load_and_process_data():
+@perfilado("fetch")
+@st.cache_data(max_entries=16)
+def load_and_process_data(token=None, version=None):
     """Carga y procesa todos los datos necesarios"""
     # Cargar datos
-    df_venta_hora = fetch_data_from_endpoint("venta_hora")
-    df_sucursales = fetch_data_from_endpoint("sucursales")
-    df_periodos = fetch_data_from_endpoint("periodos_date")
+    df_venta_hora = fetch_data_from_endpoint("venta_hora", token=token, version=version_datos("venta_hora"))
 
     if df_venta_hora.empty:
         return pd.DataFrame(), {}
 
-    # Procesar datos
-    dte_final = df_venta_hora.merge(df_sucursales, on=['branch_office_id'], how='left')
-
-    # Merge con sucursales
-    if not df_sucursales.empty:
-        dte_final = dte_final.merge(
-            df_sucursales[['branch_office_id', 'responsable', 'branch_office']],
-            on='branch_office_id', how='left'
-        )
+    # Datos de la sucursal desde la dimensión en memoria (una sola vez: antes se unía dos veces
+    # con df_sucursales y 'responsable' y 'branch_office' quedaban como _x/_y)
+    dte_final = dimensiones.sucursales(token).agregar(df_venta_hora)
 
     # Procesar fechas y horas
     dte_final['hora_inicio'] = pd.to_datetime(dte_final['hora_inicio'], format='%H:%M:%S').dt.time
@@ -126,6 +120,7 @@ def load_and_process_data():
     return dte_final, {}
 
 # ================ ANÁLISIS ESTADÍSTICOS AVANZADOS ================
+@perfilado("model")
 def advanced_statistical_analysis(df):
     """Análisis estadístico completo y avanzado"""
     if df.empty:
@@ -159,6 +154,7 @@ def advanced_statistical_analysis(df):
 
     return analysis
 
+@perfilado("model")
 def detect_anomalies_advanced(df):
     """Detección avanzada de anomalías usando múltiples métodos"""
     if df.empty:
@@ -189,6 +185,7 @@ def detect_anomalies_advanced(df):
 
     return df_result, anomaly_info
 
+@perfilado("model")
 def clustering_analysis(df):
     """Análisis de clustering para segmentación"""
     if df.empty:
@@ -243,7 +240,7 @@ def create_advanced_dashboard():
     """Crea dashboard principal con múltiples pestañas"""
 
     # Cargar datos
-    df, _ = load_and_process_data()
+    df, _ = load_and_process_data(st.session_state.get("token"), version_datos("venta_hora", "sucursales"))
 
     if df.empty:
         st.error("❌ No se pudieron cargar los datos")
@@ -284,6 +281,7 @@ def create_advanced_dashboard():
     with tab5:
         create_clustering_tab(df_filtered)
 
+@perfilado("transform")
 def apply_filters(df):
     """Aplica filtros desde sidebar"""
     st.sidebar.header("🔍 Filtros de Análisis")
@@ -328,6 +326,7 @@ def apply_filters(df):
 
     return df_filtered
 
+@perfilado("chart")
 def create_executive_summary(df):
     """Pestaña de resumen ejecutivo"""
     if df.empty:
@@ -392,6 +391,7 @@ def create_executive_summary(df):
         fig_evolution.update_layout(title='Evolución Temporal')
         st.plotly_chart(fig_evolution, use_container_width=True)
 
+@perfilado("chart")
 def create_temporal_analysis(df):
     """Análisis temporal avanzado"""
     if df.empty:
@@ -435,6 +435,7 @@ def create_temporal_analysis(df):
     fig.update_layout(height=600, showlegend=True)
     st.plotly_chart(fig, use_container_width=True)
 
+@perfilado("chart")
 def create_anomaly_detection_tab(df):
     """Pestaña de detección de anomalías"""
     if df.empty:
@@ -464,6 +465,7 @@ def create_anomaly_detection_tab(df):
         )
         st.plotly_chart(fig_iso, use_container_width=True)
 
+@perfilado("chart")
 def create_statistical_analysis_tab(df):
     """Pestaña de análisis estadístico"""
     if df.empty:
@@ -481,6 +483,7 @@ def create_statistical_analysis_tab(df):
         if f'{col}_stats' in analysis:
             st.json(analysis[f'{col}_stats'])
 
+@perfilado("chart")
 def create_clustering_tab(df):
     """Pestaña de análisis de clustering"""
     if df.empty:
@@ -509,4 +512,5 @@ def create_clustering_tab(df):
 # Punto de entrada de la aplicación
 if __name__ == "__main__":
     create_advanced_dashboard()
+    mostrar_perfil("ventas_hora")
 
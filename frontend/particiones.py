@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# particiones.py
+"""
+Caché en disco, por mes, de los datos del año de los tableros.
+
+Las páginas descargan en cada sesión el año completo de /depositos,
+/recaudacion, /abonados e /ingresos_acum_dia cada vez que se renueva su
+st.cache_data. Este módulo guarda esas respuestas en el host de Streamlit
+como archivos Parquet, uno por mes:
+
+    .cache/particiones/depositos/admin/mes=2025-03/datos.parquet
+
+Todas las sesiones y procesos del host leen los mismos archivos (con
+memory map y, si se pide, solo los meses y sucursales necesarios). Cuando
+cambia la versión de los datos se consulta GET /particiones, que entrega la
+firma de cada mes (filas, suma de la medida y checksum de las filas), y se
+descargan solo los meses cuya firma cambió, normalmente el mes en curso.
+
+Cada alcance de datos tiene su carpeta: 'admin' o el rut del supervisor, la
+misma regla con que el backend filtra las sucursales.
+"""
+import base64
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+import requests
+
+from utils import get_json, version_datos
+
+PARTICIONES_DIR = Path(os.getenv('PARTICIONES_DIR', Path(__file__).resolve().parent / ".cache" / "particiones"))
+ENDPOINTS = ("depositos", "recaudacion", "abonados", "ingresos_acum_dia")
+
+_MANIFIESTO = "_manifiesto.json"
+_lock = threading.Lock()
+
+
+def alcance(token):
+    """'admin' o el rut del usuario del token (no verifica la firma: solo nombra la carpeta)."""
+    try:
+        payload = token.split(".")[0]
+        sesion = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (AttributeError, ValueError):
+        return None
+    if (sesion.get("role") or "").strip().lower() == 'administrador':
+        return "admin"
+    return sesion.get("rut")
+
+
+def _leer_manifiesto(carpeta):
+    try:
+        return json.loads((carpeta / _MANIFIESTO).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"version": None, "firmas": {}, "columnas": None}
+
+
+def _escribir(ruta, escribir):
+    # Escritura atómica: otro proceso nunca lee un archivo a medio escribir
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def _guardar_mes(carpeta, mes, df):
+    _escribir(carpeta / f"mes={mes}" / "datos.parquet", lambda ruta: df.to_parquet(ruta, index=False))
+
+
+def _meses(df):
+    return pd.to_datetime(df["date"]).dt.strftime("%Y-%m")
+
+
+def _sincronizar(endpoint, token, carpeta, manifiesto):
+    """Descarga los meses cuya firma cambió y elimina los que ya no existen."""
+    respuesta = get_json("particiones", params={"endpoint": endpoint}, token=token)
+    df_firmas = pd.DataFrame(respuesta["data"], columns=respuesta["columns"])
+    firmas = {
+        f"{fila.year:04d}-{fila.month:02d}": f"{fila.filas}:{fila.total}:{fila.checksum}"
+        for fila in df_firmas.itertuples(index=False)
+    }
+    cambiados = [mes for mes, firma in firmas.items()
+                 if manifiesto["firmas"].get(mes) != firma or not (carpeta / f"mes={mes}").exists()]
+    columnas = manifiesto.get("columnas")
+
+    if cambiados and len(cambiados) == len(firmas):
+        # Primera carga (o todo cambió): una sola descarga repartida por mes
+        data = get_json(endpoint, token=token, timeout=120)
+        df = pd.DataFrame(data["data"], columns=data["columns"])
+        columnas = data["columns"]
+        for mes, df_mes in df.groupby(_meses(df)):
+            _guardar_mes(carpeta, mes, df_mes)
+    else:
+        for mes in cambiados:
+            year, month = mes.split("-")
+            params = {"year": int(year), "month": int(month)}
+            data = get_json(endpoint, params=params, token=token, timeout=120)
+            columnas = data["columns"]
+            _guardar_mes(carpeta, mes, pd.DataFrame(data["data"], columns=data["columns"]))
+
+    for particion in carpeta.glob("mes=*"):
+        if particion.name[4:] not in firmas:
+            shutil.rmtree(particion, ignore_errors=True)
+    return {"firmas": firmas, "columnas": columnas}
+
+
+def leer(endpoint, token, meses=None, sucursales=None):
+    """
+    DataFrame de 'endpoint' desde el caché en disco, sincronizándolo antes si
+    cambió la versión de los datos. 'meses' ('2025-03', ...) y 'sucursales'
+    limitan lo que se lee del disco. Lanza las mismas excepciones que get_json.
+    """
+    nombre_alcance = alcance(token)
+    if nombre_alcance is None:
+        data = get_json(endpoint, token=token)
+        return pd.DataFrame(data["data"], columns=data["columns"])
+
+    carpeta = PARTICIONES_DIR / endpoint / nombre_alcance
+    version = version_datos(endpoint)
+    with _lock:
+        manifiesto = _leer_manifiesto(carpeta)
+        if manifiesto["version"] != version:
+            try:
+                manifiesto = {"version": version, **_sincronizar(endpoint, token, carpeta, manifiesto)}
+            except requests.exceptions.RequestException:
+                # Sin API se sirve lo que hay en disco; se reintenta en la próxima lectura
+                if not manifiesto["firmas"]:
+                    raise
+            else:
+                _escribir(carpeta / _MANIFIESTO,
+                          lambda ruta: ruta.write_text(json.dumps(manifiesto), encoding="utf-8"))
+
+    archivos = [carpeta / f"mes={mes}" / "datos.parquet" for mes in sorted(manifiesto["firmas"])
+                if meses is None or mes in meses]
+    filtros = [("branch_office_id", "in", list(sucursales))] if sucursales is not None else None
+    # Un archivo a la vez: los meses pueden diferir en el tipo de columnas con nulos
+    partes = [pq.read_table(archivo, memory_map=True, filters=filtros).to_pandas()
+              for archivo in archivos if archivo.exists()]
+    if not partes:
+        return pd.DataFrame(columns=manifiesto.get("columnas") or [])
+    return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# perfilador.py
+"""
+Perfilador de etapas de las páginas (opcional).
+
+Se activa con el interruptor "⏱️ Perfilador" del menú lateral, con
+?perfil=1 en la URL o con la variable de entorno PERFILADOR=1. Desactivado no
+mide nada.
+
+Las etapas se marcan de tres formas:
+
+    @perfilado("fetch")                      # función completa
+    def load_and_process_data(...): ...
+
+    with etapa("figura mapa", "chart"):      # bloque
+        ...
+
+    hito("filtros", "transform")             # desde el hito anterior (scripts planos)
+
+Cada etapa tiene una categoría: fetch, transform, model o chart. Al final de
+la página, mostrar_perfil() las muestra en el menú lateral y las agrega a
+PERFILADOR_LOG (JSON por línea); benchmarks/resumen_perfil.py las resume
+entre sesiones.
+"""
+import functools
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+CATEGORIAS = ("fetch", "transform", "model", "chart")
+PERFILADOR_LOG = Path(os.getenv('PERFILADOR_LOG', Path(__file__).resolve().parent / "logs" / "perfil_etapas.jsonl"))
+
+_ESTADO = "_perfilador"
+
+
+def activo():
+    if os.getenv('PERFILADOR') == '1':
+        return True
+    return bool(st.session_state.get("perfilador"))
+
+
+def _estado():
+    return st.session_state.get(_ESTADO)
+
+
+def iniciar_ejecucion():
+    """Comienza el registro de una ejecución del script (lo llama generarMenu)."""
+    if "perfilador" not in st.session_state:
+        st.session_state.perfilador = st.query_params.get("perfil") == "1"
+    if "perfilador_sesion" not in st.session_state:
+        st.session_state.perfilador_sesion = uuid.uuid4().hex[:12]
+    ahora = time.perf_counter()
+    st.session_state[_ESTADO] = {
+        "ejecucion": uuid.uuid4().hex[:12],
+        "inicio": ahora,
+        "ultimo_hito": ahora,
+        "nivel": 0,
+        "etapas": [],
+    }
+
+
+def _registrar(nombre, categoria, inicio, fin, nivel):
+    estado = _estado()
+    if estado is None:
+        return
+    estado["etapas"].append({
+        "etapa": nombre,
+        "categoria": categoria,
+        "nivel": nivel,
+        "ms": round((fin - inicio) * 1000, 2),
+    })
+    estado["ultimo_hito"] = fin
+
+
+@contextmanager
+def etapa(nombre, categoria="transform"):
+    """Mide el bloque como una etapa. Las etapas anidadas se muestran con sangría."""
+    estado = _estado()
+    if not activo() or estado is None:
+        yield
+        return
+    nivel = estado["nivel"]
+    estado["nivel"] += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        estado["nivel"] = nivel
+        _registrar(nombre, categoria, inicio, time.perf_counter(), nivel)
+
+
+def perfilado(categoria="transform", nombre=None):
+    """Decorador: cada llamada a la función es una etapa (ponerlo sobre @st.cache_data mide también los aciertos de caché)."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(nombre or funcion.__name__, categoria):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def hito(nombre, categoria="transform"):
+    """Registra como etapa el tiempo transcurrido desde el hito o la etapa anterior."""
+    estado = _estado()
+    if not activo() or estado is None:
+        return
+    _registrar(nombre, categoria, estado["ultimo_hito"], time.perf_counter(), estado["nivel"])
+
+
+def _escribir_log(pagina, estado):
+    PERFILADOR_LOG.parent.mkdir(parents=True, exist_ok=True)
+    ts = datetime.now().isoformat(timespec="seconds")
+    base = {"ts": ts, "sesion": st.session_state.get("perfilador_sesion"), "ejecucion": estado["ejecucion"], "pagina": pagina}
+    with open(PERFILADOR_LOG, "a", encoding="utf-8") as archivo:
+        for fila in estado["etapas"]:
+            archivo.write(json.dumps({**base, **fila}, ensure_ascii=False) + "\n")
+
+
+def mostrar_perfil(pagina):
+    """Al final de la página: panel con las etapas en el menú lateral y registro en el log."""
+    estado = _estado()
+    if not activo() or estado is None:
+        return
+    total_ms = (time.perf_counter() - estado["inicio"]) * 1000
+    estado["etapas"].append({"etapa": "total", "categoria": "total", "nivel": 0, "ms": round(total_ms, 2)})
+    try:
+        _escribir_log(pagina, estado)
+    except OSError as e:
+        st.sidebar.caption(f"No se pudo escribir {PERFILADOR_LOG}: {e}")
+
+    df = pd.DataFrame(estado["etapas"][:-1])
+    with st.sidebar.expander(f"⏱️ Perfil: {total_ms:,.0f} ms", expanded=True):
+        if df.empty:
+            st.caption("Sin etapas medidas en esta página.")
+            return
+        # Solo las etapas de primer nivel suman al total (las anidadas ya están dentro)
+        primer_nivel = df[df["nivel"] == 0]
+        por_categoria = primer_nivel.groupby("categoria")["ms"].sum().reindex(CATEGORIAS).dropna()
+        por_categoria["sin medir"] = max(total_ms - primer_nivel["ms"].sum(), 0)
+        st.dataframe(
+            por_categoria.rename("ms").to_frame().assign(pct=lambda d: d["ms"] / total_ms * 100).round(1),
+            use_container_width=True
+        )
+        df["etapa"] = df["nivel"].map(lambda n: "· " * n) + df["etapa"]
+        st.dataframe(df[["etapa", "categoria", "ms"]], hide_index=True, use_container_width=True)
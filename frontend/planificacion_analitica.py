@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# planificacion_analitica.py
+"""
+Motor de estadísticas de la grilla de turnos.
+
+La grilla del editor (trabajadores x días) se codifica como una matriz de
+enteros: 0 es la celda vacía y cada código de turno tiene un índice en una
+tabla con sus minutos trabajados. Los totales por trabajador, semana, día y
+día de la semana se obtienen con reducciones de NumPy sobre esa matriz.
+
+Entre una ejecución y otra del script solo cambian unas pocas celdas, por lo
+que 'actualizar' compara la nueva matriz con la anterior y ajusta los
+totales solo con las celdas modificadas.
+"""
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = np.array(["Lunes", "Martes", "Miercoles", "Jueves", "Viernes", "Sabado", "Domingo"])
+
+# Sobre esta fracción de celdas modificadas conviene recalcular todo
+FRACCION_RECALCULO = 0.25
+
+
+def formatear_minutos(minutos):
+    """Formato 'HH:MM' de un arreglo de minutos ('0:00' si es cero)."""
+    minutos = np.nan_to_num(np.asarray(minutos, dtype=float))
+    horas = (minutos // 60).astype(int).astype(str)
+    resto = (minutos % 60).astype(int).astype(str)
+    texto = np.char.add(np.char.add(np.char.zfill(horas, 2), ":"), np.char.zfill(resto, 2))
+    return np.where(minutos == 0, "0:00", texto)
+
+
+class MallaAnalitica:
+    """
+    Totales de la planificación para un conjunto fijo de trabajadores, días y
+    catálogo de turnos. Se crea una vez por plantilla y se actualiza con la
+    grilla editada en cada ejecución.
+    """
+
+    def __init__(self, turnos_dict, dates):
+        self.columnas = [d.strftime('%d-%m-%Y') for d in dates]
+        self.turnos_dict = turnos_dict
+        self.codigos = [""] + sorted(turnos_dict)
+        self.minutos = np.nan_to_num(np.array([0.0] + [float(turnos_dict[c].get('working_minutes', 0) or 0) for c in self.codigos[1:]]))
+
+        self.weekday = np.array([d.weekday() for d in dates])
+        # Semanas ISO en orden de aparición (en enero puede venir la 52/53 y en diciembre la 1)
+        semanas, primera, inversa = np.unique([d.isocalendar()[1] for d in dates], return_index=True, return_inverse=True)
+        orden = np.argsort(primera)
+        rango = np.empty_like(orden)
+        rango[orden] = np.arange(len(orden))
+        self.semanas = semanas[orden]
+        self.semana_idx = rango[inversa]
+        self.semana_onehot = np.eye(len(self.semanas))[self.semana_idx]  # (días x semanas)
+
+        self.codes = None
+
+    # --- Codificación ---
+
+    def codificar(self, df_editada):
+        """Matriz (trabajadores x días) de índices en 'self.codigos'."""
+        valores = df_editada[self.columnas].fillna("").astype(str).to_numpy().ravel()
+        codes = pd.Categorical(valores, categories=self.codigos).codes
+        if (codes < 0).any():
+            # Códigos que ya no están en el catálogo: cuentan como turno de 0 minutos
+            nuevos = sorted(set(valores[codes < 0]))
+            self.codigos += nuevos
+            self.minutos = np.concatenate([self.minutos, np.zeros(len(nuevos))])
+            codes = pd.Categorical(valores, categories=self.codigos).codes
+        return codes.astype(np.int32).reshape(len(df_editada), len(self.columnas))
+
+    # --- Totales ---
+
+    def _recalcular(self, codes):
+        minutos = self.minutos[codes]
+        ocupado = codes > 0
+        self.minutos_semana = minutos @ self.semana_onehot
+        self.minutos_dia = minutos.sum(axis=0)
+        self.turnos_dia = ocupado.sum(axis=0)
+        self.turnos_trabajador = ocupado.sum(axis=1)
+        self.conteo_codigos = np.bincount(codes.ravel(), minlength=len(self.codigos))
+        self.codes = codes
+
+    def _aplicar_cambios(self, codes):
+        filas, cols = np.nonzero(codes != self.codes)
+        if filas.size == 0:
+            return
+        antes, despues = self.codes[filas, cols], codes[filas, cols]
+        delta_min = self.minutos[despues] - self.minutos[antes]
+        delta_ocupado = (despues > 0).astype(int) - (antes > 0).astype(int)
+
+        np.add.at(self.minutos_semana, (filas, self.semana_idx[cols]), delta_min)
+        np.add.at(self.minutos_dia, cols, delta_min)
+        np.add.at(self.turnos_dia, cols, delta_ocupado)
+        np.add.at(self.turnos_trabajador, filas, delta_ocupado)
+        self.conteo_codigos = np.pad(self.conteo_codigos, (0, len(self.codigos) - len(self.conteo_codigos)))
+        np.add.at(self.conteo_codigos, antes, -1)
+        np.add.at(self.conteo_codigos, despues, 1)
+        self.codes = codes
+
+    def actualizar(self, df_editada):
+        """Sincroniza los totales con la grilla editada (solo las celdas que cambiaron)."""
+        codes = self.codificar(df_editada)
+        if self.codes is None or self.codes.shape != codes.shape:
+            self._recalcular(codes)
+        elif np.count_nonzero(codes != self.codes) > FRACCION_RECALCULO * codes.size:
+            self._recalcular(codes)
+        else:
+            self._aplicar_cambios(codes)
+        return self
+
+    # --- Consultas ---
+
+    @property
+    def minutos_trabajador(self):
+        return self.minutos_semana.sum(axis=1)
+
+    def minutos_dia_semana(self):
+        """Minutos planificados por día de la semana (Lunes..Domingo)."""
+        return np.bincount(self.weekday, weights=self.minutos_dia, minlength=7)
+
+    def semanas_con_turnos(self):
+        turnos_semana = np.bincount(self.semana_idx, weights=self.turnos_dia, minlength=len(self.semanas))
+        return turnos_semana > 0
+
+    def etiquetas_semanas(self):
+        return [f"Semana {s}" for s in self.semanas]
+
+    def matriz_campo(self, campo, defecto="-"):
+        """Matriz (trabajadores x días) con el atributo 'campo' de cada turno."""
+        tabla = np.array([defecto] + [self.turnos_dict.get(c, {}).get(campo, defecto) for c in self.codigos[1:]], dtype=object)
+        return tabla[self.codes]
+
+    def celdas_ocupadas(self):
+        """(fila, columna, código) de las celdas con turno, por trabajador y fecha."""
+        filas, cols = np.nonzero(self.codes > 0)
+        return filas, cols, self.codes[filas, cols]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# planificacion_pdf.py
+"""
+Generación de las planillas de turnos en PDF por trabajador.
+
+Cada PDF depende solo de sus datos (trabajador, periodo, turnos y resumen),
+por lo que se identifica con un hash de contenido y se guarda en disco: los
+trabajadores sin cambios no se vuelven a generar. Los que faltan se generan
+en un pool de procesos y se escriben en el ZIP a medida que terminan.
+Después de cada ZIP la caché se poda por antigüedad de uso y cantidad.
+"""
+import hashlib
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import as_completed
+from io import BytesIO
+from pathlib import Path
+
+from fpdf import FPDF
+
+LOGO_PATH = Path(__file__).parent / "pages" / "logo.jpg"
+
+# Carpeta donde se guardan los PDFs ya generados
+PDF_CACHE_DIR = Path(__file__).parent / ".cache" / "pdfs"
+
+# Cambiar si cambia el diseño del PDF, para invalidar la caché
+PDF_LAYOUT_VERSION = 1
+
+# Límites de la caché: PDFs no usados en estos días, o que excedan el máximo, se eliminan
+PDF_CACHE_MAX_DIAS = 45
+PDF_CACHE_MAX_ARCHIVOS = 5000
+
+
+def format_rut_with_dots(rut_str):
+    if not isinstance(rut_str, str) or '-' not in rut_str: return rut_str
+    body, verifier = rut_str.split('-')
+    body = body.replace('.', '')
+    try:
+        formatted_body = f"{int(body):,}".replace(",", ".")
+        return f"{formatted_body}-{verifier}"
+    except ValueError:
+        return rut_str
+
+
+def crear_pdf_trabajador(worker_data, schedule_rows, weekly_summary, sucursal, month_name, year):
+    """
+    Genera el PDF de un trabajador.
+    'schedule_rows' es una lista de (Día, Fecha, Turno, Jornada, Horario) y
+    'weekly_summary' un diccionario {encabezado: valor} con el resumen de horas.
+    """
+    pdf = FPDF(orientation="P", unit="mm", format="A4")
+    pdf.add_page()
+    # --- 1. ENCABEZADO CON LOGO Y DATOS ALINEADOS ---
+    try:
+        pdf.image(str(LOGO_PATH), x=170, y=8, w=30)
+    except FileNotFoundError:
+        pass
+
+    pdf.set_y(12)
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 8, "Planilla de Turnos Mensual", 0, 1, "C")
+    pdf.ln(4)
+
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(20, 5, "Nombre:", 0, 0)
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(85, 5, worker_data['Trabajador'], 0, 0)
+
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(15, 5, "RUT:")
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(0, 5, format_rut_with_dots(worker_data['rut']), 0, 1)
+
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(20, 5, "Sucursal:")
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(85, 5, sucursal, 0, 0)
+
+    pdf.set_font("Helvetica", "", 9)
+    pdf.cell(15, 5, "Periodo:")
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.cell(0, 5, f"{month_name.capitalize()} {year}", 0, 1)
+
+    pdf.ln(6)
+
+    # --- 2. TABLA DE HORARIOS DETALLADA (CENTRADA) ---
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.set_fill_color(224, 224, 224)
+    col_widths = [30, 25, 20, 20, 40]
+    total_width = sum(col_widths)
+    start_x = (pdf.w - total_width) / 2
+    pdf.set_x(start_x)
+
+    headers = ["Día", "Fecha", "Turno", "Jornada", "Horario"]
+    for i, header in enumerate(headers):
+        pdf.cell(col_widths[i], 6, header, 1, 0, "C", 1)
+    pdf.ln()
+
+    pdf.set_font("Helvetica", "", 8)
+    aligns = ["L", "C", "C", "C", "C"]
+    for row in schedule_rows:
+        pdf.set_x(start_x)
+        for i, value in enumerate(row):
+            pdf.cell(col_widths[i], 5, str(value), 1, 1 if i == len(row) - 1 else 0, aligns[i])
+
+    # --- 3. TABLA DE RESUMEN DE HORAS (CENTRADA) ---
+    pdf.ln(5)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(0, 6, "Resumen de Horas", 0, 1, "C")
+
+    pdf.set_font("Helvetica", "B", 8)
+    summary_headers = list(weekly_summary.keys())
+    num_summary_cols = len(summary_headers)
+    summary_total_width = total_width
+    summary_col_width = summary_total_width / num_summary_cols
+
+    start_x_summary = (pdf.w - summary_total_width) / 2
+    pdf.set_x(start_x_summary)
+
+    for header in summary_headers:
+        pdf.cell(summary_col_width, 6, header, 1, 0, "C", 1)
+    pdf.ln()
+
+    pdf.set_font("Helvetica", "B", 9)
+    pdf.set_x(start_x_summary)
+    for header in summary_headers:
+        pdf.cell(summary_col_width, 6, weekly_summary[header], 1, 0, "C")
+    pdf.ln()
+
+    # --- 4. SECCIÓN DE FIRMA (POSICIONADA AL FINAL) ---
+    # Posicionar a 250mm desde el borde superior
+    pdf.set_y(250)
+
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(95, 6, "Recibido Conforme,", 0, 1, "L")
+    pdf.ln(8)
+
+    # Líneas y texto para Firma y Fecha en la misma "fila" visual
+    pdf.line(pdf.get_x() + 10, pdf.get_y(), pdf.get_x() + 80, pdf.get_y())
+    pdf.line(pdf.get_x() + 115, pdf.get_y(), pdf.get_x() + 165, pdf.get_y())
+
+    pdf.cell(95, 6, "Firma Trabajador", 0, 0, "C")
+    pdf.cell(0, 6, "Fecha", 0, 1, "C")
+
+    return bytes(pdf.output())
+
+
+def pdf_content_hash(job):
+    """Hash del contenido de un PDF: (trabajador, periodo, turnos, resumen)."""
+    payload = json.dumps([PDF_LAYOUT_VERSION, job], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _render_job(job):
+    return crear_pdf_trabajador(
+        job['worker'], job['schedule'], job['summary'], job['sucursal'], job['month_name'], job['year']
+    )
+
+
+def generar_zip(jobs, executor=None):
+    """
+    Genera el ZIP con los PDFs de 'jobs'. Cada job es un diccionario con
+    'file_name', 'worker', 'schedule', 'summary', 'sucursal', 'month_name' y
+    'year'. Los PDFs en caché se agregan de inmediato; el resto se genera en
+    'executor' (o en serie si es None) y se agrega al ZIP al terminar.
+    """
+    PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, False) as zip_file:
+        pendientes = []
+        for job in jobs:
+            contenido = {k: v for k, v in job.items() if k != 'file_name'}
+            cache_path = PDF_CACHE_DIR / f"{pdf_content_hash(contenido)}.pdf"
+            try:
+                # La fecha de modificación marca el último uso: se actualiza antes de
+                # leer (os.utime, a diferencia de touch, no crea el archivo si otra
+                # sesión lo eliminó) y el PDF entra al ZIP solo si la lectura resultó
+                os.utime(cache_path)
+                pdf_bytes = cache_path.read_bytes()
+            except FileNotFoundError:
+                pendientes.append((job, cache_path))
+                continue
+            zip_file.writestr(job['file_name'], pdf_bytes)
+
+        if executor is None:
+            resultados = ((job, path, _render_job(job)) for job, path in pendientes)
+        else:
+            futures = {executor.submit(_render_job, job): (job, path) for job, path in pendientes}
+            resultados = ((*futures[f], f.result()) for f in as_completed(futures))
+
+        for job, cache_path, pdf_bytes in resultados:
+            cache_path.write_bytes(pdf_bytes)
+            zip_file.writestr(job['file_name'], pdf_bytes)
+
+    podar_cache()
+    return zip_buffer.getvalue()
+
+
+def podar_cache(max_dias=PDF_CACHE_MAX_DIAS, max_archivos=PDF_CACHE_MAX_ARCHIVOS):
+    """
+    Elimina de PDF_CACHE_DIR los PDFs sin uso en 'max_dias' y, si aún quedan
+    más de 'max_archivos', los usados hace más tiempo. Retorna cuántos eliminó.
+    """
+    archivos = []
+    for path in PDF_CACHE_DIR.glob("*.pdf"):
+        try:
+            archivos.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue  # lo eliminó otra sesión
+    archivos.sort(reverse=True)
+    limite = time.time() - max_dias * 86400
+    eliminar = [path for i, (mtime, path) in enumerate(archivos) if mtime < limite or i >= max_archivos]
+    for path in eliminar:
+        path.unlink(missing_ok=True)
+    return len(eliminar)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# series_tiempo.py
+"""
+Características de series de tiempo por sucursal para los tableros.
+
+Las medias móviles se calculaban con un groupby().transform(lambda ...) por
+columna y ventana: seis pasadas con una función Python por sucursal. Aquí se
+ordena una sola vez por (sucursal, fecha) y todas las ventanas de todas las
+columnas salen de diferencias de sumas acumuladas sobre arreglos de numpy.
+"""
+import numpy as np
+import pandas as pd
+
+
+def medias_moviles(df, columnas, ventanas=(7, 30), grupo='branch_office_id', fecha='date', min_periodos=1):
+    """
+    Copia de 'df' con '<columna>_ma<ventana>' para cada columna y ventana: la
+    media de las últimas 'ventana' filas del grupo, incluida la actual. Da lo
+    mismo que groupby(grupo)[columna].rolling(ventana, min_periods).mean()
+    (los nulos no cuentan) y respeta el orden original de las filas.
+    """
+    resultado = df.copy()
+    if df.empty:
+        for columna in columnas:
+            for ventana in ventanas:
+                resultado[f'{columna}_ma{ventana}'] = pd.Series(dtype=float)
+        return resultado
+
+    # Posiciones de las filas ordenadas por (grupo, fecha)
+    permutacion = df[[grupo, fecha]].reset_index(drop=True).sort_values([grupo, fecha], kind='stable').index.to_numpy()
+    orden = df.iloc[permutacion]
+    n = len(orden)
+    posicion = np.arange(n)
+    codigos = pd.factorize(orden[grupo])[0]
+    inicios = np.r_[0, np.flatnonzero(np.diff(codigos)) + 1]
+    inicio_fila = np.repeat(inicios, np.diff(np.r_[inicios, n]))
+
+    valores = orden[columnas].to_numpy(dtype=float)
+    validos = ~np.isnan(valores)
+    # Fila de ceros al inicio: la suma de (desde, hasta] es acumulado[hasta] - acumulado[desde]
+    acumulado = np.vstack([np.zeros(len(columnas)), np.cumsum(np.where(validos, valores, 0), axis=0)])
+    conteo = np.vstack([np.zeros(len(columnas)), np.cumsum(validos, axis=0)])
+
+    hasta = posicion + 1
+    for ventana in ventanas:
+        desde = np.maximum(hasta - ventana, inicio_fila)
+        suma = acumulado[hasta] - acumulado[desde]
+        cuenta = conteo[hasta] - conteo[desde]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medias = np.where(cuenta >= min_periodos, suma / cuenta, np.nan)
+        en_orden_original = np.empty_like(medias)
+        en_orden_original[permutacion] = medias
+        for i, columna in enumerate(columnas):
+            resultado[f'{columna}_ma{ventana}'] = en_orden_original[:, i]
+
+    # Mismo orden de columnas que el cálculo por columna: col_ma7, col_ma30, ...
+    nuevas = [f'{columna}_ma{ventana}' for columna in columnas for ventana in ventanas]
+    return resultado[[c for c in resultado.columns if c not in nuevas] + nuevas]
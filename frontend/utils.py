@@ -1,8 +1,105 @@
 # -*- coding: utf-8 -*-
 # pages/utils.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import requests
 import streamlit as st
 import pandas as pd
 
+API_URL = "http://localhost:8000"
+
+# Última respuesta de cada consulta (endpoint, parámetros, token) con su ETag,
+# para revalidar con If-None-Match y reutilizar el cuerpo si el backend responde 304
+_RESPUESTAS_MAX = 64
+_respuestas = OrderedDict()
+_respuestas_lock = threading.Lock()
+
+# Vigencia de los datos cuyas tablas aún no tienen versión (o si /versions no responde)
+VIGENCIA_SIN_VERSION_SEG = 300
+
+def auth_headers(token=None):
+    """Encabezado Authorization con el token de la sesión (vacío si no hay sesión)."""
+    token = token or st.session_state.get('token')
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+def get_json(endpoint, params=None, token=None, timeout=30):
+    """
+    GET a la API que revalida con el ETag de la última respuesta: si los datos
+    no cambiaron el backend contesta 304 sin cuerpo y se reutiliza el JSON ya
+    descargado. Lanza requests.HTTPError igual que raise_for_status().
+    """
+    headers = auth_headers(token)
+    clave = (endpoint, tuple(sorted((params or {}).items())), headers.get("Authorization"))
+    with _respuestas_lock:
+        anterior = _respuestas.get(clave)
+    if anterior:
+        headers["If-None-Match"] = anterior[0]
+
+    response = requests.get(f"{API_URL}/{endpoint.lstrip('/')}", params=params, headers=headers, timeout=timeout)
+    if response.status_code == 304 and anterior:
+        with _respuestas_lock:
+            _respuestas.move_to_end(clave)
+        return anterior[1]
+    response.raise_for_status()
+    data = response.json()
+
+    etag = response.headers.get("ETag")
+    with _respuestas_lock:
+        if etag:
+            _respuestas[clave] = (etag, data)
+            _respuestas.move_to_end(clave)
+            while len(_respuestas) > _RESPUESTAS_MAX:
+                _respuestas.popitem(last=False)
+        else:
+            _respuestas.pop(clave, None)
+    return data
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _versiones_endpoints():
+    try:
+        response = requests.get(f"{API_URL}/versions", timeout=5)
+        response.raise_for_status()
+        return response.json()["endpoints"]
+    except (requests.exceptions.RequestException, KeyError, ValueError):
+        return None
+
+def version_datos(*endpoints):
+    """
+    Clave de caché con la versión de los datos de 'endpoints' según GET /versions.
+    Las funciones con st.cache_data la reciben como argumento y no necesitan
+    ttl: la clave cambia cuando el ETL carga una de sus tablas. Los endpoints
+    sin tablas versionadas (sucursales, periodos) cambian una vez al día, y
+    si una tabla aún no tiene versión se vuelve a consultar cada
+    VIGENCIA_SIN_VERSION_SEG segundos.
+    """
+    versiones = _versiones_endpoints()
+    sin_version = f"t{int(time.time() // VIGENCIA_SIN_VERSION_SEG)}"
+    claves = []
+    for endpoint in endpoints:
+        path = "/" + endpoint.lstrip("/")
+        if versiones is None:
+            claves.append(sin_version)
+        elif path not in versiones:
+            claves.append(date.today().isoformat())
+        else:
+            claves.append(versiones[path] or sin_version)
+    return "|".join(claves)
+
+def registrar_version_datos(cursor, tabla):
+    """
+    Incrementa la versión de 'tabla' en DATA_VERSION. Se llama en la misma
+    transacción de la carga, antes del commit: el backend la usa para los
+    ETags y la invalidación de cachés.
+    """
+    cursor.execute("""
+        INSERT INTO DATA_VERSION (table_name, version, loaded_at)
+        VALUES (%s, 1, NOW())
+        ON DUPLICATE KEY UPDATE version = version + 1, loaded_at = NOW()
+    """, (tabla,))
+
 def format_currency(value):
     return "${:,.0f}".format(value)
 
@@ -0,0 +1,64 @@
+/*
+ Índice de planificaciones de turnos (ASISTENCIA_MALLA).
+
+ Una fila por (sucursal, año, mes) con planificación guardada. 'version' se
+ incrementa en cada guardado y se usa como token de concurrencia optimista
+ en PATCH /guardar_malla y como ETag de GET /planificacion. 'filas' es la
+ cantidad de celdas guardadas del mes (0 = sin planificación).
+
+ Target Server Type    : MySQL
+ Target Server Version : 80041
+ File Encoding         : 65001
+*/
+
+SET NAMES utf8mb4;
+
+-- ----------------------------
+-- Table structure for ASISTENCIA_MALLA_INDICE
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `ASISTENCIA_MALLA_INDICE`  (
+  `sucursal` varchar(255) NOT NULL,
+  `year` smallint NOT NULL,
+  `month` tinyint NOT NULL,
+  `version` int NOT NULL DEFAULT 0,
+  `filas` int NOT NULL DEFAULT 0,
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`sucursal`, `year`, `month`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Quitar celdas duplicadas antes de la clave única
+-- (el POST /guardar_malla anterior borraba e insertaba sin clave, así que
+-- puede haber varias filas por (sucursal, fecha, rut); se conserva la más
+-- reciente, la de mayor id)
+-- ----------------------------
+-- Revisión previa: celdas duplicadas y filas que se eliminarán
+SELECT COUNT(*) AS celdas_duplicadas, SUM(n - 1) AS filas_a_eliminar
+FROM (
+  SELECT COUNT(*) AS n
+  FROM `ASISTENCIA_MALLA`
+  GROUP BY `sucursal`, `fecha`, `rut`
+  HAVING COUNT(*) > 1
+) AS duplicadas;
+
+DELETE anterior
+FROM `ASISTENCIA_MALLA` AS anterior
+JOIN `ASISTENCIA_MALLA` AS posterior
+  ON posterior.`sucursal` = anterior.`sucursal`
+ AND posterior.`fecha` = anterior.`fecha`
+ AND posterior.`rut` = anterior.`rut`
+ AND posterior.`id` > anterior.`id`;
+
+-- ----------------------------
+-- Clave única para upserts celda a celda en ASISTENCIA_MALLA
+-- (también sirve a las consultas por sucursal y rango de fechas)
+-- ----------------------------
+ALTER TABLE `ASISTENCIA_MALLA` ADD UNIQUE KEY `uk_malla_sucursal_fecha_rut` (`sucursal`, `fecha`, `rut`);
+
+-- ----------------------------
+-- Poblar el índice con las planificaciones ya existentes
+-- ----------------------------
+INSERT IGNORE INTO `ASISTENCIA_MALLA_INDICE` (`sucursal`, `year`, `month`, `version`, `filas`, `updated_at`)
+SELECT sucursal, YEAR(fecha), MONTH(fecha), 1, COUNT(*), NOW()
+FROM `ASISTENCIA_MALLA`
+GROUP BY sucursal, YEAR(fecha), MONTH(fecha);
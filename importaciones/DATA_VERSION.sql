@@ -0,0 +1,23 @@
+/*
+ Versiones de datos por tabla.
+
+ Cada carga del ETL (frontend/pages/cargas.py, cargas_indicadores.py)
+ incrementa la versión de la tabla que reemplaza, en la misma transacción
+ que los datos. El backend la usa para los ETags y para invalidar cachés.
+
+ Target Server Type    : MySQL
+ Target Server Version : 80041
+ File Encoding         : 65001
+*/
+
+SET NAMES utf8mb4;
+
+-- ----------------------------
+-- Table structure for DATA_VERSION
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `DATA_VERSION`  (
+  `table_name` varchar(64) NOT NULL,
+  `version` bigint NOT NULL DEFAULT 1,
+  `loaded_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`table_name`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
@@ -0,0 +1,140 @@
+/*
+ Resumen mensual de los indicadores económicos.
+
+ Una fila por (indicador, año, mes) con el último valor del mes y el
+ promedio, mínimo y máximo de sus días. Las páginas de carga de
+ indicadores (pages/cargas.py, pages/cargas_indicadores.py) recalculan los
+ meses cargados con backend/resumen_indicadores.py; los endpoints de
+ indicadores (/uf, /dolar, /euro, /imacec, /tasa_desempleo, /indicadores)
+ leen las filas por clave primaria.
+
+ Target Server Type    : MySQL
+ Target Server Version : 80041
+ File Encoding         : 65001
+*/
+
+SET NAMES utf8mb4;
+
+-- ----------------------------
+-- Table structure for DM_INDICADORES_MES
+-- ----------------------------
+CREATE TABLE IF NOT EXISTS `DM_INDICADORES_MES`  (
+  `indicador` varchar(32) NOT NULL,
+  `year` smallint NOT NULL,
+  `month` tinyint NOT NULL,
+  `fecha_cierre` date NOT NULL,
+  `valor_cierre` decimal(18, 4) NULL DEFAULT NULL,
+  `promedio` decimal(18, 4) NULL DEFAULT NULL,
+  `minimo` decimal(18, 4) NULL DEFAULT NULL,
+  `maximo` decimal(18, 4) NULL DEFAULT NULL,
+  `observaciones` int NOT NULL DEFAULT 0,
+  `updated_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`indicador`, `year`, `month`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Poblar el resumen con la historia ya cargada
+-- ----------------------------
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'dolar', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_dolar`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'euro', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_euro`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'imacec', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_imacec`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'ipc', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_ipc`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'tasa_desempleo', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_tasa_desempleo`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'tpm', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_tpm`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'uf', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_uf`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;
+
+INSERT IGNORE INTO `DM_INDICADORES_MES`
+  (`indicador`, `year`, `month`, `fecha_cierre`, `valor_cierre`, `promedio`, `minimo`, `maximo`, `observaciones`, `updated_at`)
+SELECT 'utm', year, month, fecha, valor, promedio, minimo, maximo, observaciones, NOW()
+FROM (
+  SELECT YEAR(fecha) AS year, MONTH(fecha) AS month, fecha, valor,
+         AVG(valor) OVER mes AS promedio, MIN(valor) OVER mes AS minimo, MAX(valor) OVER mes AS maximo,
+         COUNT(*) OVER mes AS observaciones,
+         ROW_NUMBER() OVER (PARTITION BY YEAR(fecha), MONTH(fecha) ORDER BY fecha DESC) AS orden
+  FROM `DM_utm`
+  WINDOW mes AS (PARTITION BY YEAR(fecha), MONTH(fecha))
+) AS dias
+WHERE orden = 1;